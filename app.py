@@ -1,26 +1,108 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import datetime
+import os
 import warnings
 import pandas as pd
 from paths import Path
-from pandas_profiling import ProfileReport
-from streamlit_pandas_profiling import st_profile_report
-from src.models.trainer import Trainer
-from src.visualization.visualization import *
-from src.models.predict_model import predict
-from catboost import CatBoostRegressor
-from xgboost import XGBRegressor
-from lightgbm import LGBMRegressor
+from src.data.stage_cache import file_fingerprint
 
 warnings.filterwarnings("ignore")
+# The libraries each tab needs (the boosters, SHAP, Optuna, Plotly, pandas-profiling) are imported inside the tab,
+# so a page only pays for the imports it uses.
+
+
+def file_signature(path):
+    """
+    Return the modification time and size of a file; cached functions take it as an argument
+    so that their results are recomputed when the file changes.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@st.cache_data(show_spinner=False)
+def load_csv(path, signature):
+    """
+    Read a CSV file once per file version and share it between reruns and sessions.
+    """
+    return pd.read_csv(path)
+
+
+@st.cache_data(show_spinner=False, persist="disk")
+def eda_summary(path, signature, version):
+    """
+    Compute the one-pass EDA summary of a CSV file (see profile_frame) once per file version.
+    The summary is persisted on disk, so the Visualization tab does not read the file again after a restart;
+    version is the PROFILE_VERSION of the summary, so a change to profile_frame does not serve stale summaries.
+    """
+    from src.visualization.visualization import profile_frame
+    return profile_frame(load_csv(path, signature), Path.target)
+
+
+@st.cache_data(show_spinner=False)
+def data_hash(path, signature):
+    """
+    Hash the content of a file once per file version.
+    """
+    return file_fingerprint(path)
+
+
+def profile_report_html(_df, variables, key):
+    """
+    Return the HTML of the profile report of a dataframe.
+    The rendered report is stored on disk under key and reused until the data file changes.
+
+    Parameters:
+        _df (pandas.DataFrame): The dataframe to be profiled.
+        variables (dict): The column descriptions shown in the report.
+        key (str): The cache key of the report, built from the data hash and the column range.
+
+    Returns:
+        html (str): The rendered report.
+    """
+    report_path = os.path.join(Path.profile_cache_dir, f'{key}.html')
+    if os.path.exists(report_path):
+        with open(report_path, encoding='utf-8') as f:
+            return f.read()
+    from pandas_profiling import ProfileReport
+    profile = ProfileReport(_df, title="House Price Prediction", variables=variables, dataset={
+        "description": "With 81 explanatory variables describing (almost) every aspect of residential homes in Ames, Iowa, this competition challenges you to predict the final price of each home.",
+        "url": "https://www.kaggle.com/c/house-prices-advanced-regression-techniques",
+    }, )
+    html = profile.to_html()
+    os.makedirs(Path.profile_cache_dir, exist_ok=True)
+    temp_path = f'{report_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(temp_path, report_path)
+    return html
+
+
+@st.cache_resource(show_spinner=False)
+def cached_profile_report_html(_df, variables, key):
+    """
+    Keep the rendered profile reports in memory as well, keyed by the data hash and the column range.
+    """
+    return profile_report_html(_df, variables, key)
+
+
+@st.cache_data(show_spinner=False)
+def cached_predict(option, model_signature, test_signature):
+    """
+    Predict the external data once per model, model file version and external data file version.
+    """
+    from src.models.predict_model import predict
+    return predict(option)
+
 st.set_page_config(page_title="End_To_End_Regression",
                    page_icon="chart_with_upwards_trend", layout="wide")
 st.markdown("<h1 style='text-align:center;'>House Price Prediction</h1>", unsafe_allow_html=True)
 st.write(datetime.datetime.now(tz=None))
-tabs = ["Data Analysis", "Visualization", "Train", "Predict", "About"]
+tabs = ["Data Analysis", "Visualization", "Train", "Predict", "Traces", "About"]
 page = st.sidebar.radio("Tabs", tabs)
 if page == "Data Analysis":
-    raw_df = pd.read_csv(Path.train_path)
+    raw_df = load_csv(Path.train_path, file_signature(Path.train_path))
     option = st.selectbox(
         'While fetching all columns, Streamlit crashes due to a large amount of data. Therefore, which range of columns would you like to retrieve?',
         ('0-20', '20-40', '40-60', '60-81'))
@@ -133,22 +215,26 @@ if page == "Data Analysis":
             }
         }
     df[Path.target] = raw_df[Path.target]
-    profile = ProfileReport(df, title="House Price Prediction", variables=variables, dataset={
-        "description": "With 81 explanatory variables describing (almost) every aspect of residential homes in Ames, Iowa, this competition challenges you to predict the final price of each home.",
-        "url": "https://www.kaggle.com/c/house-prices-advanced-regression-techniques",
-    }, )
+    key = f'{data_hash(Path.train_path, file_signature(Path.train_path))[:16]}_{option}'
+    with st.spinner("The profile report is being generated, please wait..."):
+        html = cached_profile_report_html(df, variables, key)
     st.title("Data Overview")
     st.write(df)
-    st_profile_report(profile)
+    components.html(html, height=1000, scrolling=True)
 elif page == "Train":
+    from src.models.trainer import Trainer
+    from src.visualization.visualization import line_chart
     option = st.radio(
         'What model would you like to use for training?',
         ('XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'))
     if option == 'XGBRegressor':
+        from xgboost import XGBRegressor
         model = XGBRegressor(random_state=33)
     elif option == 'LGBMRegressor':
+        from lightgbm import LGBMRegressor
         model = LGBMRegressor(random_state=33)
     elif option == 'CatBoostRegressor':
+        from catboost import CatBoostRegressor
         model = CatBoostRegressor(random_seed=33)
     trainer = Trainer(Path.train_path, model, Path.models_path, Path.fold_number, Path.hyperparameter_trial_number)
 
@@ -167,20 +253,42 @@ elif page == "Train":
             chart_data = pd.DataFrame({'real': i['real'], 'pred': i['pred']})
             line_chart(chart_data, streamlit=True)
 elif page == "Predict":
+    from src.models.predict_model import predict_ensemble
+    from src.models.serialization import model_path
     option = st.radio(
         'What model would you like to use for making predictions?',
         ('XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'))
-    pred = predict(option)
+    ensemble = st.checkbox('Average the predictions of all fold models')
+    if ensemble:
+        pred, costs = predict_ensemble(option)
+        st.write(pd.DataFrame(costs))
+    else:
+        pred = cached_predict(option, file_signature(model_path(os.path.join(Path.models_path, option, 'best_fold'))),
+                              file_signature(Path.test_path))
     with st.spinner("Predict is in progress, please wait..."):
         st.line_chart(pd.DataFrame(pred, columns=['Prediction']))
 
 elif page == "Visualization":
-    df = pd.read_csv(Path.train_path)
+    from src.visualization.visualization import missing_control_plot, missing_count_plot, corr_plot, PROFILE_VERSION
+    signature = file_signature(Path.train_path)
     with st.spinner("Visuals are being generated, please wait..."):
-        missing_df = missing_control_plot(df, streamlit=True)
-        corr_plot(df, Path.target, streamlit=True)
-        missing_count_plot(df, missing_df, variable_type='num', streamlit=True)
-        missing_count_plot(df, missing_df, variable_type='cat', streamlit=True)
+        summary = eda_summary(Path.train_path, signature, PROFILE_VERSION)
+        key = data_hash(Path.train_path, signature)[:16]
+        missing_df = missing_control_plot(None, streamlit=True, summary=summary, cache_key=key)
+        corr_plot(None, Path.target, streamlit=True, summary=summary, cache_key=key)
+        missing_count_plot(None, missing_df, variable_type='num', streamlit=True, summary=summary, cache_key=key)
+        missing_count_plot(None, missing_df, variable_type='cat', streamlit=True, summary=summary, cache_key=key)
+elif page == "Traces":
+    from src.monitoring.tracing import recent_spans
+    limit = st.selectbox('How many recent spans would you like to see?', (50, 200, 1000))
+    spans = recent_spans(limit)
+    if not spans:
+        st.write("No spans have been recorded yet." if Path.trace_enabled else "Tracing is disabled in paths.py.")
+    else:
+        traces = pd.DataFrame(spans).iloc[::-1]
+        st.title("Recent Stage Timings")
+        st.bar_chart(traces.groupby('name')['wall_seconds'].mean().sort_values(ascending=False))
+        st.dataframe(traces)
 elif page == "About":
     st.header("Contact Info")
     st.markdown("""**mahmutyvz324@gmail.com**""")
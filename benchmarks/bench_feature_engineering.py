@@ -0,0 +1,75 @@
+"""
+Benchmark of feature_engineering on data/raw/train.csv replicated to larger row counts.
+
+Run from the project root:
+
+    python -m benchmarks.bench_feature_engineering --rows 1000000 10000000
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from src.data.preprocess_data import missing_value_fill
+from src.features.feature_engineering import feature_engineering
+
+TRAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw', 'train.csv')
+
+
+def replicate(df, rows):
+    """
+    Replicate a dataframe by repeating its rows until it has the requested number of rows.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to be replicated.
+    rows : int
+        The number of rows of the returned dataframe.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The replicated dataframe with a fresh RangeIndex.
+    """
+    return df.iloc[np.resize(np.arange(len(df)), rows)].reset_index(drop=True)
+
+
+def run(rows_list, repeat):
+    """
+    Time feature_engineering for each row count and print the best time and the throughput.
+
+    Parameters
+    ----------
+    rows_list : list
+        The row counts to benchmark.
+    repeat : int
+        The number of timed runs per row count; the best one is reported.
+
+    Returns
+    -------
+    results : list
+        A list of dictionaries with the row count, the best time in seconds and the rows per second.
+    """
+    base = missing_value_fill(pd.read_csv(TRAIN_PATH))
+    results = []
+    for rows in rows_list:
+        df = replicate(base, rows)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            feature_engineering(df)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append({'rows': rows, 'seconds': best, 'rows_per_second': rows / best})
+        print(f'feature_engineering rows={rows:>10} best={best:.3f}s rows/s={rows / best:,.0f}')
+        del df
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
@@ -0,0 +1,290 @@
+"""
+Benchmark suite of the training and scoring hot paths on synthetic Ames-shaped data.
+
+The data is generated by resampling the rows of data/raw/train.csv and perturbing their continuous columns.
+Every case is timed several times and run once more under tracemalloc for its peak memory. The results are
+written to JSON, and --compare flags the cases that are slower or use more memory than a saved baseline.
+
+Run from the project root:
+
+    python -m benchmarks.bench_pipeline --rows 10000 100000 1000000 10000000 --output benchmarks/results.json
+    python -m benchmarks.bench_pipeline --rows 10000 100000 --compare benchmarks/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from optuna.trial import FixedTrial
+from sklearn.model_selection import KFold, train_test_split
+from xgboost import XGBRegressor
+from src.data.dataset_source import read_dataset, _column_types
+from src.data.preprocess_data import MissingValueImputer, missing_value_fill, pipeline_build, test_pipeline_build
+from src.features.feature_engineering import feature_engineering
+from src.models.compiled_predictor import compile_model
+from src.models.hyperparameter_optimize import _objective
+from src.models.trainer import _train_fold
+from paths import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAIN_PATH = os.path.join(ROOT, 'data', 'raw', 'train.csv')
+# The parameters of the benchmarked Optuna trial and fold; they lie on the grid of the search space.
+TRIAL_PARAMS = {'learning_rate': 0.0905, 'n_estimators': 300, 'max_bin': 256, 'subsample': 0.8,
+                'colsample_bylevel': 0.8, 'max_depth': 6}
+BATCH_SIZES = [1, 100, 10000]
+
+
+def synthetic_dataset(base, rows, seed=33, noise=0.05):
+    """
+    Generate an Ames-shaped dataset by resampling the rows of a base dataset with replacement
+    and perturbing its continuous (float32) columns and the target with multiplicative noise.
+
+    Parameters
+    ----------
+    base : pandas.DataFrame
+        The base dataset, read with the declared schema.
+    rows : int
+        The number of rows of the generated dataset.
+    seed : int, optional
+        The random seed (default is 33).
+    noise : float, optional
+        The standard deviation of the multiplicative noise (default is 0.05).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The generated dataset with fresh Ids.
+    """
+    rng = np.random.RandomState(seed)
+    df = base.iloc[rng.randint(0, len(base), rows)].reset_index(drop=True)
+    for col in df.columns:
+        if col == Path.target or df[col].dtype == np.float32:
+            values = df[col].to_numpy()
+            perturbed = np.maximum(values * rng.normal(1, noise, rows), 0).astype(values.dtype)
+            df[col] = np.where(np.isnan(values), values, perturbed)
+    df['Id'] = np.arange(1, rows + 1, dtype=np.int32)
+    return df
+
+
+def _timings(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(case, rows, func, repeat, memory=True):
+    """
+    Time a case and measure its peak memory.
+
+    Parameters
+    ----------
+    case : str
+        The name of the case.
+    rows : int
+        The number of rows of the dataset the case runs on.
+    func : callable
+        The benchmarked function, called without arguments.
+    repeat : int
+        The number of timed runs.
+    memory : bool, optional
+        If True, the function is run once more under tracemalloc for its peak memory (default is True).
+
+    Returns
+    -------
+    result : dict
+        The case, the row count, the best, median and 99th percentile times in seconds
+        and the peak traced memory in bytes.
+    """
+    timings = _timings(func, repeat)
+    result = {'case': case, 'rows': rows,
+              'seconds': float(np.min(timings)),
+              'median_seconds': float(np.median(timings)),
+              'p99_seconds': float(np.percentile(timings, 99)),
+              'peak_memory_bytes': _peak_memory(func) if memory else None}
+    print(f"{case:<28} rows={rows:>10} best={result['seconds']:.4f}s p99={result['p99_seconds']:.4f}s "
+          f"peak={(result['peak_memory_bytes'] or 0) / 2 ** 20:,.1f} MiB")
+    return result
+
+
+def run(rows_list, repeat, max_model_rows, latency_repeat, cases=None):
+    """
+    Run the benchmark cases for each row count.
+
+    Parameters
+    ----------
+    rows_list : list
+        The row counts of the synthetic datasets.
+    repeat : int
+        The number of timed runs of the data-preparation cases.
+    max_model_rows : int
+        The largest number of rows the Optuna trial, the training fold and the prediction model use.
+    latency_repeat : int
+        The number of timed runs of the prediction cases.
+    cases : list, optional
+        The names (or name prefixes) of the cases to run (default is None, all cases).
+
+    Returns
+    -------
+    results : list
+        One result dictionary per case and row count (see measure).
+    """
+    selected = lambda case: cases is None or any(case.startswith(name) or name.startswith(case) for name in cases)
+    base = read_dataset(TRAIN_PATH)
+    col_dict = _column_types(base.drop('Id', axis=1), Path.target)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in rows_list:
+            df = synthetic_dataset(base, rows)
+            X, y = df.drop(Path.target, axis=1), df[Path.target]
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=33)
+            # The cases bind their data as default arguments, so each closure keeps the data of its own row count.
+            build = lambda X_train=X_train, X_test=X_test: pipeline_build(X_train, X_test, col_dict['missing_num_col'],
+                                                                          col_dict['ordinal_col'], col_dict['cat_col'])
+            if selected('missing_value_fill'):
+                imputer = MissingValueImputer().fit(X_train)
+                results.append(measure('missing_value_fill', rows,
+                                       lambda X_train=X_train, imputer=imputer: missing_value_fill(X_train, imputer),
+                                       repeat))
+            if selected('feature_engineering'):
+                filled = missing_value_fill(X_train)
+                results.append(measure('feature_engineering', rows,
+                                       lambda filled=filled: feature_engineering(filled), repeat))
+            if selected('pipeline_build'):
+                results.append(measure('pipeline_build', rows, build, repeat))
+            model_cases = any(selected(case) for case in ('optuna_trial', 'train_fold', 'predict'))
+            if not model_cases and not selected('test_pipeline_build'):
+                continue
+            _, _, preprocessor = build()
+            if selected('test_pipeline_build'):
+                preprocessor_path = os.path.join(directory, 'preprocessor.pkl')
+                preprocessor.save(preprocessor_path)
+                results.append(measure('test_pipeline_build', rows,
+                                       lambda X_test=X_test, preprocessor_path=preprocessor_path:
+                                       test_pipeline_build(X_test, preprocessor_path), repeat))
+            if not model_cases:
+                continue
+            model_rows = min(len(X_train), max_model_rows)
+            X_model = preprocessor.transform(X_train.iloc[:model_rows])
+            y_model = y_train.iloc[:model_rows]
+            if selected('optuna_trial'):
+                kf = KFold(n_splits=Path.fold_number, shuffle=True, random_state=33)
+                results.append(measure('optuna_trial', model_rows,
+                                       lambda X_model=X_model, y_model=y_model, kf=kf:
+                                       _objective(FixedTrial(TRIAL_PARAMS), X_model, y_model,
+                                                  XGBRegressor(random_state=33), kf), 1))
+            split = int(model_rows * 0.8)
+            model = XGBRegressor(random_state=33, **TRIAL_PARAMS)
+            fold = lambda model=model, X_model=X_model, y_model=y_model, split=split: _train_fold(
+                model, {}, X_model.iloc[:split], y_model.iloc[:split], X_model.iloc[split:], y_model.iloc[split:], 0,
+                os.path.join(directory, 'fold'))
+            if selected('train_fold'):
+                results.append(measure('train_fold', model_rows, fold, 1, memory=False))
+            else:
+                fold()
+            compiled = compile_model(model)
+            for batch_size in BATCH_SIZES:
+                batch = X_test.iloc[:batch_size]
+                if selected('predict_batch'):
+                    results.append(measure(f'predict_batch_{batch_size}', rows,
+                                           lambda model=model, preprocessor=preprocessor, batch=batch:
+                                           model.predict(preprocessor.transform(batch)), latency_repeat))
+                if selected('predict_compiled_batch'):
+                    results.append(measure(f'predict_compiled_batch_{batch_size}', rows,
+                                           lambda compiled=compiled, preprocessor=preprocessor, batch=batch:
+                                           compiled.predict(preprocessor.transform(batch)), latency_repeat))
+    return results
+
+
+def environment():
+    """
+    Describe the machine and the code version the benchmarks ran on.
+
+    Returns
+    -------
+    environment : dict
+        The timestamp, git commit, Python version, platform and CPU count.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit or None,
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """
+    Flag the cases that regressed against a baseline.
+
+    Parameters
+    ----------
+    results : list
+        The current results.
+    baseline : list
+        The baseline results.
+    threshold : float
+        The relative increase of the best time or of the peak memory above which a case is flagged.
+
+    Returns
+    -------
+    regressions : list
+        One dictionary per regressed metric with the case, the row count, the metric, the baseline
+        and current values and their ratio.
+    """
+    reference = {(result['case'], result['rows']): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = reference.get((result['case'], result['rows']))
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_memory_bytes'):
+            if not result.get(metric) or not previous.get(metric):
+                continue
+            ratio = result[metric] / previous[metric]
+            if ratio > 1 + threshold:
+                regressions.append({'case': result['case'], 'rows': result['rows'], 'metric': metric,
+                                    'baseline': previous[metric], 'current': result[metric], 'ratio': ratio})
+                print(f"REGRESSION {result['case']} rows={result['rows']} {metric}: "
+                      f"{previous[metric]:.4g} -> {result[metric]:.4g} ({ratio:.2f}x)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of the data-preparation cases.')
+    parser.add_argument('--latency-repeat', type=int, default=100, help='Timed runs of the prediction cases.')
+    parser.add_argument('--max-model-rows', type=int, default=1_000_000,
+                        help='Largest number of rows the model cases train on.')
+    parser.add_argument('--cases', nargs='+', default=None, help='Cases to run, by name or name prefix.')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results.json'))
+    parser.add_argument('--compare', default=None, help='Baseline results file to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown or memory increase flagged as a regression.')
+    args = parser.parse_args()
+    results = run(args.rows, args.repeat, args.max_model_rows, args.latency_repeat, args.cases)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        sys.exit(1 if regressions else 0)
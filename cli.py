@@ -0,0 +1,245 @@
+import argparse
+from paths import Path
+from src.monitoring.import_time import ENTRY_MODULES
+
+
+def score(args):
+    """
+    Score an external dataset chunk by chunk and write the predictions to a CSV file.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (model, input, output, chunksize, ensemble).
+    """
+    from src.models.predict_model import predict_batches
+    n_rows = predict_batches(args.model, args.input, args.output, chunksize=args.chunksize, ensemble=args.ensemble)
+    print(f'{n_rows} predictions written to {args.output}')
+
+
+def serve(args):
+    """
+    Run the HTTP scoring service with request micro-batching.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (model, host, port, max_batch_size, max_wait_ms, compiled).
+    """
+    import uvicorn
+    from src.serving.api import create_app
+    app = create_app(args.model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                     compiled=args.compiled)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+def build_model(name):
+    """
+    Build an untrained regression model from its class name.
+
+    Parameters
+    ----------
+    name : str
+        The name of the model ('XGBRegressor', 'LGBMRegressor' or 'CatBoostRegressor').
+
+    Returns
+    -------
+    model : estimator object
+        The regression model.
+    """
+    if name == 'XGBRegressor':
+        from xgboost import XGBRegressor
+        return XGBRegressor(random_state=33)
+    elif name == 'LGBMRegressor':
+        from lightgbm import LGBMRegressor
+        return LGBMRegressor(random_state=33)
+    elif name == 'CatBoostRegressor':
+        from catboost import CatBoostRegressor
+        return CatBoostRegressor(random_seed=33)
+    raise ValueError(f'Unknown model {name}.')
+
+
+def tune(args):
+    """
+    Run, resume or join an Optuna study stored in a shared journal or SQLite file.
+    The same command can be started on several machines that share the storage directory.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (model, storage, study_name, trials, n_jobs).
+    """
+    from sklearn.model_selection import KFold
+    from src.data.dataset_source import final_data_build
+    from src.models.hyperparameter_optimize import optuna_optimize
+    X_train, y_train, _, _ = final_data_build(Path.train_path)
+    kf = KFold(n_splits=Path.fold_number, shuffle=True, random_state=33)
+    optuna_optimize(X_train, y_train, build_model(args.model), kf, args.trials,
+                    storage_path=args.storage, n_jobs=args.n_jobs, study_name=args.study_name)
+
+
+def train(args):
+    """
+    Train several models on one prepared dataset and write their combined leaderboard.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (models, input, trials, folds, n_jobs, leaderboard).
+    """
+    from src.models.trainer import train_models
+    models = [build_model(name) for name in dict.fromkeys(args.models)]
+    train_models(models, train_path=args.input, fold_number=args.folds, hyperparameter_trial=args.trials,
+                 n_jobs=args.n_jobs, leaderboard_path=args.leaderboard)
+    print(f'Leaderboard written to {args.leaderboard}.csv and {args.leaderboard}.json')
+
+
+def update(args):
+    """
+    Update the best model of a model type with newly arrived rows by continuing to boost it.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (model, input, rounds, holdout, force).
+    """
+    from src.models.trainer import Trainer
+    trainer = Trainer(Path.train_path, build_model(args.model), Path.models_path, Path.fold_number,
+                      Path.hyperparameter_trial_number)
+    trainer.update(args.input, rounds=args.rounds, holdout=args.holdout, force=args.force)
+
+
+def convert(args):
+    """
+    Convert a dataset between CSV, XLSX, Parquet, Feather and Arrow IPC; the formats are taken from the extensions.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (input, output, columns).
+    """
+    from src.data.dataset_source import read_dataset, write_dataset
+    df = read_dataset(args.input, columns=args.columns)
+    write_dataset(df, args.output)
+    print(f'{len(df)} rows written to {args.output}')
+
+
+def imports(args):
+    """
+    Report the cold import time of the entry modules and the packages they spend it in.
+    Each module is imported in a fresh interpreter, so the times are those of a starting worker.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments (modules, top, forbid).
+    """
+    from src.monitoring.import_time import import_report
+    failed = False
+    for module in args.modules:
+        report = import_report(module, top=args.top)
+        print(f"{report['module']}: {report['seconds']:.3f}s, {report['modules']} modules")
+        for package, seconds in report['packages']:
+            print(f'    {package:<30} {seconds:.3f}s')
+        forbidden = sorted(set(args.forbid or []) & set(report['imported_packages']))
+        if forbidden:
+            print(f"    imports {', '.join(forbidden)}")
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+def build_parser():
+    """
+    Build the command line parser of the project.
+
+    Returns
+    -------
+    parser : argparse.ArgumentParser
+        The parser with one sub-command per headless task.
+    """
+    parser = argparse.ArgumentParser(description='House price prediction command line tools.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    score_parser = subparsers.add_parser('score', help='Stream an external dataset through the best model.')
+    score_parser.add_argument('--model', default='XGBRegressor',
+                              choices=['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+    score_parser.add_argument('--input', default=Path.test_path, help='File to be scored.')
+    score_parser.add_argument('--output', required=True, help='CSV file the predictions are written to.')
+    score_parser.add_argument('--chunksize', type=int, default=Path.predict_chunksize,
+                              help='Number of rows scored at a time.')
+    score_parser.add_argument('--ensemble', default=None, choices=['uniform', 'inverse_rmse'],
+                              help='Score with all fold models of the last training run, combined with this weighting.')
+    score_parser.set_defaults(func=score)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the HTTP scoring service.')
+    serve_parser.add_argument('--model', default=Path.serving_model,
+                              choices=['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--max-batch-size', type=int, default=Path.serving_max_batch_size,
+                              help='Maximum number of rows scored in one micro-batch.')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=Path.serving_max_wait_ms,
+                              help='Maximum time a request waits for its micro-batch to fill.')
+    serve_parser.add_argument('--no-compiled', dest='compiled', action='store_false', default=Path.serving_compiled,
+                              help='Score with the library model instead of the compiled tree arrays.')
+    serve_parser.set_defaults(func=serve)
+
+    tune_parser = subparsers.add_parser('tune', help='Run or join a persistent hyperparameter search.')
+    tune_parser.add_argument('--model', default='XGBRegressor',
+                             choices=['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+    tune_parser.add_argument('--storage', required=True,
+                             help='Journal file (or .db SQLite file) holding the study, on a shared directory for several machines.')
+    tune_parser.add_argument('--study-name', default=None,
+                             help='Name of a study shared by several runs or machines, '
+                                  'regression_<model>_<fingerprint of the data and folds> by default.')
+    tune_parser.add_argument('--trials', type=int, default=Path.hyperparameter_trial_number,
+                             help='Total number of completed trials of the study.')
+    tune_parser.add_argument('--n-jobs', type=int, default=-1, help='Number of worker processes on this machine.')
+    tune_parser.set_defaults(func=tune)
+
+    train_parser = subparsers.add_parser('train', help='Train several models on one prepared dataset.')
+    train_parser.add_argument('--models', nargs='+', default=['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'],
+                              choices=['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+    train_parser.add_argument('--input', default=Path.train_path, help='Training dataset with the target column.')
+    train_parser.add_argument('--trials', type=int, default=Path.hyperparameter_trial_number,
+                              help='Number of Optuna trials per model.')
+    train_parser.add_argument('--folds', type=int, default=Path.fold_number, help='Number of cross-validation folds.')
+    train_parser.add_argument('--n-jobs', type=int, default=-1,
+                              help='Number of models trained at the same time; -1 trains all of them at once.')
+    train_parser.add_argument('--leaderboard', default=Path.leaderboard_path,
+                              help='File path without extension the leaderboard is written to (.csv and .json).')
+    train_parser.set_defaults(func=train)
+
+    update_parser = subparsers.add_parser('update', help='Continue boosting the best model on newly arrived rows.')
+    update_parser.add_argument('--model', default='XGBRegressor',
+                               choices=['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+    update_parser.add_argument('--input', required=True, help='File with the new rows and the target column.')
+    update_parser.add_argument('--rounds', type=int, default=Path.incremental_rounds,
+                               help='Number of boosting rounds added to the best model.')
+    update_parser.add_argument('--holdout', type=float, default=Path.incremental_holdout,
+                               help='Share of the new rows used to check the updated model; 0 skips the check.')
+    update_parser.add_argument('--force', action='store_true',
+                               help='Replace the best model even if the updated model scores worse on the holdout.')
+    update_parser.set_defaults(func=update)
+
+    convert_parser = subparsers.add_parser('convert', help='Convert a dataset to another file format.')
+    convert_parser.add_argument('input', help='File to be read.')
+    convert_parser.add_argument('output', help='File to be written, e.g. data/raw/train.parquet.')
+    convert_parser.add_argument('--columns', nargs='+', default=None, help='Columns to be kept.')
+    convert_parser.set_defaults(func=convert)
+
+    imports_parser = subparsers.add_parser('imports', help='Report the import time of the entry modules.')
+    imports_parser.add_argument('modules', nargs='*', default=ENTRY_MODULES,
+                                help='Modules to be imported, e.g. src.models.predict_model.')
+    imports_parser.add_argument('--top', type=int, default=10, help='Number of slowest packages shown per module.')
+    imports_parser.add_argument('--forbid', nargs='+', default=None,
+                                help='Packages the modules must not import, e.g. shap optuna plotly; exits with 1 if they do.')
+    imports_parser.set_defaults(func=imports)
+    return parser
+
+
+if __name__ == '__main__':
+    arguments = build_parser().parse_args()
+    arguments.func(arguments)
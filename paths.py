@@ -5,29 +5,72 @@ class Path:
     target (str): The target column name for the house price prediction.
     root (str): The root directory path for the project.
     train_path (str): The file path for the raw training dataset.
-    cleaned_train_path (str): The file path for the preprocessed and cleaned training dataset.
+    cleaned_train_path (str): The file path for the preprocessed and cleaned training dataset (Parquet, Feather, Arrow IPC or CSV by extension).
     test_path (str): The file path for the raw test dataset.
-    cleaned_test_path (str): The file path for the preprocessed and cleaned test dataset.
-    colencoder_path (str): The file path for the column encoder used for preprocessing categorical columns.
-    missing_num_cols_path (str): The file path for the numerical encoder used for handling missing numerical columns.
-    ordinal_cols_path (str): The file path for the ordinal encoder used for preprocessing ordinal columns.
-    cat_cols_path (str): The file path for the one-hot encoder used for preprocessing categorical columns.
-    shap_cols_path (str): The file path for the list of columns used for SHAP (SHapley Additive exPlanations) calculations.
+    preprocessor_path (str): The file path for the fitted preprocessing artifact (column lists, medians, encoders and SHAP columns).
+    stage_cache_dir (str): The directory where the outputs of the data-preparation stages are cached.
+    profile_cache_dir (str): The directory where the rendered profile reports of the app are cached.
+    figure_cache_dir (str): The directory where the rendered EDA figures are cached as Plotly JSON.
+    sparse_design (bool): If True, the design matrices are float32 CSR matrices with a sparse one-hot block.
+    shap_fast (bool): If True, SHAP feature selection uses a smaller probe model and a row sample of the holdout; it may select different columns than the full mode.
+    shap_sample_size (int): The number of holdout rows SHAP contributions are computed on in fast mode.
+    shap_probe_params (dict): The XGBoost parameters of the probe model used in fast mode.
+    shap_n_jobs (int): The number of row chunks SHAP contributions are computed on in parallel processes; the booster threads are divided between them.
     models_path (str): The directory path where models are saved.
     fold_number (int): The number of folds used in cross-validation during hyperparameter tuning.
     hyperparameter_trial_number (int): The number of hyperparameter trials to be performed during hyperparameter tuning.
+    train_n_jobs (int): The number of cross-validation folds trained in parallel; -1 uses all cores.
+    leaderboard_path (str): The file path without extension the leaderboard of a multi-model training run is written to (.csv and .json).
+    optuna_storage_path (str): The journal (or .db SQLite) file the Optuna studies are stored in. None keeps them in memory.
+    optuna_n_jobs (int): The number of worker processes running Optuna trials when a storage path is set; -1 uses all cores.
+    optuna_pruner (str): The pruner stopping unpromising trials after a fold ('median', 'hyperband' or None). It has no effect with a single trial.
+    optuna_early_stopping_rounds (int): The number of rounds without validation improvement after which a trial's fit stops.
+    incremental_rounds (int): The number of boosting rounds added to the best model by an incremental update.
+    incremental_max_weight (float): The largest weight newly arrived rows get when the preprocessing medians are updated.
+    incremental_holdout (float): The share of newly arrived rows kept to compare the updated model with the current one.
+    trace_enabled (bool): Whether the pipeline stages are traced (wall time, CPU time, RSS change and peak, rows and columns).
+    trace_path (str): The JSON-lines file path the stage spans are written after; each process appends to <stem>.<pid>.jsonl.
+    predict_chunksize (int): The number of rows read, preprocessed and scored at a time in streaming batch scoring.
+    model_cache_max_bytes (int): The memory cap in bytes of the in-process cache of loaded library models.
+    compiled_model_cache_max_bytes (int): The memory cap in bytes of the in-process cache of compiled models; a process holds at most the sum of the two caps.
+    serving_model (str): The model used by the HTTP scoring service.
+    serving_max_batch_size (int): The maximum number of rows the scoring service merges into one micro-batch.
+    serving_max_wait_ms (float): The maximum time in milliseconds a request waits for its micro-batch to fill.
+    serving_compiled (bool): Whether the scoring service evaluates the model compiled into NumPy tree arrays.
     """
     target = 'SalePrice'
     root = 'C:/Users/MahmutYAVUZ/Desktop/Software/Python/kaggle/regression'
     train_path = root+'/data/raw/train.csv'
-    cleaned_train_path = root+'/data/preprocessed/cleaned_train.csv'
+    cleaned_train_path = root+'/data/preprocessed/cleaned_train.parquet'
     test_path = root+'/data/external/test.csv'
-    cleaned_test_path = root+'/data/preprocessed/cleaned_test.csv'
-    colencoder_path = root+"/data/preprocessed/colencoder.pkl"
-    missing_num_cols_path = root+"/data/preprocessed/numencoder.pkl"
-    ordinal_cols_path = root+"/data/preprocessed/ordinalencoder.pkl"
-    cat_cols_path = root+"/data/preprocessed/oheencoder.pkl"
-    shap_cols_path = root+"/data/preprocessed/shapcolumns.pkl"
+    preprocessor_path = root+"/data/preprocessed/preprocessor.pkl"
+    stage_cache_dir = root+"/data/cache/"
+    profile_cache_dir = root+"/data/cache/profile/"
+    figure_cache_dir = root+"/images/cache/"
+    sparse_design = False
+    shap_fast = False
+    shap_sample_size = 2000
+    shap_probe_params = {'random_state': 33, 'n_estimators': 300, 'max_depth': 6, 'learning_rate': 0.05,
+                         'min_child_weight': 4, 'subsample': 0.8, 'colsample_bytree': 0.8, 'tree_method': 'hist'}
+    shap_n_jobs = 1
     models_path = root+"/models/"
     fold_number = 5
-    hyperparameter_trial_number = 1
\ No newline at end of file
+    hyperparameter_trial_number = 1
+    train_n_jobs = -1
+    leaderboard_path = root+"/models/leaderboard"
+    optuna_storage_path = None
+    optuna_n_jobs = 1
+    optuna_pruner = 'median'
+    optuna_early_stopping_rounds = 200
+    incremental_rounds = 100
+    incremental_max_weight = 0.2
+    incremental_holdout = 0.2
+    trace_enabled = False
+    trace_path = root+"/logs/trace.jsonl"
+    predict_chunksize = 100000
+    model_cache_max_bytes = 1024 ** 3
+    compiled_model_cache_max_bytes = 1024 ** 3
+    serving_model = 'XGBRegressor'
+    serving_max_batch_size = 256
+    serving_max_wait_ms = 5
+    serving_compiled = True
@@ -1,36 +1,263 @@
+import copy
+import os
+import numpy as np
 import pandas as pd
-import pickle as pk
-from src.models.feature_importance import shap_importance
-from sklearn.model_selection import train_test_split
-from src.data.preprocess_data import pipeline_build
-from src.visualization.visualization import missing_control_plot,missing_count_plot,corr_plot
+import scipy.sparse as sp
+from src.data.preprocess_data import pipeline_build, Preprocessor
+from src.data.stage_cache import StageGraph, file_fingerprint
+from src.data.schema import AMES_SCHEMA, apply_schema, parse_dtypes
+from src.data.design_matrix import is_sparse, select_columns
+from src.monitoring.tracing import traced, annotate, shape_attributes
 from paths import Path
-def read_dataset(file):
+# Code version of each data-preparation stage (see data_build_graph). Bump the version of a stage whenever the code
+# it wraps changes its output, so that the cached outputs of the stage and of everything downstream are recomputed:
+# raw: _load_raw/read_dataset, columns: _column_types, split: _split, pipeline: pipeline_build, Preprocessor,
+# missing_value_fill and feature_engineering, shap: shap_importance, final: _select_columns.
+STAGE_VERSIONS = {'raw': 1, 'columns': 1, 'split': 1, 'pipeline': 1, 'shap': 1, 'final': 1}
+FILE_FORMATS = {'.csv': 'csv', '.xlsx': 'xlsx', '.parquet': 'parquet', '.pq': 'parquet',
+                '.feather': 'feather', '.ft': 'feather', '.arrow': 'arrow', '.ipc': 'arrow'}
+
+def file_format(file):
+    """
+       Return the format of a dataset file from its extension.
+
+       Parameters
+       ----------
+       file : str
+           The name of the file (e.g., "data.csv", "data.parquet", "data.feather" or "data.arrow").
+
+       Returns
+       -------
+       file_format : str
+           One of 'csv', 'xlsx', 'parquet', 'feather' or 'arrow'.
+   """
+    extension = os.path.splitext(file)[1].lower()
+    if extension not in FILE_FORMATS:
+        raise ValueError(f'Unsupported file format {extension} for {file}.')
+    return FILE_FORMATS[extension]
+
+def _read_arrow_table(file, columns=None):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    fmt = file_format(file)
+    if fmt == 'parquet':
+        return pq.read_table(file, columns=columns, memory_map=True)
+    if fmt == 'feather':
+        return feather.read_table(file, columns=columns, memory_map=True)
+    table = pa.ipc.open_file(pa.memory_map(file, 'r')).read_all()
+    return table if columns is None else table.select(columns)
+
+def read_dataset(file, columns=None, schema=AMES_SCHEMA):
     """
        Read a dataset based on the specified file format.
+       Parquet, Feather and Arrow IPC files are memory-mapped and only the requested columns are read.
+       The declared schema is applied while parsing: categoricals for string columns, narrow integers
+       for counts and years and float32 for areas.
 
        Parameters
        ----------
        file : str
-           The name of the file to be read (e.g., "data.csv" or "data.xlsx").
+           The name of the file to be read (e.g., "data.csv", "data.xlsx", "data.parquet", "data.feather" or "data.arrow").
+       columns : list, optional
+           The columns to be read (default is None, all columns).
+       schema : dict, optional
+           The declared dtypes by column; None keeps pandas' default inference (default is AMES_SCHEMA).
 
        Returns
        -------
        df : pandas.DataFrame
            The read dataset.
    """
-    if file.split('.')[1]=='csv':
-        df = pd.read_csv(file)
-    if file.split('.')[1]=='xlsx':
-        df = pd.read_excel(file)
+    fmt = file_format(file)
+    dtypes = None if schema is None else parse_dtypes(schema, columns)
+    if fmt == 'csv':
+        df = pd.read_csv(file, usecols=columns, dtype=dtypes)
+    elif fmt == 'xlsx':
+        df = pd.read_excel(file, usecols=columns, dtype=dtypes)
+    else:
+        df = _read_arrow_table(file, columns).to_pandas()
+    return df if schema is None else apply_schema(df, schema)
+
+def read_dataset_chunks(file, chunksize, columns=None, schema=AMES_SCHEMA):
+    """
+       Read a dataset lazily in fixed-size chunks, so that only one chunk is held in memory at a time.
+
+       Parameters
+       ----------
+       file : str
+           The name of the file to be read (e.g., "data.csv", "data.parquet", "data.feather" or "data.arrow").
+       chunksize : int
+           The number of rows per chunk.
+       columns : list, optional
+           The columns to be read (default is None, all columns).
+       schema : dict, optional
+           The declared dtypes by column; None keeps pandas' default inference (default is AMES_SCHEMA).
+
+       Returns
+       -------
+       chunks : iterator of pandas.DataFrame
+           The chunks of the dataset in file order.
+   """
+    fmt = file_format(file)
+    if fmt == 'csv':
+        chunks = pd.read_csv(file, chunksize=chunksize, usecols=columns,
+                             dtype=None if schema is None else parse_dtypes(schema, columns))
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(file, memory_map=True).iter_batches(batch_size=chunksize, columns=columns)
+    elif fmt in ('feather', 'arrow'):
+        batches = _read_arrow_table(file, columns).to_batches(max_chunksize=chunksize)
+    else:
+        raise ValueError(f'Chunked reading is not supported for {file}.')
+    if fmt != 'csv':
+        chunks = (batch.to_pandas() for batch in batches)
+    return chunks if schema is None else (apply_schema(chunk, schema) for chunk in chunks)
+
+def write_dataset(df, file):
+    """
+       Write a dataset based on the specified file format.
+       Feather and Arrow IPC files are written uncompressed, so they can be memory-mapped without decoding.
+
+       Parameters
+       ----------
+       df : pandas.DataFrame
+           The dataset to be written. The index is not written.
+       file : str
+           The name of the file to be written (e.g., "data.csv", "data.parquet", "data.feather" or "data.arrow").
+   """
+    fmt = file_format(file)
+    if fmt == 'csv':
+        df.to_csv(file, index=False)
+        return
+    if fmt == 'xlsx':
+        df.to_excel(file, index=False)
+        return
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == 'parquet':
+        pq.write_table(table, file)
+    elif fmt == 'feather':
+        feather.write_feather(table, file, compression='uncompressed')
+    else:
+        with pa.OSFile(file, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+ORDINAL_COLS = ['ExterCond', 'HeatingQC', 'ExterQual', 'KitchenQual', 'FireplaceQu', 'GarageQual', 'GarageCond',
+                'BsmtQual', 'BsmtCond',
+                'BsmtExposure', 'BsmtFinType1', 'BsmtFinType2', 'GarageRangeBuilt', 'OverallQual', 'OverallCond',
+                'KitchenQual', 'PoolQC']
+
+def _load_raw(file):
+    df = read_dataset(file)
+    df.drop('Id', axis=1, inplace=True)
     return df
 
-def final_data_build(file,plot=False):
+def _column_types(df, target):
+    ordinal_col = list(ORDINAL_COLS)
+    cat_col = []
+    for i in df.columns.tolist():
+        if len(df[i].unique()) < 30:
+            if i not in ordinal_col:
+                cat_col.append(i)
+    num_cols = [x for x in df.select_dtypes(include='number').columns.tolist() if
+                x not in ordinal_col and x not in cat_col and x != target]
+    missing_num_cols = [x for x in df if df[x].isnull().sum() > 0 and x in num_cols]
+    return {'ordinal_col': ordinal_col, 'cat_col': cat_col, 'num_col': num_cols, 'missing_num_col': missing_num_cols}
+
+def _split(df, target, test_size, random_state):
+    from sklearn.model_selection import train_test_split
+    return train_test_split(df.drop(target, axis=1), df[target], test_size=test_size, random_state=random_state)
+
+def _pipeline(split, col_dict, sparse):
+    X_train, X_test, y_train, y_test = split
+    return pipeline_build(X_train, X_test, col_dict['missing_num_col'], col_dict['ordinal_col'], col_dict['cat_col'],
+                          sparse=sparse)
+
+def _shap_ranking(split, pipeline):
+    _, _, y_train, y_test = split
+    X_train, X_test, preprocessor = pipeline
+    from src.models.feature_importance import shap_importance
+    return shap_importance(X_train, X_test, y_train, y_test, feature_names=preprocessor.feature_names_out())
+
+def _select_columns(split, pipeline, shap_values_df, n_columns):
+    _, _, y_train, y_test = split
+    X_train, X_test, preprocessor = pipeline
+    shap_liste = shap_values_df[:n_columns].index.tolist()
+    preprocessor = copy.copy(preprocessor)
+    preprocessor.shap_cols = shap_liste
+    feature_names = pipeline[2].feature_names_out()
+    X_train_shap_columns = select_columns(X_train, shap_liste, feature_names)
+    X_test_shap_columns = select_columns(X_test, shap_liste, feature_names)
+    return X_train_shap_columns,y_train,X_test_shap_columns,y_test,preprocessor
+
+def _write_cleaned_train(X_train, y_train, path=Path.cleaned_train_path):
+    if is_sparse(X_train):
+        # The target is stored as the last column of the sparse matrix.
+        train = sp.hstack([X_train, sp.csr_matrix(y_train.to_numpy(dtype=np.float32).reshape(-1, 1))], format='csr')
+        sp.save_npz(os.path.splitext(path)[0] + '.npz', train)
+    else:
+        train = pd.concat([X_train,y_train.reset_index(drop=True)],axis=1)
+        write_dataset(train,path)
+
+def data_build_graph(file, target=Path.target, n_columns=61, cache_dir=Path.stage_cache_dir, use_cache=True,
+                     sparse=Path.sparse_design):
+    """
+        Describe the data-preparation stages as a graph whose outputs are cached on disk.
+        Reading, column typing, splitting, pipeline fitting, SHAP ranking and column selection are separate stages.
+        Each stage is keyed by the content hash of the input file, its code version (see STAGE_VERSIONS), its own
+        parameters and the keys of its upstream stages, so a stage is only recomputed when something upstream of it
+        changed. The file is only hashed again when its modification time or size changed.
+
+        Parameters
+        ----------
+        file : str
+            The name of the file to be read (e.g., "data.csv" or "data.xlsx").
+        target : str, optional
+            The target column name (default is Path.target).
+        n_columns : int, optional
+            The number of SHAP-ranked columns to keep (default is 61).
+        cache_dir : str, optional
+            The directory the stage outputs are stored in (default is Path.stage_cache_dir).
+        use_cache : bool, optional
+            If False, every stage is recomputed and nothing is cached (default is True).
+        sparse : bool, optional
+            If True, the design matrices are CSR matrices with a sparse one-hot block (default is Path.sparse_design).
+
+        Returns
+        -------
+        graph : StageGraph
+            The graph; graph.get('final') returns the outputs of final_data_build and the fitted preprocessor.
+    """
+    graph = StageGraph(cache_dir, enabled=use_cache)
+    fingerprint = file_fingerprint(file, index_path=os.path.join(cache_dir, 'fingerprints.json') if use_cache else None)
+    graph.add('raw', lambda: _load_raw(file), params={'file': fingerprint, 'schema': AMES_SCHEMA},
+              version=STAGE_VERSIONS['raw'])
+    graph.add('columns', lambda df: _column_types(df, target), deps=['raw'], params={'target': target},
+              version=STAGE_VERSIONS['columns'])
+    graph.add('split', lambda df: _split(df, target, 0.2, 33), deps=['raw'],
+              params={'target': target, 'test_size': 0.2, 'random_state': 33}, version=STAGE_VERSIONS['split'])
+    graph.add('pipeline', lambda split, col_dict: _pipeline(split, col_dict, sparse), deps=['split', 'columns'],
+              params={'preprocessor': Preprocessor.VERSION, 'sparse': sparse}, version=STAGE_VERSIONS['pipeline'])
+    graph.add('shap', _shap_ranking, deps=['split', 'pipeline'],
+              params={'fast': Path.shap_fast, 'sample_size': Path.shap_sample_size, 'probe': Path.shap_probe_params},
+              version=STAGE_VERSIONS['shap'])
+    graph.add('final', lambda split, pipeline, shap_values_df: _select_columns(split, pipeline, shap_values_df, n_columns),
+              deps=['split', 'pipeline', 'shap'], params={'n_columns': n_columns}, version=STAGE_VERSIONS['final'])
+    return graph
+
+@traced('final_data_build')
+def final_data_build(file,plot=False,use_cache=True):
     """
         If the plot parameter is set to True, the visualization functions will be called and executed.
-        The list of selected columns is saved using the pickle module.
+        The fitted preprocessor, including the list of selected columns, is saved as a single artifact.
         Shap importance function is used to select the best features with the shap feature reduction method.
         The pipeline_build function preprocesses the raw data and prepares it for training.
+        The stages are cached on disk (see data_build_graph), so calling it again on unchanged data,
+        e.g. to train another model, only loads the cached outputs.
 
         Parameters
         ----------
@@ -38,53 +265,31 @@ def final_data_build(file,plot=False):
             The name of the file to be read (e.g., "data.csv" or "data.xlsx").
         plot : bool, optional
             A flag used to visualize missing values (default is False).
+        use_cache : bool, optional
+            If False, every stage is recomputed and nothing is cached (default is True).
 
         Returns
         -------
-        X_train_shap_columns : pandas.DataFrame
-            The processed training dataset after feature extraction.
+        X_train_shap_columns : pandas.DataFrame or scipy.sparse.csr_matrix
+            The processed training dataset after feature extraction (a CSR matrix if Path.sparse_design is True).
         y_train : pandas.Series
             The target column of the training dataset.
-        X_test_shap_columns : pandas.DataFrame
+        X_test_shap_columns : pandas.DataFrame or scipy.sparse.csr_matrix
             The processed test dataset after feature extraction.
         y_test : pandas.Series
             The target column of the test dataset.
     """
-    df = read_dataset(file)
-    df.drop('Id', axis=1, inplace=True)
     target = 'SalePrice'
+    graph = data_build_graph(file, target, use_cache=use_cache)
     if plot:
+        from src.visualization.visualization import missing_control_plot, missing_count_plot, corr_plot
+        df = graph.get('raw')
         missing_df = missing_control_plot(df)
         missing_count_plot(df,missing_df,variable_type='num')
         corr_plot(df,target)
-    col_dict = dict()
-    ordinal_col = ['ExterCond', 'HeatingQC', 'ExterQual', 'KitchenQual', 'FireplaceQu', 'GarageQual', 'GarageCond',
-                   'BsmtQual', 'BsmtCond',
-                   'BsmtExposure', 'BsmtFinType1', 'BsmtFinType2', 'GarageRangeBuilt', 'OverallQual', 'OverallCond',
-                   'KitchenQual', 'PoolQC']
-    cat_col = []
-    for i in df.columns.tolist():
-        if len(df[i].unique()) < 30:
-            if i not in ordinal_col:
-                cat_col.append(i)
-    num_cols = [x for x in df.select_dtypes(include=['int', 'float']).columns.tolist() if
-                x not in ordinal_col and x not in cat_col and x != target]
-    missing_num_cols = [x for x in df if df[x].isnull().sum() > 0 and x in num_cols]
-    col_dict['ordinal_col'] = ordinal_col
-    col_dict['cat_col'] = cat_col
-    col_dict['num_col'] = num_cols
-    col_dict['missing_num_col'] = missing_num_cols
-    pk.dump(col_dict, open(Path.colencoder_path, "wb"))
-    shap_values_df = shap_importance(df, target, missing_num_cols, ordinal_col, cat_col)
-    shap_liste = shap_values_df[:61].index.tolist()
-    X_train, X_test, y_train, y_test = train_test_split(df.drop(target, axis=1),
-                                                        df[target],
-                                                        test_size=0.2,
-                                                        random_state=33)
-    pk.dump({'shap_columns':shap_liste}, open(Path.shap_cols_path, "wb"))
-    X_train, X_test = pipeline_build(X_train, X_test, missing_num_cols, ordinal_col, cat_col)
-    X_train_shap_columns = X_train[shap_liste]
-    X_test_shap_columns = X_test[shap_liste]
-    train = pd.concat([X_train,y_train])
-    train.to_csv(Path.cleaned_train_path,index=False)
+    X_train_shap_columns,y_train,X_test_shap_columns,y_test,preprocessor = graph.get('final')
+    preprocessor.save(Path.preprocessor_path)
+    # Written outside the cached stages, so the file is refreshed on cache hits as well.
+    _write_cleaned_train(X_train_shap_columns, y_train)
+    annotate(**shape_attributes(X_train_shap_columns), test_rows=X_test_shap_columns.shape[0])
     return X_train_shap_columns,y_train,X_test_shap_columns,y_test
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def is_sparse(X):
+    """
+    Return True if the design matrix is a SciPy sparse matrix.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame or scipy.sparse matrix
+        The design matrix.
+
+    Returns
+    -------
+    sparse : bool
+        True for a sparse matrix, False for a dataframe.
+    """
+    return sp.issparse(X)
+
+
+def take_rows(X, index):
+    """
+    Select rows by position from a dataframe or a sparse matrix.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame, pandas.Series or scipy.sparse matrix
+        The design matrix or target.
+    index : array-like
+        The row positions.
+
+    Returns
+    -------
+    rows : pandas.DataFrame, pandas.Series or scipy.sparse.csr_matrix
+        The selected rows.
+    """
+    if is_sparse(X):
+        return X.tocsr()[np.asarray(index)]
+    return X.iloc[index]
+
+
+def stack_rows(*blocks):
+    """
+    Concatenate design matrices (or targets) along the rows.
+
+    Parameters
+    ----------
+    *blocks : pandas.DataFrame, pandas.Series or scipy.sparse matrix
+        The blocks to be concatenated; all of them are dataframes/series or all of them are sparse matrices.
+
+    Returns
+    -------
+    X : pandas.DataFrame, pandas.Series or scipy.sparse.csr_matrix
+        The concatenated blocks.
+    """
+    if is_sparse(blocks[0]):
+        return sp.vstack(blocks, format='csr')
+    return pd.concat(blocks, axis=0)
+
+
+def select_columns(X, columns, feature_names):
+    """
+    Select columns by name from a dataframe, or by their position in feature_names from a sparse matrix.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame or scipy.sparse matrix
+        The design matrix.
+    columns : list
+        The names of the selected columns.
+    feature_names : list
+        The names of all the columns of X, in order.
+
+    Returns
+    -------
+    X : pandas.DataFrame or scipy.sparse.csr_matrix
+        The selected columns.
+    """
+    if is_sparse(X):
+        position = {name: i for i, name in enumerate(feature_names)}
+        return X.tocsc()[:, [position[col] for col in columns]].tocsr()
+    return X[columns]
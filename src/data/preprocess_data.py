@@ -1,10 +1,105 @@
 # -*- coding: utf-8 -*-
+import os
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from src.features.feature_engineering import feature_engineering
-from sklearn.preprocessing import OrdinalEncoder, OneHotEncoder
+from sklearn.preprocessing import OneHotEncoder
 import pickle as pk
+from src.data.schema import fill_categorical
 from paths import Path
-def missing_value_fill(data):
+
+
+def _mode(series, default):
+    mode = series.mode()
+    return mode.iloc[0] if len(mode) else default
+
+
+class MissingValueImputer:
+    """
+    Fitted statistics of the data-dependent fills of missing_value_fill, learned once from the training dataset so that
+    the fill of a scoring batch does not depend on the other rows of the batch.
+    It keeps the LotFrontage median of each neighbourhood, with the overall median for neighbourhoods that had none,
+    and the modes of MasVnrArea and Electrical.
+    """
+    def __init__(self):
+        self.lot_frontage_medians = None
+        self.lot_frontage_median = None
+        self.mas_vnr_area_mode = None
+        self.electrical_mode = None
+
+    def fit(self, X):
+        """
+        Learn the neighbourhood medians and the modes from the training dataset.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The training dataset, before missing_value_fill.
+
+        Returns
+        -------
+        self : MissingValueImputer
+            The fitted imputer.
+        """
+        medians = X.groupby('Neighborhood', observed=True)['LotFrontage'].median().dropna()
+        self.lot_frontage_medians = {key: float(value) for key, value in medians.items()}
+        self.lot_frontage_median = float(X['LotFrontage'].median())
+        # Most houses have no masonry veneer, and SBrkr is the most common electrical system.
+        self.mas_vnr_area_mode = _mode(X['MasVnrArea'], 0)
+        self.electrical_mode = _mode(X['Electrical'], 'SBrkr')
+        return self
+
+    def partial_fit(self, X, weight):
+        """
+        Move the LotFrontage medians towards the medians of newly arrived rows; the modes are kept.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The newly arrived rows, before missing_value_fill.
+        weight : float
+            The weight of the new rows in the updated medians.
+
+        Returns
+        -------
+        self : MissingValueImputer
+            The updated imputer.
+        """
+        medians = X.groupby('Neighborhood', observed=True)['LotFrontage'].median().dropna()
+        for key, median in medians.items():
+            current = self.lot_frontage_medians.get(key)
+            self.lot_frontage_medians[key] = float(median) if current is None else (1 - weight) * current + weight * median
+        median = X['LotFrontage'].median()
+        if not pd.isna(median):
+            self.lot_frontage_median = (1 - weight) * self.lot_frontage_median + weight * median
+        return self
+
+    def transform(self, df):
+        """
+        Fill LotFrontage, MasVnrArea and Electrical in place with the fitted statistics.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The dataset; it is modified.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            The dataset with the three columns filled.
+        """
+        lot_frontage = df['LotFrontage']
+        if lot_frontage.isna().any():
+            fill = (df['Neighborhood'].map(self.lot_frontage_medians).astype(np.float64)
+                    .fillna(self.lot_frontage_median).astype(lot_frontage.dtype))
+            df['LotFrontage'] = lot_frontage.fillna(fill)
+        df['MasVnrArea'] = df['MasVnrArea'].fillna(self.mas_vnr_area_mode)
+        df['Electrical'] = fill_categorical(df['Electrical'], self.electrical_mode)
+        return df
+
+
+def missing_value_fill(data, imputer=None):
     """
      Fill missing values in the dataset with predefined values.
 
@@ -12,12 +107,17 @@ def missing_value_fill(data):
      ----------
      data : pandas.DataFrame
          The input dataframe containing the dataset.
+     imputer : MissingValueImputer, optional
+         The imputer fitted on the training dataset that fills LotFrontage, MasVnrArea and Electrical.
+         If None, it is fitted on data itself (default is None).
 
      Returns
      -------
      df : pandas.DataFrame
          The dataframe with missing values filled according to the defined rules.
      """
+    if imputer is None:
+        imputer = MissingValueImputer().fit(data)
     df = data.copy()
     # BsmtFinType2: Quality of second finished area (if present)
     # BsmtFinType1: Quality of basement finished area
@@ -42,29 +142,26 @@ def missing_value_fill(data):
     # NB : No Basement
     # NF : No Fence
     # NFP : No Fireplace
-    df['BsmtFinType2'] = df['BsmtFinType2'].fillna('NH')
-    df['BsmtFinType1'] = df['BsmtFinType1'].fillna('NB')
-    df['BsmtQual'] = df['BsmtQual'].fillna('NB')
-    df['Fence'] = df['Fence'].fillna('NF')
-    df['FireplaceQu'] = df['FireplaceQu'].fillna('NFP')
-    # I filled in with 0 as most houses don't have it.
-    df['MasVnrArea'] = df['MasVnrArea'].fillna(df['MasVnrArea'].mode()[0])
+    df['BsmtFinType2'] = fill_categorical(df['BsmtFinType2'], 'NH')
+    df['BsmtFinType1'] = fill_categorical(df['BsmtFinType1'], 'NB')
+    df['BsmtQual'] = fill_categorical(df['BsmtQual'], 'NB')
+    df['Fence'] = fill_categorical(df['Fence'], 'NF')
+    df['FireplaceQu'] = fill_categorical(df['FireplaceQu'], 'NFP')
     # I filled in the empty ones with None since the ones that didn't have the ownership information were labeled as None in the column data.
-    df['MasVnrType'] = df['MasVnrType'].fillna('None')
-    df['MiscFeature'] = df['MiscFeature'].fillna('NH')
-    df['PoolQC'] = df['PoolQC'].fillna('NH')
-    # I grouped each house by its own neighborhood and filled in the missing values with the median.
-    df['LotFrontage'] = df.groupby('Neighborhood')['LotFrontage'].apply(lambda x : x.fillna(x.median()))
-    df['Alley'] = df['Alley'].fillna('NH')
-    df['BsmtCond'] = df['BsmtCond'].fillna('NH')
+    df['MasVnrType'] = fill_categorical(df['MasVnrType'], 'None')
+    df['MiscFeature'] = fill_categorical(df['MiscFeature'], 'NH')
+    df['PoolQC'] = fill_categorical(df['PoolQC'], 'NH')
+    df['Alley'] = fill_categorical(df['Alley'], 'NH')
+    df['BsmtCond'] = fill_categorical(df['BsmtCond'], 'NH')
     # I filled in the empty ones with No since the ones that didn't have the ownership information were labeled as No in the column data.
-    df['BsmtExposure'] = df['BsmtExposure'].fillna('No')
-    # I filled in with the most commonly used system for electrical systems in houses.
-    df['Electrical']=df['Electrical'].fillna(df['BsmtExposure'].mode()[0])
-    df['GarageType'] = df['GarageType'].fillna('NH')
-    df['GarageFinish'] = df['GarageFinish'].fillna('NH')
-    df['GarageQual'] = df['GarageQual'].fillna('NH')
-    df['GarageCond'] = df['GarageCond'].fillna('NH')
+    df['BsmtExposure'] = fill_categorical(df['BsmtExposure'], 'No')
+    df['GarageType'] = fill_categorical(df['GarageType'], 'NH')
+    df['GarageFinish'] = fill_categorical(df['GarageFinish'], 'NH')
+    df['GarageQual'] = fill_categorical(df['GarageQual'], 'NH')
+    df['GarageCond'] = fill_categorical(df['GarageCond'], 'NH')
+    # MasVnrArea is filled with its most common value (0, as most houses don't have it), LotFrontage with the median
+    # of the house's own neighborhood and Electrical with the most commonly used system, all learned by the imputer.
+    imputer.transform(df)
     # To be able to fill in the missing values and group the years,
     #I first filled them with a year that is not in the selected column, then grouped the years,
     #and replaced the year that was not in the column with "NH".
@@ -75,12 +172,304 @@ def missing_value_fill(data):
     df['GarageRangeBuilt'] = pd.cut(df['GarageYrBlt'], bins=bins, labels=labels).astype('object')
     return df
 
-def pipeline_build(X_train,X_test,missing_num_cols,ordinal_cols,cat_cols):
+
+
+class Preprocessor:
+    """
+    Fitted preprocessing artifact that replaces the separate column, median, ordinal, one-hot and SHAP pickles.
+    All the statistics learned from the training data are kept on a single object, so the scoring path only has to
+    load one file and can apply it any number of times without touching the disk.
+
+    Parameters
+    ----------
+    missing_num_cols : list
+        A list of columns with missing numerical values.
+    ordinal_cols : list
+        A list of ordinal columns.
+    cat_cols : list
+        A list of categorical columns.
+    shap_cols : list, optional
+        The list of selected SHAP columns. If it is given, transform returns only these columns (default is None).
+    sparse : bool, optional
+        If True, transform returns a float32 CSR matrix in which the numeric block and the one-hot block are combined
+        without densifying the one-hot columns. The column names are given by feature_names_out (default is False).
+    """
+    # The format version is stored with the artifact; bump it whenever the fitted attributes change.
+    VERSION = 6
+
+    def __init__(self, missing_num_cols, ordinal_cols, cat_cols, shap_cols=None, sparse=False):
+        self.missing_num_cols = list(missing_num_cols)
+        self.ordinal_cols = list(dict.fromkeys(ordinal_cols))
+        self.cat_cols = list(cat_cols)
+        self.shap_cols = None if shap_cols is None else list(shap_cols)
+        self.sparse = sparse
+        self.version = self.VERSION
+        self.feature_names = None
+        self.n_samples = 0
+        self.imputer = None
+        self.num_dict = None
+        self.ordinal_categories = None
+        self.ohe = None
+        self.ohe_cols = None
+
+    def fit(self, X):
+        """
+        Learn the missing-value statistics, the numerical medians, the ordinal mappings and the one-hot categories
+        from the training dataset.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The training dataset.
+
+        Returns
+        -------
+        self : Preprocessor
+            The fitted preprocessor.
+        """
+        X = X.drop(columns=['Id'], errors='ignore')
+        self.imputer = MissingValueImputer().fit(X)
+        X = missing_value_fill(X, self.imputer)
+        self.n_samples = len(X)
+        self.num_dict = dict()
+        for missing_col in self.missing_num_cols:
+            if missing_col in X.columns:
+                self.num_dict[missing_col] = X[missing_col].median()
+        X = feature_engineering(X.fillna(self.num_dict))
+        # Each ordinal column is compiled to the sorted list of its training values; the code of a value is its
+        # position in that list, as with OrdinalEncoder, unknown values get -1 and missing values stay NaN
+        # (e.g. GarageRangeBuilt for garages built before 1900).
+        self.ordinal_categories = dict()
+        for col in self.ordinal_cols:
+            if col in X.columns:
+                self.ordinal_categories[col] = pd.Index(np.sort(np.asarray(X[col].dropna().unique())))
+        self.ohe_cols = [col for col in self.cat_cols if col in X.columns]
+        self.ohe = OneHotEncoder(handle_unknown='ignore', dtype=np.float32)
+        self.ohe.fit(X[self.ohe_cols])
+        self.feature_names = ([col for col in X.columns if col not in self.ohe_cols]
+                              + list(self.ohe.get_feature_names_out(self.ohe_cols)))
+        return self
+
+    def partial_fit(self, X, max_weight=Path.incremental_max_weight):
+        """
+        Update the numerical and neighbourhood medians with newly arrived rows.
+        Each median moves towards the median of the new rows in proportion to their share of all the rows seen,
+        and never by more than max_weight of the distance. The ordinal mappings and the one-hot categories are kept,
+        so the transformed columns stay the ones the trained models expect; unseen categories are encoded as unknown.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The newly arrived rows.
+        max_weight : float, optional
+            The largest weight the new rows can get in the updated medians (default is Path.incremental_max_weight).
+
+        Returns
+        -------
+        self : Preprocessor
+            The updated preprocessor.
+        """
+        if self.num_dict is None:
+            raise RuntimeError('Preprocessor must be fitted before calling partial_fit.')
+        X = X.drop(columns=['Id'], errors='ignore')
+        weight = min(len(X) / max(1, self.n_samples + len(X)), max_weight)
+        self.imputer.partial_fit(X, weight)
+        X = missing_value_fill(X, self.imputer)
+        for col, median in self.num_dict.items():
+            new_median = X[col].median()
+            if not pd.isna(new_median):
+                self.num_dict[col] = (1 - weight) * median + weight * new_median
+        self.n_samples += len(X)
+        return self
+
+    def feature_names_out(self):
+        """
+        Return the names of the columns returned by transform.
+
+        Returns
+        -------
+        feature_names : list
+            The column names, in order.
+        """
+        return list(self.feature_names) if self.shap_cols is None else list(self.shap_cols)
+
+    @property
+    def shap_index(self):
+        """
+        The positions of the selected SHAP columns among all the transformed columns, or None without a selection.
+        """
+        if self.shap_cols is None:
+            return None
+        position = {name: i for i, name in enumerate(self.feature_names)}
+        return np.array([position[col] for col in self.shap_cols], dtype=np.int64)
+
+    def transform(self, X):
+        """
+        Apply the fitted preprocessing steps to a dataset. The input dataframe is not modified.
+        The returned design matrix is float32.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The dataset to be transformed.
+
+        Returns
+        -------
+        X : pandas.DataFrame or scipy.sparse.csr_matrix
+            The processed float32 dataset; a CSR matrix whose columns are feature_names_out() if sparse is True.
+        """
+        if self.ohe is None:
+            raise RuntimeError('Preprocessor must be fitted before calling transform.')
+        X = missing_value_fill(X.drop(columns=['Id'], errors='ignore'), self.imputer)
+        X = feature_engineering(X.fillna(self.num_dict))
+        X = self._encode_ordinal(X)
+        ohe_matrix = self.ohe.transform(X[self.ohe_cols])
+        if self.sparse:
+            dense_block = X.drop(self.ohe_cols, axis=1).to_numpy(dtype=np.float32)
+            matrix = sp.hstack([sp.csr_matrix(dense_block), ohe_matrix], format='csr', dtype=np.float32)
+            if self.shap_cols is not None:
+                matrix = matrix.tocsc()[:, self.shap_index].tocsr()
+            return matrix
+        ohe_df = pd.DataFrame(ohe_matrix.toarray(),
+                              columns=self.ohe.get_feature_names_out(self.ohe_cols))
+        X = pd.concat([X.drop(self.ohe_cols, axis=1).reset_index(drop=True),
+                       ohe_df.reset_index(drop=True)], axis=1)
+        if self.shap_cols is not None:
+            X = X[self.shap_cols]
+        return X.astype(np.float32)
+
+    def _encode_ordinal(self, X):
+        cols = list(self.ordinal_categories)
+        if cols:
+            codes = np.empty((len(X), len(cols)), dtype=np.float32)
+            for i, col in enumerate(cols):
+                codes[:, i] = pd.Categorical(X[col], categories=self.ordinal_categories[col]).codes
+                codes[X[col].isna().to_numpy(), i] = np.nan
+            X[cols] = pd.DataFrame(codes, columns=cols, index=X.index)
+        return X
+
+    def fit_transform(self, X):
+        """
+        Fit the preprocessor on a dataset and return the transformed dataset.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            The training dataset.
+
+        Returns
+        -------
+        X : pandas.DataFrame
+            The processed training dataset.
+        """
+        return self.fit(X).transform(X)
+
+    def save(self, path):
+        """
+        Save the fitted preprocessor as a single pickle file.
+
+        Parameters
+        ----------
+        path : str
+            The file path of the preprocessing artifact.
+        """
+        with open(path, 'wb') as f:
+            pk.dump(self, f, protocol=pk.HIGHEST_PROTOCOL)
+
+
+_preprocessor_cache = dict()
+# The separate pickles the preprocessing was saved as before the single artifact, next to it.
+LEGACY_FILES = {'cols': 'colencoder.pkl', 'num_dict': 'numencoder.pkl', 'ordinal': 'ordinalencoder.pkl',
+                'ohe': 'oheencoder.pkl', 'shap_cols': 'shapcolumns.pkl'}
+
+
+def _legacy_preprocessor(paths, train_path=Path.train_path):
+    """
+    Build a Preprocessor from the legacy pickles, so the models trained before the single artifact can still be used.
+    The missing-value imputer did not exist then and is fitted on the raw training dataset.
+
+    Parameters
+    ----------
+    paths : dict
+        The file paths of the legacy pickles, by the keys of LEGACY_FILES.
+    train_path : str, optional
+        The file path of the raw training dataset (default is Path.train_path).
+
+    Returns
+    -------
+    preprocessor : Preprocessor
+        The fitted preprocessor.
+    """
+    legacy = dict()
+    for name, file in paths.items():
+        with open(file, 'rb') as f:
+            legacy[name] = pk.load(f)
+    ohe = legacy['ohe']
+    ohe_cols = list(getattr(ohe, 'feature_names_in_', legacy['cols']['cat_col']))
+    preprocessor = Preprocessor(legacy['cols']['missing_num_col'], list(legacy['ordinal']), ohe_cols)
+    preprocessor.num_dict = {col: float(median) for col, median in legacy['num_dict'].items()}
+    # The legacy mappings are {value: encoded array}; the categories are the values in the order of their codes.
+    preprocessor.ordinal_categories = {
+        col: pd.Index(sorted((value for value in mapping if not pd.isna(value)),
+                             key=lambda value: float(np.ravel(mapping[value])[0])))
+        for col, mapping in legacy['ordinal'].items()}
+    preprocessor.ohe = ohe
+    preprocessor.ohe_cols = ohe_cols
+    train = pd.read_csv(train_path).drop(columns=[Path.target], errors='ignore')
+    preprocessor.imputer = MissingValueImputer().fit(train.drop(columns=['Id'], errors='ignore'))
+    preprocessor.n_samples = len(train)
+    preprocessor.feature_names = list(preprocessor.transform(train.head(1)).columns)
+    preprocessor.shap_cols = list(legacy['shap_cols']['shap_columns'])
+    return preprocessor
+
+
+def load_preprocessor(path=Path.preprocessor_path):
+    """
+    Load the fitted preprocessing artifact. The object is read once per process and reused until the file changes.
+    If the artifact has not been built yet, the preprocessor is built from the legacy pickles in the same directory
+    (see _legacy_preprocessor).
+
+    Parameters
+    ----------
+    path : str, optional
+        The file path of the preprocessing artifact (default is Path.preprocessor_path).
+
+    Returns
+    -------
+    preprocessor : Preprocessor
+        The fitted preprocessor.
+    """
+    if not os.path.exists(path):
+        paths = {name: os.path.join(os.path.dirname(path), file) for name, file in LEGACY_FILES.items()}
+        if not all(os.path.exists(file) for file in paths.values()):
+            raise FileNotFoundError(f'Preprocessing artifact {path} could not be found. '
+                                    f'The model must be trained first.')
+        key = tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths.values()))
+        cached = _preprocessor_cache.get(path)
+        if cached is None or cached[0] != key:
+            _preprocessor_cache[path] = (key, _legacy_preprocessor(paths))
+        return _preprocessor_cache[path][1]
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _preprocessor_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        preprocessor = pk.load(f)
+    if getattr(preprocessor, 'version', None) != Preprocessor.VERSION:
+        raise ValueError(f'Preprocessing artifact {path} has version {getattr(preprocessor, "version", None)}, '
+                         f'expected {Preprocessor.VERSION}. The model must be retrained.')
+    _preprocessor_cache[path] = (key, preprocessor)
+    return preprocessor
+
+
+def pipeline_build(X_train,X_test,missing_num_cols,ordinal_cols,cat_cols,shap_cols=None,sparse=False):
     """
     The data is first prepared using the missing_value_fill function, which applies predefined methods to fill in missing value.
     Then, the remaining numeric columns containing NaNs are filled with their medians.
     After ensuring that there are no NaNs left in the data, the feature_engineering function is used to generate new features.
     Categorical columns are transformed using the OrdinalEncoder and OneHotEncoder methods.
+    All these steps are fitted on the training dataset and kept on a single Preprocessor object.
 
     Parameters
     ----------
@@ -94,128 +483,39 @@ def pipeline_build(X_train,X_test,missing_num_cols,ordinal_cols,cat_cols):
         A list of ordinal columns.
     cat_cols : list
         A list of categorical columns.
+    shap_cols : list, optional
+        The list of selected SHAP columns (default is None, all columns are returned).
+    sparse : bool, optional
+        If True, the datasets are returned as CSR matrices with the one-hot block kept sparse (default is False).
 
     Returns
     -------
-    X_train : pandas.DataFrame
+    X_train : pandas.DataFrame or scipy.sparse.csr_matrix
         The processed training dataset after performing pipeline building steps.
-    X_test : pandas.DataFrame
+    X_test : pandas.DataFrame or scipy.sparse.csr_matrix
         The processed test dataset after performing pipeline building steps.
+    preprocessor : Preprocessor
+        The preprocessor fitted on the training dataset.
     """
-    X_train = missing_value_fill(X_train)
-    X_test = missing_value_fill(X_test)
-    num_dict = dict(zip([], []))
-    for missing_col in missing_num_cols:
-        if missing_col in X_train.columns.tolist():
-            train_median = X_train[missing_col].median()
-            dict_temp = train_median
-            num_dict[missing_col] = dict_temp
-            X_train.loc[:, missing_col] = X_train.loc[:, missing_col].fillna(train_median)
-            X_test.loc[:, missing_col] = X_test.loc[:, missing_col].fillna(train_median)
-    pk.dump(num_dict, open(Path.missing_num_cols_path, "wb"))
-    X_train = feature_engineering(X_train)
-    X_test = feature_engineering(X_test)
-    ordinal_dict = dict(zip([], []))
-    ordinal_cols=list(set(ordinal_cols))
-    for col in ordinal_cols:
-        if col in X_train.columns.tolist():
-            encoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
-            temp_keys = X_train.loc[:, col].values
-            temp_values = encoder.fit_transform(X_train.loc[:, col].values.reshape(-1, 1))
-            X_train.loc[:, col] = encoder.fit_transform(X_train.loc[:, col].values.reshape(-1, 1))
-            X_test.loc[:, col] = encoder.transform(X_test.loc[:, col].values.reshape(-1, 1))
-            dict_temp = dict(zip(temp_keys, temp_values))
-            ordinal_dict[col] = dict_temp
-    pk.dump(ordinal_dict, open(Path.ordinal_cols_path, "wb"))
-    for i in cat_cols.copy():
-        if i not in X_train.columns.tolist():
-            cat_cols.remove(i)
-
-    ohe = OneHotEncoder(handle_unknown='ignore')
-    ohe.fit(X_train[cat_cols])
-    pk.dump(ohe, open(Path.cat_cols_path, "wb"))
-
-    train_ohe = pd.DataFrame(ohe.transform(X_train[cat_cols]).toarray(),
-                             columns=ohe.get_feature_names_out(cat_cols))
-
-    val_ohe = pd.DataFrame(ohe.transform(X_test[cat_cols]).toarray(),
-                           columns=ohe.get_feature_names_out(cat_cols))
-
-    X_train = pd.concat([X_train.reset_index(drop=True),
-                              train_ohe.reset_index(drop=True)], axis=1)
-    X_test = pd.concat([X_test.reset_index(drop=True),
-                            val_ohe.reset_index(drop=True)], axis=1)
-
-    X_train = X_train.drop(cat_cols,axis=1)
-    X_test = X_test.drop(cat_cols,axis=1)
-    return X_train,X_test
-
-def test_pipeline_build(test,colpath,missing_num_cols_path,ordinal_cols_path,cat_cols_path,shap_cols_path):
+    preprocessor = Preprocessor(missing_num_cols, ordinal_cols, cat_cols, shap_cols, sparse).fit(X_train)
+    return preprocessor.transform(X_train), preprocessor.transform(X_test), preprocessor
+
+def test_pipeline_build(test,preprocessor_path=Path.preprocessor_path):
     """
     The function test_pipeline_build provides a similar data preparation method as the pipeline_build function,
-    but it utilizes pre-trained data information to prepare the test dataset.
+    but it utilizes the preprocessor fitted on the training data to prepare the test dataset.
+    The artifact is loaded once per process and nothing is written to disk.
+
     Parameters
     ----------
     test : pandas.DataFrame
         The test dataset.
-    colpath : str
-        It contains a list of different column information (pickle file).
-    missing_num_cols_path : str
-        The file path to load the dictionary of missing numerical columns and their corresponding medians (pickle file).
-    ordinal_cols_path : str
-        The file path to load the dictionary of ordinal columns and their encoding mappings (pickle file).
-    cat_cols_path : str
-        The file path to load the one-hot encoder used for transforming categorical columns (pickle file).
-    shap_cols_path : str
-        The file path to load the list of selected SHAP columns (pickle file).
+    preprocessor_path : str, optional
+        The file path of the fitted preprocessing artifact (default is Path.preprocessor_path).
 
     Returns
     -------
-    test : pandas.DataFrame
+    test : pandas.DataFrame or scipy.sparse.csr_matrix
         The processed test dataset after performing pipeline building steps.
     """
-    test = missing_value_fill(test)
-    cols = open(colpath, 'rb')
-    missing_num_cols = open(missing_num_cols_path, 'rb')
-    ordinal_cols = open(ordinal_cols_path, 'rb')
-    cat_cols = open(cat_cols_path, 'rb')
-    shap_cols = open(shap_cols_path, 'rb')
-    train_cols = pk.load(cols)
-    train_missing_num_cols = pk.load(missing_num_cols)
-    train_ordinal_cols = pk.load(ordinal_cols)
-    train_cat_cols = pk.load(cat_cols)
-    train_shap_cols = pk.load(shap_cols)
-    cols.close()
-    missing_num_cols.close()
-    ordinal_cols.close()
-    cat_cols.close()
-    shap_cols.close()
-    for missing_col in train_cols['missing_num_col']:
-        if missing_col in test.columns.tolist():
-            test.loc[:,missing_col] = test.loc[:, missing_col].fillna(train_missing_num_cols[missing_col])
-
-    test = feature_engineering(test)
-
-    train_cols['ordinal_col'] = list(set(train_cols['ordinal_col']))
-    for k1, v1 in train_ordinal_cols.items():
-        test.loc[~test[k1].isin(list(v1.keys())), k1] = -1
-    for col in train_cols['ordinal_col']:
-        if col in test.columns.tolist():
-            test.loc[:, col] = test.loc[:, col].replace(train_ordinal_cols[col])
-
-    ohe_cols = train_cols['cat_col']
-    for i in ohe_cols.copy():
-        if i not in test.columns.tolist():
-            ohe_cols.remove(i)
-    ohe = train_cat_cols
-    ohe_test = pd.DataFrame(ohe.transform(test[ohe_cols]).toarray(),columns=ohe.get_feature_names_out(ohe_cols))
-
-    test = pd.concat([test.reset_index(drop=True),
-                         ohe_test.reset_index(drop=True)], axis=1)
-
-    test = test.drop(ohe_cols, axis=1)
-
-    test.drop('Id',axis=1,inplace=True)
-    test = test[train_shap_cols['shap_columns']]
-    test.to_csv(Path.cleaned_test_path, index=False)
-    return test
+    return load_preprocessor(preprocessor_path).transform(test)
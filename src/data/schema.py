@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+CATEGORICAL = 'category'
+
+# Declared dtypes of the Ames columns. String columns are categoricals, counts, ratings and months are int8,
+# years and codes are int16, and areas and values are float32. The target keeps pandas' default dtype.
+AMES_SCHEMA = {
+    'Id': 'int32',
+    'MSSubClass': 'int16',
+    'MSZoning': CATEGORICAL,
+    'LotFrontage': 'float32',
+    'LotArea': 'float32',
+    'Street': CATEGORICAL,
+    'Alley': CATEGORICAL,
+    'LotShape': CATEGORICAL,
+    'LandContour': CATEGORICAL,
+    'Utilities': CATEGORICAL,
+    'LotConfig': CATEGORICAL,
+    'LandSlope': CATEGORICAL,
+    'Neighborhood': CATEGORICAL,
+    'Condition1': CATEGORICAL,
+    'Condition2': CATEGORICAL,
+    'BldgType': CATEGORICAL,
+    'HouseStyle': CATEGORICAL,
+    'OverallQual': 'int8',
+    'OverallCond': 'int8',
+    'YearBuilt': 'int16',
+    'YearRemodAdd': 'int16',
+    'RoofStyle': CATEGORICAL,
+    'RoofMatl': CATEGORICAL,
+    'Exterior1st': CATEGORICAL,
+    'Exterior2nd': CATEGORICAL,
+    'MasVnrType': CATEGORICAL,
+    'MasVnrArea': 'float32',
+    'ExterQual': CATEGORICAL,
+    'ExterCond': CATEGORICAL,
+    'Foundation': CATEGORICAL,
+    'BsmtQual': CATEGORICAL,
+    'BsmtCond': CATEGORICAL,
+    'BsmtExposure': CATEGORICAL,
+    'BsmtFinType1': CATEGORICAL,
+    'BsmtFinSF1': 'float32',
+    'BsmtFinType2': CATEGORICAL,
+    'BsmtFinSF2': 'float32',
+    'BsmtUnfSF': 'float32',
+    'TotalBsmtSF': 'float32',
+    'Heating': CATEGORICAL,
+    'HeatingQC': CATEGORICAL,
+    'CentralAir': CATEGORICAL,
+    'Electrical': CATEGORICAL,
+    '1stFlrSF': 'float32',
+    '2ndFlrSF': 'float32',
+    'LowQualFinSF': 'float32',
+    'GrLivArea': 'float32',
+    'BsmtFullBath': 'int8',
+    'BsmtHalfBath': 'int8',
+    'FullBath': 'int8',
+    'HalfBath': 'int8',
+    'BedroomAbvGr': 'int8',
+    'KitchenAbvGr': 'int8',
+    'KitchenQual': CATEGORICAL,
+    'TotRmsAbvGrd': 'int8',
+    'Functional': CATEGORICAL,
+    'Fireplaces': 'int8',
+    'FireplaceQu': CATEGORICAL,
+    'GarageType': CATEGORICAL,
+    'GarageYrBlt': 'int16',
+    'GarageFinish': CATEGORICAL,
+    'GarageCars': 'int8',
+    'GarageArea': 'float32',
+    'GarageQual': CATEGORICAL,
+    'GarageCond': CATEGORICAL,
+    'PavedDrive': CATEGORICAL,
+    'WoodDeckSF': 'float32',
+    'OpenPorchSF': 'float32',
+    'EnclosedPorch': 'float32',
+    '3SsnPorch': 'float32',
+    'ScreenPorch': 'float32',
+    'PoolArea': 'float32',
+    'PoolQC': CATEGORICAL,
+    'Fence': CATEGORICAL,
+    'MiscFeature': CATEGORICAL,
+    'MiscVal': 'float32',
+    'MoSold': 'int8',
+    'YrSold': 'int16',
+    'SaleType': CATEGORICAL,
+    'SaleCondition': CATEGORICAL,
+}
+
+
+def _is_integer(dtype):
+    return dtype != CATEGORICAL and np.issubdtype(np.dtype(dtype), np.integer)
+
+
+def parse_dtypes(schema=AMES_SCHEMA, columns=None):
+    """
+    Return the dtypes passed to the CSV parser.
+    Integer columns are parsed as float32, because any of them may contain missing values;
+    apply_schema narrows them to the declared integer dtype afterwards.
+
+    Parameters
+    ----------
+    schema : dict, optional
+        The declared dtypes by column (default is AMES_SCHEMA).
+    columns : list, optional
+        The columns that are read (default is None, all columns of the schema).
+
+    Returns
+    -------
+    dtypes : dict
+        The parse dtypes by column.
+    """
+    return {col: 'float32' if _is_integer(dtype) else dtype
+            for col, dtype in schema.items() if columns is None or col in columns}
+
+
+def apply_schema(df, schema=AMES_SCHEMA):
+    """
+    Convert the columns of a dataframe to their declared dtypes.
+    Integer columns that contain missing values are kept as float32. Columns that are not in the schema are left as they are.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The dataframe to be converted. It is modified in place.
+    schema : dict, optional
+        The declared dtypes by column (default is AMES_SCHEMA).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The converted dataframe.
+    """
+    for col in df.columns:
+        dtype = schema.get(col)
+        if dtype is None or str(df[col].dtype) == dtype:
+            continue
+        if _is_integer(dtype):
+            values = pd.to_numeric(df[col], errors='coerce')
+            df[col] = values.astype('float32') if values.isna().any() else values.astype(dtype)
+        elif dtype == CATEGORICAL:
+            df[col] = df[col].astype(CATEGORICAL)
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
+
+
+def fill_categorical(series, value):
+    """
+    Fill the missing values of a series, adding the fill value to the categories of a categorical series first.
+
+    Parameters
+    ----------
+    series : pandas.Series
+        The series to be filled.
+    value : object
+        The fill value.
+
+    Returns
+    -------
+    series : pandas.Series
+        The filled series.
+    """
+    if pd.api.types.is_categorical_dtype(series.dtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
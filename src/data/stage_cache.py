@@ -0,0 +1,206 @@
+import glob
+import hashlib
+import json
+import os
+import pickle as pk
+import threading
+from src.monitoring.tracing import span
+
+
+_fingerprints = dict()
+_fingerprint_lock = threading.Lock()
+
+
+def _read_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return dict()
+
+
+def file_fingerprint(file, block_size=1 << 20, index_path=None):
+    """
+    Hash the content of a file.
+    The digest is keyed on the file's modification time and size and only recomputed when one of them changes.
+    It is kept in memory and, with index_path, in a JSON index shared between processes.
+
+    Parameters
+    ----------
+    file : str
+        The file path.
+    block_size : int, optional
+        The number of bytes read at a time (default is 1 MiB).
+    index_path : str, optional
+        The JSON file the digests are stored in (default is None, digests are only kept in memory).
+
+    Returns
+    -------
+    fingerprint : str
+        The SHA-256 hex digest of the file content.
+    """
+    path = os.path.abspath(file)
+    stat = os.stat(path)
+    signature = [stat.st_mtime_ns, stat.st_size]
+    with _fingerprint_lock:
+        entry = _fingerprints.get(path)
+        if (entry is None or entry['signature'] != signature) and index_path is not None:
+            entry = _read_index(index_path).get(path)
+        if entry is not None and entry['signature'] == signature:
+            _fingerprints[path] = entry
+            return entry['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        entry = {'signature': signature, 'sha256': digest.hexdigest()}
+        _fingerprints[path] = entry
+        if index_path is not None:
+            index = _read_index(index_path)
+            index[path] = entry
+            os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+            temp_path = f'{index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_path, index_path)
+        return entry['sha256']
+
+
+class Stage:
+    """
+    A node of the data-preparation graph.
+
+    Parameters
+    ----------
+    name : str
+        The unique name of the stage.
+    func : callable
+        The function computing the stage output; it receives the outputs of deps as positional arguments.
+    deps : list, optional
+        The names of the upstream stages (default is no upstream stage).
+    params : dict, optional
+        JSON-serializable parameters that change the output of the stage, e.g. a file fingerprint or a random state.
+    version : int, optional
+        The code version of the stage; bump it whenever func changes its output (default is 1).
+    """
+    def __init__(self, name, func, deps=(), params=None, version=1):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = dict() if params is None else params
+        self.version = version
+
+
+class StageGraph:
+    """
+    A small DAG of data-preparation stages whose outputs are cached on disk.
+
+    The key of a stage is a hash of its name, version and parameters and of the keys of its upstream stages,
+    so it changes whenever anything upstream changes. A stage is only computed when no cached output exists for
+    its key, and its upstream stages are only loaded or computed when it has to run.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory the stage outputs are stored in.
+    enabled : bool, optional
+        If False, every stage is computed and nothing is read from or written to disk (default is True).
+    keep : int, optional
+        The number of cached outputs kept per stage; older ones are removed (default is 3).
+    """
+    def __init__(self, cache_dir, enabled=True, keep=3):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.keep = keep
+        self.stages = dict()
+        self._keys = dict()
+        self._values = dict()
+
+    def add(self, name, func, deps=(), params=None, version=1):
+        """
+        Add a stage to the graph. The upstream stages must have been added before.
+
+        Returns
+        -------
+        graph : StageGraph
+            The graph itself, so calls can be chained.
+        """
+        for dep in deps:
+            if dep not in self.stages:
+                raise KeyError(f'Upstream stage {dep} of {name} is not defined.')
+        self.stages[name] = Stage(name, func, deps, params, version)
+        return self
+
+    def key(self, name):
+        """
+        Return the cache key of a stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+
+        Returns
+        -------
+        key : str
+            The SHA-256 hex digest of the stage definition and of its upstream keys.
+        """
+        if name not in self._keys:
+            stage = self.stages[name]
+            payload = json.dumps({'name': stage.name,
+                                  'version': stage.version,
+                                  'params': stage.params,
+                                  'deps': [self.key(dep) for dep in stage.deps]},
+                                 sort_keys=True, default=repr)
+            self._keys[name] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return self._keys[name]
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, f'{name}-{self.key(name)[:16]}.pkl')
+
+    def get(self, name):
+        """
+        Return the output of a stage, from memory, from the disk cache, or by computing it.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+
+        Returns
+        -------
+        output : object
+            The output of the stage function.
+        """
+        if name in self._values:
+            return self._values[name]
+        path = self._path(name)
+        if self.enabled and os.path.exists(path):
+            print(f'Stage {name} : cached')
+            with span(f'stage.{name}', cached=True):
+                with open(path, 'rb') as f:
+                    value = pk.load(f)
+        else:
+            stage = self.stages[name]
+            inputs = [self.get(dep) for dep in stage.deps]
+            with span(f'stage.{name}', cached=False):
+                value = stage.func(*inputs)
+            print(f'Stage {name} : computed')
+            if self.enabled:
+                self._store(name, path, value)
+        self._values[name] = value
+        return value
+
+    def _store(self, name, path, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            pk.dump(value, f, protocol=pk.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        previous = sorted(glob.glob(os.path.join(self.cache_dir, f'{glob.escape(name)}-*.pkl')),
+                          key=os.path.getmtime, reverse=True)
+        for old_path in previous[self.keep:]:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
@@ -1,82 +1,125 @@
-def feature_engineering(data):
-    """
-    This function works as a data augmentation tool to generate new data sets through feature engineering.
+import numpy as np
+import pandas as pd
 
-    Parameters
-    ----------
-    data : pandas.DataFrame
-        The input dataframe containing the dataset.
 
-    Returns
-    -------
-    df : pandas.DataFrame
-        The dataframe with new features generated through feature engineering.
-    """
-    df = data.copy()
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.true_divide(numerator, denominator)
+
+
+def _ratio_fill_zero(numerator, denominator):
+    ratio = _ratio(numerator, denominator)
+    return np.where(np.isnan(ratio), 0, ratio)
+
+
+def _total(*columns):
+    total = columns[0] + columns[1]
+    for column in columns[2:]:
+        total = total + column
+    return total
+
+
+def _flag(column):
+    return (column > 0).astype(np.int64)
+
+
+# Each entry is (derived column, source columns, function). The functions receive the source columns as NumPy arrays
+# in the given order. Sources may refer to columns derived by earlier entries.
+FEATURE_SPEC = [
     # GarageArea: Size of garage in square feet
     # GarageCars: Size of garage in car capacity
-    df["GarageCarSize"] = (df["GarageArea"] / df["GarageCars"]).fillna(0)
+    ("GarageCarSize", ["GarageArea", "GarageCars"], _ratio_fill_zero),
     # GrLivArea: Above grade (ground) living area square feet
     # TotRmsAbvGrd: Total rooms above grade (does not include bathrooms)
-    df["LivAreaRoomSize"] = df["GrLivArea"] / df["TotRmsAbvGrd"]
+    ("LivAreaRoomSize", ["GrLivArea", "TotRmsAbvGrd"], _ratio),
     # TotalBsmtSF: Total square feet of basement area
     # 1stFlrSF: First Floor square feet
     # 2ndFlrSF: Second floor square feet
-    df["TotalHouseSquareFeet"] = df["TotalBsmtSF"] + df["1stFlrSF"] + df["2ndFlrSF"]
+    ("TotalHouseSquareFeet", ["TotalBsmtSF", "1stFlrSF", "2ndFlrSF"], _total),
     # BsmtFinSF1: Type 1 finished square feet
     # BsmtFinSF2: Type 2 finished square feet
-    df["TotalBasementSquareFeet"] = df['BsmtFinSF1'] + df['BsmtFinSF2']
+    ("TotalBasementSquareFeet", ["BsmtFinSF1", "BsmtFinSF2"], _total),
     # FullBath: Full bathrooms above grade
     # BsmtFullBath: Basement full bathrooms
-    df["TotalFullBathSize"] = df["FullBath"] + df["BsmtFullBath"]
+    ("TotalFullBathSize", ["FullBath", "BsmtFullBath"], _total),
     # HalfBath: Half baths above grade
     # BsmtHalfBath: Basement half bathrooms
-    df["TotalHalfBathSize"] = df["HalfBath"] + df["BsmtHalfBath"]
+    ("TotalHalfBathSize", ["HalfBath", "BsmtHalfBath"], _total),
     # YrSold: Year Sold
     # YearBuilt: Original construction date
-    df["HouseAge"] = df["YrSold"] - df["YearBuilt"]
+    ("HouseAge", ["YrSold", "YearBuilt"], lambda sold, built: sold - built),
     # YrSold: Year Sold
     # YearRemodAdd: Remodel date
-    df["RemodHouseAge"] = df["HouseAge"] - (df["YrSold"] - df["YearRemodAdd"])
+    ("RemodHouseAge", ["HouseAge", "YrSold", "YearRemodAdd"], lambda age, sold, remod: age - (sold - remod)),
     # YearRemodAdd: Remodel date
     # YearBuilt: Original construction date
-    df["IsRemod"] = (df["YearRemodAdd"] - df["YearBuilt"]).apply(lambda x: 1 if x > 0 else 0)
+    ("IsRemod", ["YearRemodAdd", "YearBuilt"], lambda remod, built: _flag(remod - built)),
     # YrSold: Year Sold
     # GarageYrBlt: Year garage was built
-    df["GarageAge"] = df["YrSold"] - df["GarageYrBlt"]
+    ("GarageAge", ["YrSold", "GarageYrBlt"], lambda sold, garage: sold - garage),
     # OverallQual: Overall material and finish quality
     # OverallCond: Overall condition rating
     # The quality of the old and new house may be the same, I have added the age of the house to find the difference.
-    df["YearHouseQuality"] = (df["OverallQual"] + df["OverallCond"]) / 2 + (2010-df['YearBuilt'])
+    ("YearHouseQuality", ["OverallQual", "OverallCond", "YearBuilt"],
+     lambda qual, cond, built: (qual + cond) / 2 + (2010 - built)),
     # WoodDeckSF: Wood deck area in square feet
     # OpenPorchSF: Open porch area in square feet
     # EnclosedPorch: Enclosed porch area in square feet
     # 3SsnPorch: Three season porch area in square feet
     # ScreenPorch: Screen porch area in square feet
-    df['HouseTotalPorchSquareFeet'] = (df['OpenPorchSF']
-                                  + df['3SsnPorch']
-                                  + df['EnclosedPorch']
-                                  + df['ScreenPorch']
-                                  + df['WoodDeckSF']
-                                 )
+    ("HouseTotalPorchSquareFeet", ["OpenPorchSF", "3SsnPorch", "EnclosedPorch", "ScreenPorch", "WoodDeckSF"], _total),
     # PoolArea: Pool area in square feet
-    df['HasPool'] = df['PoolArea'].apply(lambda x: 1 if x > 0 else 0)
+    ("HasPool", ["PoolArea"], _flag),
     # 2ndFlrSF: Second floor square feet
-    df['Has2ndFloor'] = df['2ndFlrSF'].apply(lambda x: 1 if x > 0 else 0)
+    ("Has2ndFloor", ["2ndFlrSF"], _flag),
     # GarageArea: Size of garage in square feet
-    df['HasGarage'] = df['GarageArea'].apply(lambda x: 1 if x > 0 else 0)
-    #TotalBsmtSF: Total square feet of basement area
-    df['HasBasement'] = df['TotalBsmtSF'].apply(lambda x: 1 if x > 0 else 0)
+    ("HasGarage", ["GarageArea"], _flag),
+    # TotalBsmtSF: Total square feet of basement area
+    ("HasBasement", ["TotalBsmtSF"], _flag),
     # Fireplaces: Number of fireplaces
-    df['HasFirePlace'] = df['Fireplaces'].apply(lambda x: 1 if x > 0 else 0)
+    ("HasFirePlace", ["Fireplaces"], _flag),
+]
+
+# Source and intermediate columns that are removed once the derived columns have been computed.
+DROP_COLUMNS = [
+    "GarageArea", "GarageCars", "GrLivArea",
+    "TotRmsAbvGrd", "TotalBsmtSF", "1stFlrSF",
+    "2ndFlrSF", "FullBath", "BsmtFullBath", "HalfBath",
+    "BsmtHalfBath", "YrSold", "YearBuilt", "YearRemodAdd",
+    "GarageYrBlt", "OpenPorchSF", "EnclosedPorch", "3SsnPorch",
+    "ScreenPorch", "OverallQual", "OverallCond", 'Utilities',
+    'Street', 'PoolQC', 'BsmtFinSF1', 'BsmtFinSF2', 'HouseAge', 'WoodDeckSF', 'PoolArea', '2ndFlrSF', 'Fireplaces'
+]
 
-    df = df.drop([
-        "GarageArea", "GarageCars", "GrLivArea", 
-        "TotRmsAbvGrd", "TotalBsmtSF", "1stFlrSF", 
-        "2ndFlrSF", "FullBath", "BsmtFullBath", "HalfBath", 
-        "BsmtHalfBath", "YrSold", "YearBuilt", "YearRemodAdd",
-        "GarageYrBlt", "OpenPorchSF", "EnclosedPorch", "3SsnPorch",
-        "ScreenPorch", "OverallQual", "OverallCond",'Utilities',
-        'Street','PoolQC','BsmtFinSF1','BsmtFinSF2','HouseAge','WoodDeckSF','PoolArea','2ndFlrSF','Fireplaces'
-    ], axis=1)
-    return df
\ No newline at end of file
+
+def feature_engineering(data, spec=FEATURE_SPEC, drop_columns=DROP_COLUMNS):
+    """
+    This function works as a data augmentation tool to generate new data sets through feature engineering.
+    The derived columns are evaluated from the feature spec with NumPy column operations in a single pass
+    and the output dataframe is assembled once, without copying the input dataframe in between.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        The input dataframe containing the dataset.
+    spec : list, optional
+        A list of (derived column, source columns, function) entries (default is FEATURE_SPEC).
+    drop_columns : list, optional
+        A list of columns removed after the derived columns are computed (default is DROP_COLUMNS).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The dataframe with new features generated through feature engineering.
+    """
+    missing = set(drop_columns) - set(data.columns) - {name for name, _, _ in spec}
+    if missing:
+        raise KeyError(f'{sorted(missing)} not found in axis')
+    columns = dict()
+    for name, sources, func in spec:
+        arrays = [columns[col] if col in columns else data[col].to_numpy() for col in sources]
+        columns[name] = func(*arrays)
+    drop = set(drop_columns)
+    output = {col: data[col] for col in data.columns if col not in drop}
+    output.update((name, values) for name, values in columns.items() if name not in drop)
+    return pd.DataFrame(output, index=data.index)
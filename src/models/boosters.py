@@ -0,0 +1,140 @@
+import os
+
+
+def n_workers(n_jobs, n_tasks, cores=None):
+    """
+    Resolve the number of parallel workers.
+
+    Parameters
+    ----------
+    n_jobs : int
+        The requested number of workers; -1 uses all available cores.
+    n_tasks : int
+        The number of tasks to be run; no more workers than tasks are started.
+    cores : int, optional
+        The number of cores the workers may use (default is None, all available cores).
+
+    Returns
+    -------
+    workers : int
+        The number of workers.
+    """
+    cpu_count = cores or os.cpu_count() or 1
+    workers = cpu_count if n_jobs is None or n_jobs < 0 else n_jobs
+    return max(1, min(workers, n_tasks, cpu_count))
+
+
+def threads_per_worker(workers, cores=None):
+    """
+    Split the available cores between parallel workers so that the booster threads do not oversubscribe them.
+
+    Parameters
+    ----------
+    workers : int
+        The number of parallel workers.
+    cores : int, optional
+        The number of cores shared by the workers (default is None, all available cores).
+
+    Returns
+    -------
+    threads : int
+        The number of booster threads each worker may use.
+    """
+    return max(1, (cores or os.cpu_count() or 1) // max(1, workers))
+
+
+def thread_params(model, threads):
+    """
+    Return the parameters that limit the number of threads of a booster.
+
+    Parameters
+    ----------
+    model : estimator object
+        The regression model (XGBRegressor, LGBMRegressor or CatBoostRegressor).
+    threads : int
+        The number of threads the model may use.
+
+    Returns
+    -------
+    params : dict
+        The parameters to be passed to model.set_params.
+    """
+    if type(model).__name__ == 'CatBoostRegressor':
+        return {'thread_count': threads}
+    elif type(model).__name__ in ('XGBRegressor', 'LGBMRegressor'):
+        return {'n_jobs': threads}
+    return {}
+
+
+def early_stopping_fit_params(model, X_val, y_val, rounds):
+    """
+    Return the fit arguments that stop boosting once the validation score has not improved for a number of rounds.
+
+    Parameters
+    ----------
+    model : estimator object
+        The regression model (XGBRegressor, LGBMRegressor or CatBoostRegressor).
+    X_val : pandas.DataFrame
+        The validation features.
+    y_val : pandas.Series
+        The validation target.
+    rounds : int
+        The number of rounds without improvement after which boosting stops.
+
+    Returns
+    -------
+    fit_params : dict
+        The keyword arguments to be passed to model.fit.
+    """
+    if type(model).__name__ in ('XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'):
+        return {'eval_set': [(X_val, y_val)], 'early_stopping_rounds': rounds, 'verbose': False}
+    return {}
+
+
+def warm_start_fit_params(model, init_model):
+    """
+    Return the fit arguments that continue boosting from an existing booster instead of starting from scratch.
+
+    Parameters
+    ----------
+    model : estimator object
+        The regression model (XGBRegressor, LGBMRegressor or CatBoostRegressor).
+    init_model : object
+        The booster to continue from (see serialization.warm_start_source).
+
+    Returns
+    -------
+    fit_params : dict
+        The keyword arguments to be passed to model.fit.
+    """
+    if type(model).__name__ == 'XGBRegressor':
+        return {'xgb_model': init_model}
+    elif type(model).__name__ in ('LGBMRegressor', 'CatBoostRegressor'):
+        return {'init_model': init_model}
+    return {}
+
+
+def best_iteration(model):
+    """
+    Return the number of boosting rounds kept by early stopping.
+
+    Parameters
+    ----------
+    model : estimator object
+        A fitted regression model.
+
+    Returns
+    -------
+    n_estimators : int or None
+        The number of trees up to and including the best iteration, or None if it is not known.
+    """
+    if type(model).__name__ == 'XGBRegressor':
+        best = getattr(model, 'best_iteration', None)
+        return None if best is None else int(best) + 1
+    elif type(model).__name__ == 'LGBMRegressor':
+        best = model.best_iteration_
+        return int(best) if best else None
+    elif type(model).__name__ == 'CatBoostRegressor':
+        best = model.get_best_iteration()
+        return None if best is None else int(best) + 1
+    return None
@@ -0,0 +1,453 @@
+import json
+import os
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+from src.models.serialization import NativeModel, model_feature_names
+
+# LightGBM treats values with an absolute value up to this threshold as zero.
+ZERO_THRESHOLD = 1e-35
+# The number of (row, tree, level) cells evaluated at a time, which bounds the memory of a prediction.
+CHUNK_CELLS = 1 << 22
+# XGBoost and LightGBM objectives whose prediction is the raw sum of the leaf values.
+XGBOOST_OBJECTIVES = ('reg:squarederror', 'reg:linear', 'reg:squaredlogerror', 'reg:pseudohubererror',
+                      'reg:absoluteerror')
+LIGHTGBM_OBJECTIVES = ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape')
+
+
+def _design_array(X, feature_names, dtype, implicit_missing=False):
+    if sp.issparse(X) and implicit_missing:
+        X = X.tocoo()
+        dense = np.full(X.shape, np.nan, dtype=dtype)
+        dense[X.row, X.col] = X.data
+        X = dense
+    elif sp.issparse(X):
+        X = X.toarray()
+    elif hasattr(X, 'columns'):
+        if feature_names is not None and list(X.columns) != feature_names:
+            if set(feature_names).issubset(X.columns):
+                X = X[feature_names]
+            elif X.shape[1] != len(feature_names):
+                raise ValueError(f'The design matrix has {X.shape[1]} columns, the model expects {len(feature_names)}.')
+            # Otherwise the columns are taken by position: LightGBM stores sanitized feature names
+            # (e.g. MSZoning_C__all_ for MSZoning_C_(all)), while the preprocessor returns the columns in training order.
+        X = X.to_numpy()
+    return np.atleast_2d(np.asarray(X, dtype=dtype)).astype(np.float64)
+
+
+class TreeEnsemble:
+    """
+    A tree ensemble flattened into contiguous node arrays, evaluated with vectorized NumPy traversal.
+
+    The nodes of all trees are stored back to back. A row goes to the left child when its feature value is
+    less than or equal to the threshold of the node, and to the default child when the value is missing.
+    Leaves point to themselves, so all trees are traversed in lockstep for depth levels.
+
+    Parameters
+    ----------
+    feature : numpy.ndarray
+        The feature index of every node.
+    threshold : numpy.ndarray
+        The split threshold of every node.
+    left, right : numpy.ndarray
+        The global indices of the children of every node.
+    default_left : numpy.ndarray
+        Whether missing values go to the left child.
+    zero_missing : numpy.ndarray
+        Whether zero is treated as a missing value (LightGBM zero as missing).
+    value : numpy.ndarray
+        The leaf value of every node, zero for internal nodes.
+    roots : numpy.ndarray
+        The global index of the root of every tree.
+    base_score : float
+        The value added to the sum of the leaf values.
+    feature_names : list or None
+        The feature names in training order.
+    input_dtype : numpy.dtype
+        The dtype the features are converted to by the original library before comparing them.
+    implicit_missing : bool, optional
+        Whether the entries missing from a sparse matrix are missing values rather than zeros, as in XGBoost
+        (default is False).
+    """
+    def __init__(self, feature, threshold, left, right, default_left, zero_missing, value, roots,
+                 base_score, feature_names, input_dtype, implicit_missing=False):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.zero_missing = zero_missing
+        self.value = value
+        self.roots = roots
+        self.base_score = base_score
+        self.feature_names = feature_names
+        self.input_dtype = input_dtype
+        self.implicit_missing = implicit_missing
+        self.depth = self._max_depth()
+
+    def _max_depth(self):
+        depth = 0
+        frontier = self.roots
+        while True:
+            frontier = frontier[self.left[frontier] != frontier]
+            if not len(frontier):
+                return depth
+            frontier = np.concatenate([self.left[frontier], self.right[frontier]])
+            depth += 1
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ('feature', 'threshold', 'left', 'right', 'default_left',
+                                                           'zero_missing', 'value', 'roots'))
+
+    def predict(self, X):
+        """
+        Predict the target of a design matrix.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame, numpy.ndarray or scipy.sparse matrix
+            The design matrix.
+
+        Returns
+        -------
+        y_pred : numpy.ndarray
+            The predicted target values.
+        """
+        X = _design_array(X, self.feature_names, self.input_dtype, self.implicit_missing)
+        y_pred = np.full(len(X), self.base_score, dtype=np.float64)
+        chunksize = max(1, CHUNK_CELLS // max(1, len(self.roots)))
+        for start in range(0, len(X), chunksize):
+            X_chunk = X[start:start + chunksize]
+            rows = np.arange(len(X_chunk))[:, None]
+            node = np.repeat(self.roots[None, :], len(X_chunk), axis=0)
+            for _ in range(self.depth):
+                x = X_chunk[rows, self.feature[node]]
+                missing = np.isnan(x) | (self.zero_missing[node] & (np.abs(x) <= ZERO_THRESHOLD))
+                go_left = np.where(missing, self.default_left[node], x <= self.threshold[node])
+                node = np.where(go_left, self.left[node], self.right[node])
+            y_pred[start:start + chunksize] += self.value[node].sum(axis=1)
+        return y_pred
+
+
+class ObliviousEnsemble:
+    """
+    An ensemble of oblivious trees (CatBoost), in which all nodes of a level share one split.
+
+    The leaf of a row is the binary number formed by its split outcomes, so a batch is evaluated with one
+    comparison per (row, tree, level) and one gather of the leaf values. Trees shallower than the deepest tree
+    are padded with splits that are never taken.
+
+    Parameters
+    ----------
+    feature : numpy.ndarray
+        The feature index of every split, of shape (n_trees, depth).
+    border : numpy.ndarray
+        The split borders; a split is taken when the feature value is greater than the border.
+    nan_taken : numpy.ndarray
+        Whether a split is taken when the feature value is missing.
+    leaf_values : numpy.ndarray
+        The leaf values, of shape (n_trees, 2 ** depth).
+    scale, bias : float
+        The prediction is scale * (sum of the leaf values) + bias.
+    feature_names : list or None
+        The feature names in training order.
+    """
+    def __init__(self, feature, border, nan_taken, leaf_values, scale, bias, feature_names):
+        self.feature = feature
+        self.border = border
+        self.nan_taken = nan_taken
+        self.leaf_values = leaf_values
+        self.scale = scale
+        self.bias = bias
+        self.feature_names = feature_names
+        self.input_dtype = np.float32
+        self.powers = 1 << np.arange(feature.shape[1], dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ('feature', 'border', 'nan_taken', 'leaf_values'))
+
+    def predict(self, X):
+        """
+        Predict the target of a design matrix.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame, numpy.ndarray or scipy.sparse matrix
+            The design matrix.
+
+        Returns
+        -------
+        y_pred : numpy.ndarray
+            The predicted target values.
+        """
+        X = _design_array(X, self.feature_names, self.input_dtype)
+        y_pred = np.empty(len(X), dtype=np.float64)
+        trees = np.arange(len(self.leaf_values))
+        chunksize = max(1, CHUNK_CELLS // max(1, self.feature.size))
+        for start in range(0, len(X), chunksize):
+            x = X[start:start + chunksize][:, self.feature]
+            taken = np.where(np.isnan(x), self.nan_taken, x > self.border)
+            leaves = taken.astype(np.int64) @ self.powers
+            y_pred[start:start + chunksize] = self.leaf_values[trees, leaves].sum(axis=1)
+        return self.scale * y_pred + self.bias
+
+
+def _concatenate_trees(trees):
+    """
+    Concatenate per-tree node arrays whose leaves have -1 children into global node arrays with self-looping leaves.
+    """
+    offsets = np.cumsum([0] + [len(tree['left']) for tree in trees])
+    arrays = dict()
+    for name in ('feature', 'threshold', 'default_left', 'zero_missing', 'value'):
+        arrays[name] = np.concatenate([tree[name] for tree in trees])
+    for name in ('left', 'right'):
+        children = []
+        for offset, tree in zip(offsets, trees):
+            nodes = np.arange(len(tree[name]), dtype=np.int64)
+            children.append(np.where(tree[name] < 0, nodes, tree[name]) + offset)
+        arrays[name] = np.concatenate(children)
+    arrays['feature'] = np.where(arrays['left'] == np.arange(len(arrays['left'])), 0, arrays['feature'])
+    arrays['roots'] = offsets[:-1].astype(np.int64)
+    return arrays
+
+
+def _export_xgboost(booster, n_trees, feature_names):
+    model = json.loads(bytes(booster.save_raw(raw_format='json')))
+    learner = model['learner']
+    objective = learner['objective']['name']
+    if learner['gradient_booster']['name'] != 'gbtree' or objective not in XGBOOST_OBJECTIVES:
+        raise ValueError(f'XGBoost models with the {objective} objective and the '
+                         f'{learner["gradient_booster"]["name"]} booster cannot be compiled.')
+    gbtree = learner['gradient_booster']['model']
+    trees = gbtree['trees']
+    if n_trees is not None:
+        trees = trees[:n_trees * int(gbtree['gbtree_model_param'].get('num_parallel_tree', 1))]
+    nodes = []
+    for tree in trees:
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        condition = np.asarray(tree['split_conditions'], dtype=np.float32)
+        leaf = left < 0
+        nodes.append({
+            'feature': np.asarray(tree['split_indices'], dtype=np.int64),
+            # XGBoost goes left when x < condition in float32, i.e. when x <= the next float32 below condition.
+            'threshold': np.nextafter(condition, np.float32(-np.inf)).astype(np.float64),
+            'left': left,
+            'right': np.asarray(tree['right_children'], dtype=np.int64),
+            'default_left': np.asarray(tree['default_left'], dtype=bool),
+            'zero_missing': np.zeros(len(left), dtype=bool),
+            # The split condition of a leaf holds its value.
+            'value': np.where(leaf, condition, 0).astype(np.float64),
+        })
+    arrays = _concatenate_trees(nodes)
+    return TreeEnsemble(base_score=float(learner['learner_model_param']['base_score']),
+                        feature_names=feature_names, input_dtype=np.float32, implicit_missing=True, **arrays)
+
+
+def _lightgbm_tree(structure):
+    feature, threshold, left, right, default_left, zero_missing, value = [], [], [], [], [], [], []
+    stack = [(structure, None, None)]
+    while stack:
+        node, parent, side = stack.pop()
+        index = len(feature)
+        if parent is not None:
+            (left if side == 'left' else right)[parent] = index
+        feature.append(node.get('split_feature', 0))
+        threshold.append(0.0)
+        left.append(-1)
+        right.append(-1)
+        default_left.append(False)
+        zero_missing.append(False)
+        value.append(node.get('leaf_value', 0.0))
+        if 'leaf_value' in node:
+            continue
+        if node['decision_type'] != '<=':
+            raise ValueError('LightGBM models with categorical splits cannot be compiled.')
+        threshold[index] = float(node['threshold'])
+        missing_type = node.get('missing_type', 'None')
+        if missing_type == 'None':
+            # Missing values are compared as zeros.
+            default_left[index] = 0.0 <= threshold[index]
+        else:
+            default_left[index] = bool(node['default_left'])
+            zero_missing[index] = missing_type == 'Zero'
+        stack.append((node['right_child'], index, 'right'))
+        stack.append((node['left_child'], index, 'left'))
+    return {'feature': np.asarray(feature, dtype=np.int64), 'threshold': np.asarray(threshold, dtype=np.float64),
+            'left': np.asarray(left, dtype=np.int64), 'right': np.asarray(right, dtype=np.int64),
+            'default_left': np.asarray(default_left, dtype=bool),
+            'zero_missing': np.asarray(zero_missing, dtype=bool), 'value': np.asarray(value, dtype=np.float64)}
+
+
+def _export_lightgbm(booster, n_trees, feature_names):
+    model = booster.dump_model(num_iteration=n_trees)
+    objective = model.get('objective', 'regression').split()[0]
+    if objective not in LIGHTGBM_OBJECTIVES or model.get('average_output', False):
+        raise ValueError(f'LightGBM models with the {objective} objective cannot be compiled.')
+    arrays = _concatenate_trees([_lightgbm_tree(tree['tree_structure']) for tree in model['tree_info']])
+    return TreeEnsemble(base_score=0.0, feature_names=feature_names, input_dtype=np.float64, **arrays)
+
+
+def _export_catboost(model, feature_names):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.json')
+        model.save_model(path, format='json')
+        with open(path) as f:
+            dump = json.load(f)
+    float_features = {feature['feature_index']: feature for feature in dump['features_info']['float_features']}
+    trees = dump['oblivious_trees']
+    depth = max([len(tree['splits']) for tree in trees] + [0])
+    feature = np.zeros((len(trees), depth), dtype=np.int64)
+    border = np.full((len(trees), depth), np.inf, dtype=np.float64)
+    nan_taken = np.zeros((len(trees), depth), dtype=bool)
+    leaf_values = np.zeros((len(trees), 1 << depth), dtype=np.float64)
+    for tree_no, tree in enumerate(trees):
+        for level, split in enumerate(tree['splits']):
+            if split.get('split_type', 'FloatFeature') != 'FloatFeature':
+                raise ValueError('CatBoost models with categorical or text features cannot be compiled.')
+            info = float_features[split['float_feature_index']]
+            feature[tree_no, level] = info['flat_feature_index']
+            border[tree_no, level] = np.float32(split['border'])
+            nan_taken[tree_no, level] = info.get('nan_value_treatment') == 'AsTrue'
+        leaf_values[tree_no, :len(tree['leaf_values'])] = tree['leaf_values']
+    scale, bias = dump.get('scale_and_bias', [1.0, [0.0]])
+    bias = bias[0] if isinstance(bias, list) else bias
+    return ObliviousEnsemble(feature, border, nan_taken, leaf_values, float(scale), float(bias), feature_names)
+
+
+def compile_model(model):
+    """
+    Flatten a trained booster into contiguous NumPy arrays that are evaluated without the library wrapper.
+
+    Parameters
+    ----------
+    model : NativeModel or estimator object
+        A model loaded by serialization.load_model, or a fitted XGBRegressor, LGBMRegressor or CatBoostRegressor.
+
+    Returns
+    -------
+    compiled : TreeEnsemble or ObliviousEnsemble
+        The compiled ensemble; its predict method gives the predictions of the original model.
+    """
+    if isinstance(model, NativeModel):
+        model_type, booster = model.model_type, model.booster
+        n_trees, feature_names = model.manifest['n_trees'], model.feature_names
+    else:
+        from src.models.boosters import best_iteration
+        model_type, n_trees, feature_names = type(model).__name__, best_iteration(model), model_feature_names(model)
+        if model_type == 'XGBRegressor':
+            booster = model.get_booster()
+        elif model_type == 'LGBMRegressor':
+            booster = model.booster_
+        else:
+            booster = model
+    if model_type == 'XGBRegressor':
+        return _export_xgboost(booster, n_trees, feature_names)
+    elif model_type == 'LGBMRegressor':
+        return _export_lightgbm(booster, n_trees, feature_names)
+    elif model_type == 'CatBoostRegressor':
+        return _export_catboost(booster, feature_names)
+    raise ValueError(f'Unknown model {model_type}.')
+
+
+def check_compiled(model, compiled, X, rtol=1e-5, atol=1e-3):
+    """
+    Compare the predictions of a compiled ensemble with the ones of the original model.
+
+    Parameters
+    ----------
+    model : object
+        The original model.
+    compiled : TreeEnsemble or ObliviousEnsemble
+        The compiled ensemble.
+    X : pandas.DataFrame, numpy.ndarray or scipy.sparse matrix
+        The design matrix the predictions are compared on.
+    rtol, atol : float, optional
+        The relative and absolute tolerances (default are 1e-5 and 1e-3).
+
+    Returns
+    -------
+    max_difference : float
+        The largest absolute difference between the predictions.
+    """
+    expected = np.asarray(model.predict(X), dtype=np.float64)
+    actual = compiled.predict(X)
+    if not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        raise ValueError(f'Compiled predictions differ from the model by up to {np.max(np.abs(actual - expected))}.')
+    return float(np.max(np.abs(actual - expected))) if len(expected) else 0.0
+
+
+def _split_values(compiled):
+    """
+    Return, for every feature, the split values of a compiled ensemble and the next float above each of them.
+    """
+    if isinstance(compiled, TreeEnsemble):
+        internal = compiled.left != np.arange(len(compiled.left))
+        feature, value = compiled.feature[internal], compiled.threshold[internal]
+    else:
+        split = np.isfinite(compiled.border)
+        feature, value = compiled.feature[split], compiled.border[split]
+    value = value.astype(compiled.input_dtype)
+    value = np.concatenate([value, np.nextafter(value, np.asarray(np.inf, dtype=compiled.input_dtype))])
+    return np.concatenate([feature, feature]), value.astype(np.float64)
+
+
+def probe_matrix(compiled, n_rows=512, seed=33):
+    """
+    Build a design matrix whose values lie on both sides of the split values of a compiled ensemble,
+    with missing values and zeros mixed in, so that every branch direction is exercised.
+
+    Parameters
+    ----------
+    compiled : TreeEnsemble or ObliviousEnsemble
+        The compiled ensemble.
+    n_rows : int, optional
+        The number of rows (default is 512).
+    seed : int, optional
+        The random seed (default is 33).
+
+    Returns
+    -------
+    X : numpy.ndarray
+        The float64 probe matrix, with the columns in training order.
+    """
+    feature, value = _split_values(compiled)
+    n_features = len(compiled.feature_names) if compiled.feature_names is not None else int(feature.max(initial=-1)) + 1
+    rng = np.random.RandomState(seed)
+    X = np.zeros((n_rows, n_features), dtype=np.float64)
+    order = np.argsort(feature, kind='stable')
+    bounds = np.searchsorted(feature[order], np.arange(n_features + 1))
+    for col in range(n_features):
+        candidates = np.concatenate([value[order[bounds[col]:bounds[col + 1]]], [0.0, np.nan]])
+        X[:, col] = candidates[rng.randint(0, len(candidates), n_rows)]
+    return X
+
+
+def verify_compiled(model, compiled, n_rows=512, rtol=1e-5, atol=1e-3):
+    """
+    Check that a compiled ensemble gives the predictions of the original model on a probe matrix (see probe_matrix).
+
+    Parameters
+    ----------
+    model : NativeModel or estimator object
+        The original model.
+    compiled : TreeEnsemble or ObliviousEnsemble
+        The compiled ensemble.
+    n_rows : int, optional
+        The number of probe rows (default is 512).
+    rtol, atol : float, optional
+        The relative and absolute tolerances (default are 1e-5 and 1e-3).
+
+    Returns
+    -------
+    max_difference : float
+        The largest absolute difference between the predictions.
+    """
+    X = probe_matrix(compiled, n_rows)
+    if not isinstance(model, NativeModel) and compiled.feature_names is not None:
+        import pandas as pd
+        # The scikit-learn wrappers check the feature names of the data they were fitted on.
+        X = pd.DataFrame(X, columns=compiled.feature_names)
+    return check_compiled(model, compiled, X, rtol=rtol, atol=atol)
+
@@ -1,31 +1,82 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import shap
-from sklearn.model_selection import train_test_split
+import xgboost as xgb_lib
+from joblib import Parallel, delayed
 from xgboost import XGBRegressor
-from src.data.preprocess_data import pipeline_build
+from src.data.design_matrix import take_rows
+from src.models.boosters import threads_per_worker
 from src.models.metrics import regression_calculate_scores
+from src.monitoring.tracing import traced, annotate, shape_attributes
+from paths import Path
 
-def shap_importance(df,target,missing_num_cols,ordinal_col,cat_col,plot=False):
+# The probe model of the full selection mode.
+FULL_PROBE_PARAMS = {
+    'random_state': 33,
+    'n_estimators': 1000,
+    'max_depth': 8,
+    'learning_rate': 0.01,
+    'gamma': 0.2,
+    'min_child_weight': 4,
+    'subsample': 1,
+    'colsample_bytree': 1
+}
+
+def _contributions(model, X, native, threads=None):
+    if native:
+        booster = model.get_booster()
+        if threads is not None:
+            booster.set_param({'nthread': threads})
+        # The last column of pred_contribs is the bias term.
+        return booster.predict(xgb_lib.DMatrix(X), pred_contribs=True)[:, :-1]
+    import shap
+    return shap.TreeExplainer(model).shap_values(X)
+
+def _mean_abs_contributions(model, X, native, n_jobs):
+    bounds = np.linspace(0, X.shape[0], max(1, n_jobs) + 1).astype(int)
+    chunks = [take_rows(X, np.arange(start, end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    if len(chunks) == 1:
+        return np.abs(_contributions(model, X, native)).mean(axis=0)
+    # Each chunk's booster gets its share of the cores, so that the processes do not oversubscribe them.
+    threads = threads_per_worker(len(chunks))
+    contributions = Parallel(n_jobs=len(chunks))(delayed(_contributions)(model, chunk, native, threads)
+                                                 for chunk in chunks)
+    return np.abs(np.vstack(contributions)).mean(axis=0)
+
+@traced('shap_importance')
+def shap_importance(X_train,X_test,y_train,y_test,plot=False,fast=Path.shap_fast,sample_size=Path.shap_sample_size,
+                    probe_params=None,native=True,n_jobs=Path.shap_n_jobs,feature_names=None):
     """
         Calculate feature importances using SHAP values for an XGBoost model.
+        Fast mode is opt-in: a smaller probe model is fitted and the contributions are computed on a row sample of the
+        holdout, so the selected columns may differ from the full mode. The contributions can come from XGBoost's
+        native pred_contribs output instead of shap.TreeExplainer and can be computed in parallel over row chunks.
+        The ranking is cached by the shap stage of the data-preparation graph (see dataset_source.data_build_graph).
 
         Parameters
         ----------
-        df : pandas.DataFrame
-            The input dataframe containing the features and target variable.
-        target : str
-            The name of the target variable column in the dataframe.
-        missing_num_cols : list
-            A list of columns with missing numerical values.
-        ordinal_col : list
-            A list of ordinal columns.
-        cat_col : list
-            A list of categorical columns.
+        X_train : pandas.DataFrame or scipy.sparse matrix
+            The processed training dataset (output of pipeline_build).
+        X_test : pandas.DataFrame or scipy.sparse matrix
+            The processed holdout dataset the SHAP values are computed on.
+        y_train : pandas.Series
+            The target column of the training dataset.
+        y_test : pandas.Series
+            The target column of the holdout dataset.
         plot : bool, optional
             If True, a bar plot of feature importances will be shown. Default is False.
+        fast : bool, optional
+            If True, use the probe model and the row sample. Default is Path.shap_fast.
+        sample_size : int, optional
+            The number of holdout rows the contributions are computed on in fast mode. Default is Path.shap_sample_size.
+        probe_params : dict, optional
+            The XGBoost parameters of the probe model in fast mode. Default is Path.shap_probe_params.
+        native : bool, optional
+            If True, use the booster's native contribution output, otherwise shap.TreeExplainer. Default is True.
+        n_jobs : int, optional
+            The number of row chunks computed in parallel processes, each with its share of the booster threads.
+            Default is Path.shap_n_jobs.
+        feature_names : list, optional
+            The column names of a sparse design matrix. Default is None, the dataframe columns are used.
 
         Returns
         -------
@@ -33,40 +84,31 @@ def shap_importance(df,target,missing_num_cols,ordinal_col,cat_col,plot=False):
             If plot=False, returns a dataframe containing feature importances based on SHAP values.
             If plot=True, returns None and displays a bar plot of feature importances.
         """
-    X_train, X_test, y_train, y_test = train_test_split(df.drop(target, axis=1),
-                                                        df[target],
-                                                        test_size=0.2,
-                                                        random_state=33)
-    X_train, X_test = pipeline_build(X_train, X_test, missing_num_cols, ordinal_col, cat_col)
-    xgb_params = {
-        'random_state': 33,
-        'n_estimators': 1000,
-        'max_depth': 8,
-        'learning_rate': 0.01,
-        'gamma': 0.2,
-        'min_child_weight': 4,
-        'subsample': 1,
-        'colsample_bytree': 1
-    }
-
+    if fast:
+        xgb_params = dict(Path.shap_probe_params if probe_params is None else probe_params)
+        if sample_size is not None and X_test.shape[0] > sample_size:
+            positions = np.sort(np.random.RandomState(33).choice(X_test.shape[0], sample_size, replace=False))
+            X_test, y_test = take_rows(X_test, positions), y_test.iloc[positions]
+    else:
+        xgb_params = dict(FULL_PROBE_PARAMS)
+    annotate(**shape_attributes(X_test), train_rows=X_train.shape[0], threads=n_jobs, fast=fast)
     xgb = XGBRegressor(**xgb_params)
     xgb.fit(X_train, y_train)
     y_pred = xgb.predict(X_test)
     scores = regression_calculate_scores(y_test, y_pred, X_train)
     print("SHAP")
     print(scores)
-    explainer = shap.TreeExplainer(xgb)
-    shap_values = explainer.shap_values(X_test)
-
-    shap_values_mean_abs = np.abs(shap_values).mean(axis=0)
+    shap_values_mean_abs = _mean_abs_contributions(xgb, X_test, native, n_jobs)
     shap_values_df = pd.DataFrame(shap_values_mean_abs,
                                   columns=['importance'],
-                                  index=X_test.columns)
+                                  index=X_test.columns if feature_names is None else feature_names)
 
     shap_values_df.sort_values('importance',
                                ascending=False,
                                inplace=True)
     if plot:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
         plt.figure(figsize=(14, 100))
 
         sns.barplot(x='importance',
@@ -1,14 +1,185 @@
+import os
+import hashlib
 import numpy as np
+import pandas as pd
 from sklearn.metrics import mean_squared_error
 import optuna
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
 import copy
-def optuna_optimize(X, y, model, fold_object,step):
+from joblib import Parallel, delayed
+from src.data.design_matrix import is_sparse, take_rows
+from src.models.boosters import n_workers, threads_per_worker, thread_params, early_stopping_fit_params, best_iteration
+from src.monitoring.tracing import traced, annotate, shape_attributes
+from paths import Path
+
+
+# Pruned trials count towards the trial budget, as they do for study.optimize(n_trials=step).
+FINISHED_STATES = (TrialState.COMPLETE, TrialState.PRUNED)
+
+
+def get_storage(storage_path):
+    """
+        Create the Optuna storage used to share a study between processes and machines.
+
+        Parameters
+        ----------
+        storage_path : str or None
+            File path of the study store. Files ending with .db, .sqlite or .sqlite3 are opened as SQLite databases,
+            any other path as an append-only journal file, which is also safe on a directory shared by several machines.
+            If None, the study is kept in memory.
+
+        Returns
+        -------
+        storage : optuna.storages.BaseStorage or None
+            The storage object, or None for an in-memory study.
+        """
+    if storage_path is None:
+        return None
+    directory = os.path.dirname(storage_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if storage_path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return optuna.storages.RDBStorage(f'sqlite:///{storage_path}',
+                                          engine_kwargs={'connect_args': {'timeout': 60}})
+    return optuna.storages.JournalStorage(optuna.storages.JournalFileStorage(storage_path))
+
+
+def get_pruner(name, n_folds, n_trials=None):
+    """
+        Create the pruner that stops unpromising trials after a fold.
+        A trial is only pruned against trials that finished before it, so with a budget of one trial
+        (the default Path.hyperparameter_trial_number) pruning does nothing.
+
+        Parameters
+        ----------
+        name : str or None
+            'median' for a MedianPruner, 'hyperband' for a HyperbandPruner with the folds as resource, None for no pruning.
+        n_folds : int
+            The number of cross-validation folds, i.e. the number of intermediate values reported per trial.
+        n_trials : int, optional
+            The trial budget of the study. The MedianPruner waits for a quarter of it, at most 5 trials,
+            before it prunes (default is None, 5 trials).
+
+        Returns
+        -------
+        pruner : optuna.pruners.BasePruner
+            The pruner.
+        """
+    if name is None:
+        return optuna.pruners.NopPruner()
+    if name == 'median':
+        n_startup_trials = 5 if n_trials is None else min(5, max(1, n_trials // 4))
+        return optuna.pruners.MedianPruner(n_startup_trials=n_startup_trials, n_warmup_steps=0)
+    if name == 'hyperband':
+        return optuna.pruners.HyperbandPruner(min_resource=1, max_resource=n_folds)
+    raise ValueError(f'Unknown pruner {name}.')
+
+
+def study_fingerprint(X, y, fold_object):
+    """
+        Fingerprint the data and the folds a study is run on, so that a stored study is only resumed on the same inputs.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame or scipy.sparse matrix
+            The input dataframe containing the features.
+        y : pandas.Series
+            The target variable series.
+        fold_object : cross-validation object
+            The cross-validation object used for training and validation; its parameters are part of the fingerprint.
+
+        Returns
+        -------
+        fingerprint : str
+            A 12-character hexadecimal digest.
+        """
+    digest = hashlib.sha1()
+    if is_sparse(X):
+        X = X.tocsr()
+        digest.update(str(X.shape).encode())
+        for array in (X.data, X.indices, X.indptr):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        digest.update(','.join(map(str, X.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    digest.update(repr(fold_object).encode())
+    return digest.hexdigest()[:12]
+
+
+def _objective(trial, X, y, model, fold_object):
+    params = {
+        'learning_rate': trial.suggest_float('learning_rate',0.0005, 0.5,step=0.01),
+        'n_estimators': trial.suggest_int('n_estimators',10, 3000,step=10),
+        'max_bin': trial.suggest_int('max_bin',16, 2048,step=16),
+        'subsample': trial.suggest_float('subsample', 0.1, 1,step=0.1),
+    }
+    if type(model).__name__ == 'CatBoostRegressor':
+        params.update({
+            'colsample_bylevel': trial.suggest_float('colsample_bylevel', 0.1, 1, step=0.1),
+            'loss_function' : 'RMSE',
+            'max_depth': trial.suggest_int('max_depth', 6, 10),
+            'random_seed': 33,
+            'verbose': False
+        })
+    elif type(model).__name__ == 'XGBRegressor':
+        params.update({
+            'colsample_bylevel' : trial.suggest_float('colsample_bylevel', 0.1, 1, step=0.1),
+            'max_depth' : trial.suggest_int('max_depth', 1, 16, step=1),
+            'verbosity': 0
+        })
+    elif type(model).__name__ == 'LGBMRegressor':
+        params.update({
+            'colsample_bytree': trial.suggest_float('colsample_bytree', 0.1, 1, step=0.1),
+            'verbosity': 0,
+        })
+    liste = []
+    best_iterations = []
+    for fold_no, (train_index, test_index) in enumerate(fold_object.split(X, y)):
+        X_train, X_test = take_rows(X, train_index), take_rows(X, test_index)
+        y_train, y_test = y.iloc[train_index], y.iloc[test_index]
+        model_copy = copy.deepcopy(model)
+        model_copy.set_params(**params)
+        model_copy.fit(X_train, y_train,
+                       **early_stopping_fit_params(model_copy, X_test, y_test, Path.optuna_early_stopping_rounds))
+        liste.append(np.sqrt(mean_squared_error(y_test, model_copy.predict(X_test))))
+        n_estimators = best_iteration(model_copy)
+        if n_estimators is not None:
+            best_iterations.append(n_estimators)
+            trial.set_user_attr('n_estimators', int(round(np.mean(best_iterations))))
+        trial.report(np.mean(liste), fold_no)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+    return np.mean(liste)
+
+
+def _optimize_worker(X, y, model, fold_object, step, study_name, storage_path, pruner, threads=None):
+    study = optuna.load_study(study_name=study_name, storage=get_storage(storage_path),
+                              pruner=get_pruner(pruner, fold_object.get_n_splits(), step))
+    if threads is not None:
+        model = copy.deepcopy(model)
+        model.set_params(**thread_params(model, threads))
+    study.optimize(lambda trial: _objective(trial, X, y, model, fold_object),
+                   callbacks=[MaxTrialsCallback(step, states=FINISHED_STATES)])
+
+
+@traced('optuna_optimize')
+def optuna_optimize(X, y, model, fold_object,step,storage_path=None,n_jobs=1,study_name=None,pruner=Path.optuna_pruner,
+                    cores=None):
     """
         Perform hyperparameter optimization using Optuna for a given regression model.
+        With a storage path the study is persisted, so an interrupted run resumes where it stopped,
+        trials run in parallel worker processes and workers on other machines sharing the same path
+        can join the study. The study stops once it holds step finished trials in total.
+        The fingerprint of the data and the folds (see study_fingerprint) is stored with the study; without a study name
+        it is also part of the name, so changed data or folds start a new study instead of returning the old results.
+        Every fit stops early on the fold's validation set, the running mean RMSE is reported after each fold
+        and unpromising trials are pruned. The tuned n_estimators is the mean best iteration of the best trial.
 
         Parameters
         ----------
-        X : pandas.DataFrame
+        X : pandas.DataFrame or scipy.sparse matrix
             The input dataframe containing the features.
         y : pandas.Series
             The target variable series.
@@ -18,6 +189,18 @@ def optuna_optimize(X, y, model, fold_object,step):
             The cross-validation object used for training and validation.
         step : int
             The number of optimization steps or trials to perform.
+        storage_path : str, optional
+            File path of the journal or SQLite study store (default is None, an in-memory study).
+        n_jobs : int, optional
+            The number of worker processes running trials; -1 uses all cores.
+            It is only used together with storage_path (default is 1).
+        study_name : str, optional
+            The name of a study shared on purpose, e.g. by several machines; it must have been run on the same data
+            and folds (default is "regression_<model name>_<fingerprint>").
+        pruner : str, optional
+            'median', 'hyperband' or None (default is Path.optuna_pruner).
+        cores : int, optional
+            The number of cores the worker processes share (default is None, all available cores).
 
         Returns
         -------
@@ -27,44 +210,36 @@ def optuna_optimize(X, y, model, fold_object,step):
             The best value (score) achieved by the optimized model.
         """
     print("Model : ", type(model).__name__)
-    def objective(trial):
-        params = {
-            'learning_rate': trial.suggest_float('learning_rate',0.0005, 0.5,step=0.01),
-            'n_estimators': trial.suggest_int('n_estimators',0, 3000,step=10),
-            'max_bin': trial.suggest_int('max_bin',16, 2048,step=16),
-            'subsample': trial.suggest_float('subsample', 0.1, 1,step=0.1),
-        }
-        if type(model).__name__ == 'CatBoostRegressor':
-            params.update({
-                'colsample_bylevel': trial.suggest_float('colsample_bylevel', 0.1, 1, step=0.1),
-                'loss_function' : 'RMSE',
-                'max_depth': trial.suggest_int('max_depth', 6, 10),
-                'random_seed': 33,
-                'verbose': False
-            })
-        elif type(model).__name__ == 'XGBRegressor':
-            params.update({
-                'colsample_bylevel' : trial.suggest_float('colsample_bylevel', 0.1, 1, step=0.1),
-                'max_depth' : trial.suggest_int('max_depth', 1, 16, step=1),
-                'verbosity': 0
-            })
-        elif type(model).__name__ == 'LGBMRegressor':
-            params.update({
-                'colsample_bytree': trial.suggest_float('colsample_bytree', 0.1, 1, step=0.1),
-                'verbosity': 0,
-            })
-        liste = []
-        for fold_no, (train_index, test_index) in enumerate(fold_object.split(X, y)):
-            X_train, X_test = X.iloc[train_index], X.iloc[test_index]
-            y_train, y_test = y.iloc[train_index], y.iloc[test_index]
-            model_copy = copy.deepcopy(model)
-            model_copy.set_params(**params)
-            model_copy.fit(X_train, y_train)
-            liste.append(np.sqrt(mean_squared_error(y_test, model_copy.predict(X_test))))
-        return np.mean(liste)
-
-    study = optuna.create_study(direction='minimize', study_name='regression')
-    study.optimize(objective, n_trials=step)
-    print(f"Best Params : {study.best_params}",
+    annotate(**shape_attributes(X), model=type(model).__name__, trials=step)
+    fingerprint = study_fingerprint(X, y, fold_object)
+    if study_name is None:
+        study_name = f'regression_{type(model).__name__}_{fingerprint}'
+    study = optuna.create_study(direction='minimize', study_name=study_name,
+                                storage=get_storage(storage_path), load_if_exists=True,
+                                pruner=get_pruner(pruner, fold_object.get_n_splits(), step))
+    stored_fingerprint = study.user_attrs.get('fingerprint')
+    if stored_fingerprint is None:
+        study.set_user_attr('fingerprint', fingerprint)
+    elif stored_fingerprint != fingerprint:
+        raise ValueError(f'Study {study_name} was run on other data or folds (fingerprint {stored_fingerprint}, '
+                         f'expected {fingerprint}). Use another study name.')
+    if storage_path is None:
+        study.optimize(lambda trial: _objective(trial, X, y, model, fold_object), n_trials=step)
+    else:
+        completed = len(study.get_trials(deepcopy=False, states=FINISHED_STATES))
+        print(f"Study {study_name} : {completed} finished trials found in {storage_path}")
+        if completed < step:
+            workers = n_workers(n_jobs, step - completed, cores)
+            threads = threads_per_worker(workers, cores) if workers > 1 or cores is not None else None
+            annotate(workers=workers, threads=threads)
+            Parallel(n_jobs=workers)(
+                delayed(_optimize_worker)(X, y, model, fold_object, step, study_name, storage_path, pruner, threads)
+                for _ in range(workers))
+            study = optuna.load_study(study_name=study_name, storage=get_storage(storage_path))
+    annotate(best_value=study.best_value)
+    best_params = dict(study.best_params)
+    if 'n_estimators' in study.best_trial.user_attrs:
+        best_params['n_estimators'] = study.best_trial.user_attrs['n_estimators']
+    print(f"Best Params : {best_params}",
           f"Best Value : {study.best_value}")
-    return study.best_params, study.best_value
+    return best_params, study.best_value
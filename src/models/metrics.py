@@ -10,7 +10,7 @@ def regression_calculate_scores(y_test,y_pred,X_train):
             The true target values of the test set.
         y_pred : array-like
             The predicted target values from the model.
-        X_train : pandas.DataFrame
+        X_train : pandas.DataFrame or scipy.sparse matrix
             The training data used for the model.
 
         Returns
@@ -22,5 +22,5 @@ def regression_calculate_scores(y_test,y_pred,X_train):
               'MAE' : mean_absolute_error(y_test, y_pred),
               'RMSLE' : mean_squared_log_error(y_test, y_pred),
               'R2' : r2_score(y_test, y_pred),
-              'Adj R2' : 1 - (1 - (r2_score(y_test, y_pred))) * (X_train.shape[0] - 1) / (X_train.shape[0] - len(X_train.columns.tolist()) - 1)}
+              'Adj R2' : 1 - (1 - (r2_score(y_test, y_pred))) * (X_train.shape[0] - 1) / (X_train.shape[0] - X_train.shape[1] - 1)}
     return scores
\ No newline at end of file
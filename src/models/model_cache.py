@@ -0,0 +1,185 @@
+import os
+import pickle as pk
+import threading
+from collections import OrderedDict
+from src.models.serialization import load_model, model_path, load_ensemble_manifest
+from paths import Path
+
+
+class ModelCache:
+    """
+    Process-wide LRU cache of deserialized models.
+
+    Entries are keyed on the model name and the file path, and every lookup compares the file's mtime and size
+    with the ones recorded at load time, so a model replaced on disk (e.g. a new best_fold written by
+    Trainer.train) is reloaded automatically. Least recently used models are evicted once the estimated
+    memory of the cached models exceeds max_bytes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The memory cap of the cache in bytes.
+    loader : callable, optional
+        The function used to deserialize a model file (default is serialization.load_model).
+    """
+    def __init__(self, max_bytes, loader=load_model):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _estimate_size(model):
+        if hasattr(model, 'nbytes'):
+            return model.nbytes
+        try:
+            return len(pk.dumps(model, protocol=pk.HIGHEST_PROTOCOL))
+        except Exception:
+            return 0
+
+    @property
+    def current_bytes(self):
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values())
+
+    def get(self, name, path):
+        """
+        Return the model stored at path, loading it only if it is not cached or the file has changed.
+
+        Parameters
+        ----------
+        name : str
+            The name of the model (e.g. "XGBRegressor").
+        path : str
+            The file path of the serialized model.
+
+        Returns
+        -------
+        model : object
+            The deserialized model.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'Best model for {name} could not be found.')
+        key = (name, os.path.abspath(path))
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['signature'] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['model']
+            self.misses += 1
+            self._entries.pop(key, None)
+            model = self.loader(path)
+            self._entries[key] = {'signature': signature, 'model': model, 'size': self._estimate_size(model)}
+            self._evict(keep=key)
+            return model
+
+    def _evict(self, keep):
+        total = sum(entry['size'] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)['size']
+
+    def invalidate(self, name=None):
+        """
+        Drop cached models.
+
+        Parameters
+        ----------
+        name : str, optional
+            The name of the model to drop. If None, the whole cache is cleared (default is None).
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if name is None or key[0] == name:
+                    del self._entries[key]
+
+
+def load_compiled_model(file):
+    """
+    Load a saved model and flatten it into the arrays of a compiled ensemble (see compiled_predictor.compile_model).
+    The compiled ensemble is checked against the loaded model on a probe matrix covering its split values, and a
+    ValueError is raised instead of returning an ensemble whose predictions differ.
+    """
+    from src.models.compiled_predictor import compile_model, verify_compiled
+    model = load_model(file)
+    compiled = compile_model(model)
+    try:
+        verify_compiled(model, compiled)
+    except ValueError as error:
+        raise ValueError(f'The compiled predictor of {file} does not match the model and is not used: {error}') from error
+    return compiled
+
+
+model_cache = ModelCache(Path.model_cache_max_bytes)
+compiled_model_cache = ModelCache(Path.compiled_model_cache_max_bytes, loader=load_compiled_model)
+
+
+def get_model(model):
+    """
+    Return the best-fold model of the given model type from the process-wide cache.
+    The native model is loaded through its manifest; models saved before the native format are read from best_fold.gz.
+
+    Parameters
+    ----------
+    model : str
+        The name of the pre-trained model to load.
+
+    Returns
+    -------
+    model : object
+        The best-fold model.
+    """
+    return model_cache.get(model, model_path(os.path.join(Path.models_path, model, 'best_fold')))
+
+
+def get_compiled_model(model):
+    """
+    Return the best-fold model of the given model type compiled into NumPy arrays, from the process-wide cache.
+    The model is compiled once per model file and its predictions match the ones of get_model within tolerance.
+
+    Parameters
+    ----------
+    model : str
+        The name of the pre-trained model to load.
+
+    Returns
+    -------
+    model : TreeEnsemble or ObliviousEnsemble
+        The compiled best-fold model.
+    """
+    return compiled_model_cache.get(model, model_path(os.path.join(Path.models_path, model, 'best_fold')))
+
+
+def get_fold_models(model, compiled=False):
+    """
+    Return all fold models of the last training run of the given model type from the process-wide cache.
+
+    Parameters
+    ----------
+    model : str
+        The name of the pre-trained model to load.
+    compiled : bool, optional
+        If True, the fold models are compiled into NumPy arrays (default is False).
+
+    Returns
+    -------
+    folds : list
+        The (fold manifest, model) pairs, ordered by fold number. The fold manifest holds the fold number
+        and the validation RMSE of the fold.
+    """
+    directory = os.path.join(Path.models_path, model)
+    cache = compiled_model_cache if compiled else model_cache
+    return [(fold, cache.get(model, model_path(os.path.join(directory, fold['path']))))
+            for fold in sorted(load_ensemble_manifest(directory), key=lambda fold: fold['fold_no'])]
@@ -1,12 +1,20 @@
-from joblib import load
+import pandas as pd
+import numpy as np
 import os
-from src.data.dataset_source import read_dataset
-from src.data.preprocess_data import test_pipeline_build
+import time
+from joblib import Parallel, delayed
+from src.data.dataset_source import read_dataset, read_dataset_chunks
+from src.data.preprocess_data import test_pipeline_build, load_preprocessor
+from src.models.model_cache import get_model, get_fold_models
+from src.models.boosters import n_workers
+from src.monitoring.tracing import traced, annotate, shape_attributes
 from paths import Path
 #LOAD MODEL
+@traced('predict')
 def predict(model):
     """
        Make predictions using a pre-trained regression model on external data.
+       The model is taken from the in-process model cache and is only deserialized again when the file changes.
 
        Parameters
        ----------
@@ -18,10 +26,159 @@ def predict(model):
        external_pred : array-like
            The predicted target values for the external data using the loaded model.
        """
-    if not os.path.exists(os.path.join(Path.models_path,model,'best_fold.gz')):
-        raise FileNotFoundError(f'Best model for {model} could not be found.')
+    annotate(model=model)
+    model = get_model(model)
     test = read_dataset(Path.test_path)
-    external_data = test_pipeline_build(test,Path.colencoder_path,Path.missing_num_cols_path,Path.ordinal_cols_path,Path.cat_cols_path,Path.shap_cols_path)
-    model = load(os.path.join(Path.models_path,model,'best_fold.gz'))
+    external_data = test_pipeline_build(test,Path.preprocessor_path)
+    annotate(**shape_attributes(external_data))
     external_pred = model.predict(external_data)
-    return external_pred
\ No newline at end of file
+    return external_pred
+
+def fold_weights(folds, weighting='uniform'):
+    """
+       Compute the weights of the fold models of an ensemble.
+
+       Parameters
+       ----------
+       folds : list
+           The fold manifests, with the validation RMSE of each fold.
+       weighting : str, optional
+           'uniform' for the plain mean, 'inverse_rmse' to weight each fold by the inverse of its validation RMSE
+           (default is 'uniform').
+
+       Returns
+       -------
+       weights : numpy.ndarray
+           The weights, summing to one.
+       """
+    if weighting == 'uniform':
+        weights = np.ones(len(folds))
+    elif weighting == 'inverse_rmse':
+        weights = 1 / np.array([fold['rmse'] for fold in folds], dtype=np.float64)
+    else:
+        raise ValueError(f'Unknown weighting {weighting}.')
+    return weights / weights.sum()
+
+
+def _timed_predict(model, X):
+    start = time.perf_counter()
+    y_pred = np.asarray(model.predict(X), dtype=np.float64)
+    return y_pred, time.perf_counter() - start
+
+
+def ensemble_predict(fold_models, weights, X, n_jobs=-1):
+    """
+       Evaluate several fold models on one preprocessed design matrix concurrently and combine their predictions.
+       The models run in threads, as the boosters release the GIL while predicting, so the design matrix is shared
+       and not copied.
+
+       Parameters
+       ----------
+       fold_models : list
+           The (fold manifest, model) pairs returned by get_fold_models.
+       weights : numpy.ndarray
+           The weight of each fold model.
+       X : pandas.DataFrame or scipy.sparse matrix
+           The preprocessed design matrix.
+       n_jobs : int, optional
+           The number of models evaluated at a time; -1 evaluates all of them at once (default is -1).
+
+       Returns
+       -------
+       y_pred : numpy.ndarray
+           The weighted mean of the fold predictions.
+       costs : list
+           One dictionary per fold model with the fold number, its weight and its inference time in seconds.
+       """
+    results = Parallel(n_jobs=n_workers(n_jobs, len(fold_models)), prefer='threads')(
+        delayed(_timed_predict)(model, X) for _, model in fold_models)
+    y_pred = np.zeros(X.shape[0], dtype=np.float64)
+    costs = []
+    for (fold, _), weight, (fold_pred, seconds) in zip(fold_models, weights, results):
+        y_pred += weight * fold_pred
+        costs.append({'fold_no': fold['fold_no'], 'weight': float(weight), 'seconds': seconds})
+    return y_pred, costs
+
+
+@traced('predict_ensemble')
+def predict_ensemble(model, weighting='uniform', compiled=False, n_jobs=-1):
+    """
+       Make predictions on external data with all fold models of the last training run.
+       The external data is preprocessed once and the fold models are evaluated concurrently on it.
+
+       Parameters
+       ----------
+       model : str
+           The name of the pre-trained model type.
+       weighting : str, optional
+           'uniform' or 'inverse_rmse' (default is 'uniform', see fold_weights).
+       compiled : bool, optional
+           If True, the fold models are evaluated as compiled NumPy tree arrays (default is False).
+       n_jobs : int, optional
+           The number of fold models evaluated at a time; -1 evaluates all of them at once (default is -1).
+
+       Returns
+       -------
+       external_pred : numpy.ndarray
+           The combined predictions of the fold models.
+       costs : list
+           The weight and inference time of each fold model.
+       """
+    fold_models = get_fold_models(model, compiled=compiled)
+    weights = fold_weights([fold for fold, _ in fold_models], weighting)
+    test = read_dataset(Path.test_path)
+    external_data = test_pipeline_build(test,Path.preprocessor_path)
+    annotate(**shape_attributes(external_data), model=model, folds=len(fold_models))
+    external_pred, costs = ensemble_predict(fold_models, weights, external_data, n_jobs=n_jobs)
+    for cost in costs:
+        print(f"Fold {cost['fold_no']} : weight {cost['weight']:.3f}, {cost['seconds'] * 1000:.1f} ms")
+    return external_pred, costs
+
+@traced('predict_batches')
+def predict_batches(model, input_path, output_path, chunksize=Path.predict_chunksize, ensemble=None):
+    """
+       Score a large external dataset in a streaming fashion.
+       The input is read in fixed-size chunks, each chunk is preprocessed and scored,
+       and its predictions are appended to the output file before the next chunk is read,
+       so peak memory depends on the chunk size and not on the size of the input.
+
+       Parameters
+       ----------
+       model : str
+           The name of the pre-trained model to load.
+       input_path : str
+           The file path of the external dataset to be scored.
+       output_path : str
+           The file path of the CSV file the predictions are written to (Id and target columns).
+       chunksize : int, optional
+           The number of rows scored at a time (default is Path.predict_chunksize).
+       ensemble : str, optional
+           If given, every chunk is scored by all fold models combined with this weighting
+           ('uniform' or 'inverse_rmse') instead of the best-fold model (default is None).
+
+       Returns
+       -------
+       n_rows : int
+           The number of scored rows.
+       """
+    if ensemble is None:
+        score = get_model(model).predict
+    else:
+        fold_models = get_fold_models(model)
+        weights = fold_weights([fold for fold, _ in fold_models], ensemble)
+        score = lambda X: ensemble_predict(fold_models, weights, X)[0]
+    preprocessor = load_preprocessor(Path.preprocessor_path)
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    n_rows = 0
+    with open(output_path, 'w', newline='') as f:
+        for chunk_no, chunk in enumerate(read_dataset_chunks(input_path, chunksize)):
+            ids = chunk['Id'].to_numpy() if 'Id' in chunk.columns else None
+            chunk_pred = score(preprocessor.transform(chunk))
+            result = {Path.target: chunk_pred} if ids is None else {'Id': ids, Path.target: chunk_pred}
+            pd.DataFrame(result).to_csv(f, header=chunk_no == 0, index=False)
+            n_rows += len(chunk_pred)
+            print(f'Scored {n_rows} rows')
+    annotate(rows=n_rows, model=model if ensemble is None else f'{model} ensemble')
+    return n_rows
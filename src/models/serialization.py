@@ -0,0 +1,356 @@
+import datetime
+import glob
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+from joblib import load
+from src.models.boosters import best_iteration
+
+# Native file format of each supported model type.
+NATIVE_FORMATS = {
+    'XGBRegressor': '.ubj',
+    'LGBMRegressor': '.txt',
+    'CatBoostRegressor': '.cbm',
+}
+MANIFEST_SUFFIX = '.json'
+LEGACY_SUFFIX = '.gz'
+ENSEMBLE_MANIFEST = 'ensemble.json'
+
+
+def _library(model_type):
+    if model_type == 'XGBRegressor':
+        import xgboost
+        return xgboost
+    elif model_type == 'LGBMRegressor':
+        import lightgbm
+        return lightgbm
+    elif model_type == 'CatBoostRegressor':
+        import catboost
+        return catboost
+    raise ValueError(f'Unknown model {model_type}.')
+
+
+def model_feature_names(model):
+    """
+    Return the feature names a fitted XGBRegressor, LGBMRegressor or CatBoostRegressor was trained on, or None.
+    """
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None and type(model).__name__ == 'LGBMRegressor':
+        names = model.booster_.feature_name()
+    elif names is None and type(model).__name__ == 'CatBoostRegressor':
+        names = model.feature_names_
+    return None if names is None else [str(name) for name in names]
+
+
+def _write_json(obj, path):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def _versioned_file(path, extension):
+    # Every model file gets a unique name, so a file a manifest points to is never overwritten.
+    return f'{path}-{uuid.uuid4().hex[:12]}{extension}'
+
+
+def _manifest_file(path):
+    manifest_path = f'{path}{MANIFEST_SUFFIX}'
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return os.path.join(os.path.dirname(manifest_path), json.load(f)['file'])
+
+
+def _switch_manifest(manifest, path, model_file):
+    """
+    Point the manifest at path to a model file in one atomic replace. The file of the previous manifest is kept
+    for readers that loaded it just before the switch; older files of the path are removed.
+    """
+    previous_file = _manifest_file(path)
+    manifest['file'] = os.path.basename(model_file)
+    _write_json(manifest, f'{path}{MANIFEST_SUFFIX}')
+    extension = os.path.splitext(model_file)[1]
+    keep = {os.path.abspath(model_file)} | ({os.path.abspath(previous_file)} if previous_file else set())
+    for file in [f'{path}{extension}'] + glob.glob(f'{glob.escape(path)}-*{extension}'):
+        if os.path.exists(file) and os.path.abspath(file) not in keep:
+            os.remove(file)
+
+
+def save_model(model, path):
+    """
+    Save a fitted booster in the native format of its library, together with a JSON manifest.
+
+    The model file is written uncompressed (XGBoost UBJSON, LightGBM model text, CatBoost .cbm), so loading it
+    needs no decompression and no unpickling of the scikit-learn wrapper. The model file gets a unique name and the
+    manifest is written last and atomically, so a reader never sees a manifest pointing to a partially written model
+    or a model file that does not belong to it.
+
+    Parameters
+    ----------
+    model : estimator object
+        The fitted XGBRegressor, LGBMRegressor or CatBoostRegressor.
+    path : str
+        The file path of the model without extension, e.g. "models/XGBRegressor/0".
+        The model is written to path + "-<version>" + the native extension and the manifest to path + ".json".
+
+    Returns
+    -------
+    manifest : dict
+        The metadata written to the manifest.
+    """
+    model_type = type(model).__name__
+    if model_type not in NATIVE_FORMATS:
+        raise ValueError(f'Unknown model {model_type}.')
+    model_file = _versioned_file(path, NATIVE_FORMATS[model_type])
+    if model_type == 'XGBRegressor':
+        model.get_booster().save_model(model_file)
+    elif model_type == 'LGBMRegressor':
+        model.booster_.save_model(model_file)
+    elif model_type == 'CatBoostRegressor':
+        model.save_model(model_file, format='cbm')
+    feature_names = model_feature_names(model)
+    manifest = {
+        'model': model_type,
+        'library_version': _library(model_type).__version__,
+        'size': os.path.getsize(model_file),
+        'n_trees': best_iteration(model),
+        'n_features': int(model.n_features_in_),
+        'feature_names': feature_names,
+        'params': json.loads(json.dumps(model.get_params(), default=repr)),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    _switch_manifest(manifest, path, model_file)
+    return manifest
+
+
+def rename_model(source, destination):
+    """
+    Move a saved model and its manifest to a new path, replacing any model saved there.
+    The model file is moved under a new unique name and the manifest at the destination is then switched to it
+    atomically, so a concurrent reader loads either the previous model or the new one, each with its own metadata.
+
+    Parameters
+    ----------
+    source : str
+        The file path of the saved model without extension.
+    destination : str
+        The new file path of the model without extension.
+    """
+    with open(f'{source}{MANIFEST_SUFFIX}') as f:
+        manifest = json.load(f)
+    model_file = _versioned_file(destination, NATIVE_FORMATS[manifest['model']])
+    os.replace(os.path.join(os.path.dirname(f'{source}{MANIFEST_SUFFIX}'), manifest['file']), model_file)
+    _switch_manifest(manifest, destination, model_file)
+    os.remove(f'{source}{MANIFEST_SUFFIX}')
+
+
+def copy_model(source, destination):
+    """
+    Copy a saved model and its manifest to a new path, replacing any model saved there.
+
+    Parameters
+    ----------
+    source : str
+        The file path of the saved model without extension.
+    destination : str
+        The file path of the copy without extension.
+    """
+    with open(f'{source}{MANIFEST_SUFFIX}') as f:
+        manifest = json.load(f)
+    model_file = _versioned_file(destination, NATIVE_FORMATS[manifest['model']])
+    shutil.copyfile(os.path.join(os.path.dirname(f'{source}{MANIFEST_SUFFIX}'), manifest['file']), model_file)
+    _switch_manifest(manifest, destination, model_file)
+
+
+def model_path(path):
+    """
+    Resolve the file a saved model is loaded from.
+
+    Parameters
+    ----------
+    path : str
+        The file path of the saved model without extension.
+
+    Returns
+    -------
+    file : str
+        The manifest of the native model if it exists, otherwise the legacy joblib file path + ".gz".
+    """
+    manifest_path = f'{path}{MANIFEST_SUFFIX}'
+    return manifest_path if os.path.exists(manifest_path) else f'{path}{LEGACY_SUFFIX}'
+
+
+def save_ensemble_manifest(directory, folds):
+    """
+    Record the fold models of a training run, so that they can be loaded together as an ensemble.
+
+    Parameters
+    ----------
+    directory : str
+        The model directory, e.g. "models/XGBRegressor".
+    folds : list
+        One dictionary per fold with the keys 'fold_no', 'path' (the saved model path without extension,
+        relative to directory) and 'rmse' (the validation RMSE of the fold).
+    """
+    _write_json({'folds': folds}, os.path.join(directory, ENSEMBLE_MANIFEST))
+
+
+def load_ensemble_manifest(directory):
+    """
+    Return the fold models recorded by save_ensemble_manifest.
+
+    Parameters
+    ----------
+    directory : str
+        The model directory.
+
+    Returns
+    -------
+    folds : list
+        One dictionary per fold (see save_ensemble_manifest).
+    """
+    file = os.path.join(directory, ENSEMBLE_MANIFEST)
+    if not os.path.exists(file):
+        raise FileNotFoundError(f'No fold ensemble has been saved in {directory}.')
+    with open(file) as f:
+        return json.load(f)['folds']
+
+
+def warm_start_source(path):
+    """
+    Return the tuned parameters and the booster that an incremental update continues boosting from.
+
+    Parameters
+    ----------
+    path : str
+        The file path of the saved model without extension.
+
+    Returns
+    -------
+    params : dict
+        The parameters of the saved model.
+    init_model : object
+        The booster cut at the best iteration (xgboost.Booster, lightgbm.Booster), or the CatBoost model file path
+        or object, as accepted by the xgb_model or init_model fit argument of its library.
+    """
+    file = model_path(path)
+    if file.endswith(MANIFEST_SUFFIX):
+        with open(file) as f:
+            manifest = json.load(f)
+        model_type, params, n_trees = manifest['model'], manifest['params'], manifest['n_trees']
+        model_file = os.path.join(os.path.dirname(file), manifest['file'])
+        if model_type == 'XGBRegressor':
+            booster = _library(model_type).Booster(model_file=model_file)
+            return params, booster if n_trees is None else booster[:n_trees]
+        elif model_type == 'LGBMRegressor':
+            return params, _library(model_type).Booster(model_file=model_file)
+        return params, model_file
+    model = load(file)
+    model_type, n_trees = type(model).__name__, best_iteration(model)
+    if model_type == 'XGBRegressor':
+        booster = model.get_booster()
+        return model.get_params(), booster if n_trees is None else booster[:n_trees]
+    elif model_type == 'LGBMRegressor':
+        return model.get_params(), _library(model_type).Booster(model_str=model.booster_.model_to_string())
+    return model.get_params(), model
+
+
+class NativeModel:
+    """
+    A booster loaded from its native file, with the predict method of the scikit-learn wrapper.
+
+    Parameters
+    ----------
+    booster : object
+        The xgboost.Booster, lightgbm.Booster or catboost.CatBoostRegressor.
+    manifest : dict
+        The manifest written by save_model.
+    """
+    def __init__(self, booster, manifest):
+        self.booster = booster
+        self.manifest = manifest
+
+    @property
+    def model_type(self):
+        return self.manifest['model']
+
+    @property
+    def nbytes(self):
+        return self.manifest['size']
+
+    @property
+    def feature_names(self):
+        return self.manifest['feature_names']
+
+    def predict(self, X):
+        """
+        Predict the target of a design matrix.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame, numpy.ndarray or scipy.sparse matrix
+            The design matrix, with the columns in training order.
+
+        Returns
+        -------
+        y_pred : numpy.ndarray
+            The predicted target values.
+        """
+        n_trees = self.manifest['n_trees']
+        if self.model_type == 'XGBRegressor':
+            import xgboost
+            iteration_range = (0, 0) if n_trees is None else (0, n_trees)
+            return self.booster.predict(xgboost.DMatrix(X, missing=np.nan),
+                                        iteration_range=iteration_range, validate_features=False)
+        elif self.model_type == 'LGBMRegressor':
+            return self.booster.predict(X, num_iteration=n_trees)
+        return self.booster.predict(X)
+
+
+def load_native_model(manifest_path):
+    """
+    Load a booster saved by save_model directly from its native file.
+
+    Parameters
+    ----------
+    manifest_path : str
+        The file path of the manifest.
+
+    Returns
+    -------
+    model : NativeModel
+        The loaded model.
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    model_file = os.path.join(os.path.dirname(manifest_path), manifest['file'])
+    model_type = manifest['model']
+    library = _library(model_type)
+    if model_type in ('XGBRegressor', 'LGBMRegressor'):
+        booster = library.Booster(model_file=model_file)
+    else:
+        booster = library.CatBoostRegressor()
+        booster.load_model(model_file, format='cbm')
+    return NativeModel(booster, manifest)
+
+
+def load_model(file):
+    """
+    Load a saved model, either from a native manifest or from a legacy joblib file.
+
+    Parameters
+    ----------
+    file : str
+        The manifest path (".json") or the joblib file path.
+
+    Returns
+    -------
+    model : NativeModel or estimator object
+        The loaded model; both expose predict.
+    """
+    if file.endswith(MANIFEST_SUFFIX):
+        return load_native_model(file)
+    return load(file)
@@ -1,12 +1,64 @@
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import KFold
-from src.data.dataset_source import final_data_build
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import KFold, train_test_split
+from src.data.dataset_source import final_data_build, read_dataset
+from src.data.preprocess_data import load_preprocessor
 from src.models.hyperparameter_optimize import optuna_optimize
 import os
-from joblib import dump
+import copy
+import datetime
+import json
+import time
+from joblib import Parallel, delayed
+from src.data.design_matrix import take_rows, stack_rows
+from src.models.boosters import n_workers, threads_per_worker, thread_params, warm_start_fit_params
 from src.models.metrics import regression_calculate_scores
+from src.models.model_cache import model_cache, compiled_model_cache
+from src.models.serialization import (save_model, rename_model, copy_model, save_ensemble_manifest,
+                                      load_ensemble_manifest, load_model, model_path, warm_start_source)
+from src.monitoring.tracing import traced, annotate, shape_attributes
+from paths import Path
+
+@traced('train_fold')
+def _train_fold(model, params, X_train, y_train, X_test, y_test, fold_no, model_name):
+    """
+    Fits an independent model copy on one cross-validation fold, saves it and scores it on the validation set.
+    It runs in a worker process, so only the scores travel back to the parent process.
+
+    Parameters:
+        model (object): Independent copy of the regression model.
+        params (dict): Parameters set on the copy before fitting (e.g. the booster thread limit).
+        X_train, y_train: Training data of the fold.
+        X_test, y_test: Validation data of the fold.
+        fold_no (int): Fold number.
+        model_name (str): File path without extension the fitted model and its manifest are saved to.
+
+    Returns:
+        result (dict): The evaluation scores of the fold (see Trainer.train).
+    """
+    annotate(**shape_attributes(X_train), model=type(model).__name__, fold_no=fold_no,
+             threads=params.get('n_jobs', params.get('thread_count')))
+    model.set_params(**params)
+    model.fit(X_train, y_train,
+              eval_set=[(X_train,y_train),(X_test,y_test)],
+              early_stopping_rounds=200,verbose=0)
+    y_pred = model.predict(X_test)
+    scores = regression_calculate_scores(y_test, y_pred, X_train)
+    print(f'{str(type(model).__name__)} Fold No : ', fold_no)
+    print(f'Scores {scores}')
+    save_model(model, model_name)
+    return {'fold_no': fold_no,
+            'rmse': scores['RMSE'],
+            'mae': scores['MAE'],
+            'rmsle': scores['RMSLE'],
+            'r2': scores['R2'],
+            'adj_r2': scores['Adj R2'],
+            'real': y_test.tolist(), 'pred': y_pred.tolist()}
+
 class Trainer:
-    def __init__(self,train_path,model,saved_model_path,fold_number,hyperparameter_trial):
+    def __init__(self,train_path,model,saved_model_path,fold_number,hyperparameter_trial,n_jobs=Path.train_n_jobs,
+                 cores=None,optuna_n_jobs=Path.optuna_n_jobs):
         """
         Initializes the Trainer class.
 
@@ -16,6 +68,11 @@ class Trainer:
             saved_model_path (str): Directory path where the trained model will be saved.
             fold_number (int): Number of folds to be used in K-Fold cross-validation.
             hyperparameter_trial (int): Number of hyperparameter optimization trials using Optuna.
+            n_jobs (int): Number of folds trained in parallel worker processes; -1 uses all cores.
+                          The booster threads of each fold are limited so that the cores are not oversubscribed.
+            cores (int): Number of cores the trainer may use, e.g. when several models are trained at once;
+                         None uses all cores.
+            optuna_n_jobs (int): Number of Optuna worker processes when a study storage is set (see optuna_optimize).
 
         Returns:
             None
@@ -25,9 +82,24 @@ class Trainer:
         self.saved_model_path = saved_model_path
         self.fold_number = fold_number
         self.hyperparameter_trial = hyperparameter_trial
-    def train(self):
+        self.n_jobs = n_jobs
+        self.cores = cores
+        self.optuna_n_jobs = optuna_n_jobs
+        self.best_params = None
+        self.best_value = None
+    @traced('trainer.train')
+    def train(self, data=None):
         """
         Trains the regression model using K-Fold cross-validation and hyperparameter optimization with Optuna.
+        The folds are trained in parallel, each on an independent copy of the model.
+        Every fold model is saved in the native format of its library with a JSON manifest (see serialization.save_model),
+        and the folds of the run are recorded in ensemble.json for fold-ensemble prediction.
+        The tuned parameters and their cross-validation RMSE are kept in best_params and best_value.
+
+        Parameters:
+            data (tuple, optional): The (X_train, y_train, X_test, y_test) outputs of final_data_build, passed when
+                                    several models are trained on the same prepared data. If None, they are built
+                                    from train_path.
 
         Returns:
             cv_results (list): A list of dictionaries containing the evaluation scores of each fold.
@@ -43,39 +115,203 @@ class Trainer:
 
             best_fold_no (int): The fold number with the lowest RMSE value, used to save the best model.
         """
-        X_train,y_train,X_test,y_test = final_data_build(self.train_path)
+        X_train,y_train,X_test,y_test = final_data_build(self.train_path) if data is None else data
         kf = KFold(n_splits=self.fold_number, shuffle=True, random_state=33)
-        best_params,best_value = optuna_optimize(X_train,y_train,self.model,kf,self.hyperparameter_trial)
+        if self.cores is not None:
+            self.model.set_params(**thread_params(self.model, self.cores))
+        best_params,best_value = optuna_optimize(X_train,y_train,self.model,kf,self.hyperparameter_trial,
+                                                 storage_path=Path.optuna_storage_path,n_jobs=self.optuna_n_jobs,
+                                                 cores=self.cores)
         self.model.set_params(**best_params)
-        X = pd.concat([X_train,X_test],axis=0)
+        self.best_params, self.best_value = best_params, best_value
+        X = stack_rows(X_train,X_test)
         y = pd.concat([y_train,y_test],axis=0)
-        cv_results = []
         directory = os.path.join(self.saved_model_path)
         if not os.path.exists(os.path.join(directory,str(f'{type(self.model).__name__}'))):
             os.makedirs(os.path.join(directory, str(f'{type(self.model).__name__}')), exist_ok=True)
-        for fold_no, (train_index, test_index) in enumerate(kf.split(X, y)):
-            X_train, X_test = X.iloc[train_index], X.iloc[test_index]
-            y_train, y_test = y.iloc[train_index], y.iloc[test_index]
-            self.model.fit(X_train, y_train,
-                      eval_set=[(X_train,y_train),(X_test,y_test)],
-                      early_stopping_rounds=200,verbose=0)
-            y_pred = self.model.predict(X_test)
-            scores = regression_calculate_scores(y_test, y_pred, X_train)
-            print(f'{str(type(self.model).__name__)} Fold No : ', fold_no)
-            print(f'Scores {scores}')
-            cv_results.append({'fold_no': fold_no,
-                               'rmse': scores['RMSE'],
-                               'mae': scores['MAE'],
-                               'rmsle': scores['RMSLE'],
-                               'r2': scores['R2'],
-                               'adj_r2': scores['Adj R2'],
-                               'real': y_test.tolist(), 'pred': y_pred.tolist()})
-            model_name = os.path.join(f'{directory}/{str(type(self.model).__name__)}/{str(fold_no)}.gz')
-            dump(self.model, model_name, compress=('gzip', 3))
+        splits = list(kf.split(X, y))
+        workers = n_workers(self.n_jobs, len(splits), self.cores)
+        threads = threads_per_worker(workers, self.cores)
+        annotate(**shape_attributes(X), model=type(self.model).__name__, workers=workers, threads=threads)
+        cv_results = Parallel(n_jobs=workers)(
+            delayed(_train_fold)(copy.deepcopy(self.model), thread_params(self.model, threads),
+                                 take_rows(X, train_index), y.iloc[train_index],
+                                 take_rows(X, test_index), y.iloc[test_index],
+                                 fold_no,
+                                 os.path.join(f'{directory}/{str(type(self.model).__name__)}/{str(fold_no)}'))
+            for fold_no, (train_index, test_index) in enumerate(splits))
+        cv_results = sorted(cv_results, key=lambda x: x['fold_no'])
         min_rmse_dict = min(cv_results, key=lambda x: x['rmse'])
         best_fold_no = min_rmse_dict['fold_no']
         if os.path.exists(os.path.join(f'{directory}/{str(type(self.model).__name__)}/best_fold.gz')):
             os.remove(os.path.join(f'{directory}/{str(type(self.model).__name__)}/best_fold.gz'))
-        os.rename(os.path.join(f'{directory}/{str(type(self.model).__name__)}/{str(best_fold_no)}.gz'),os.path.join(f'{directory}/{str(type(self.model).__name__)}/best_fold.gz'))
+        rename_model(os.path.join(f'{directory}/{str(type(self.model).__name__)}/{str(best_fold_no)}'),os.path.join(f'{directory}/{str(type(self.model).__name__)}/best_fold'))
+        save_ensemble_manifest(os.path.join(directory, str(type(self.model).__name__)),
+                               [{'fold_no': i['fold_no'],
+                                 'path': 'best_fold' if i['fold_no'] == best_fold_no else str(i['fold_no']),
+                                 'rmse': i['rmse']} for i in cv_results])
+        model_cache.invalidate(type(self.model).__name__)
+        compiled_model_cache.invalidate(type(self.model).__name__)
         print("Best fold",best_fold_no,best_value,best_params)
-        return cv_results,best_fold_no
\ No newline at end of file
+        return cv_results,best_fold_no
+
+    @staticmethod
+    def _detach_best_fold(directory):
+        """
+        Makes the fold ensemble of the last training run independent of best_fold, by copying the best fold model
+        to its fold number and pointing its ensemble.json entry there.
+
+        Parameters:
+            directory (str): Directory of the saved models of the model type.
+        """
+        try:
+            folds = load_ensemble_manifest(directory)
+        except FileNotFoundError:
+            return
+        for fold in folds:
+            if fold['path'] == 'best_fold':
+                copy_model(os.path.join(directory, 'best_fold'), os.path.join(directory, str(fold['fold_no'])))
+                fold['path'] = str(fold['fold_no'])
+        save_ensemble_manifest(directory, folds)
+
+    @traced('trainer.update')
+    def update(self, new_data_path, rounds=Path.incremental_rounds, holdout=Path.incremental_holdout, force=False):
+        """
+        Updates the current best model with newly arrived rows instead of retraining from scratch.
+        The preprocessing medians are moved towards the new rows (see Preprocessor.partial_fit), and boosting
+        continues from the best-fold booster with the previously tuned parameters for a number of extra rounds.
+        The updated model and preprocessor replace the current ones only if the updated model scores at least
+        as well on a holdout of the new rows. The fold ensemble of the last training run keeps the original best fold,
+        which is copied back under its fold number before best_fold is replaced.
+
+        Parameters:
+            new_data_path (str): File path to the newly arrived rows, with the target column.
+            rounds (int): Number of boosting rounds added to the best model.
+            holdout (float): Share of the new rows used to compare the updated model with the current one;
+                             0 skips the comparison.
+            force (bool): If True, the updated model replaces the current one whatever its holdout score.
+
+        Returns:
+            result (dict): A dictionary containing the following keys:
+                           - 'rows': Number of new rows the model was updated with.
+                           - 'current_rmse': RMSE of the current model on the holdout (None without holdout).
+                           - 'updated_rmse': RMSE of the updated model on the holdout (None without holdout).
+                           - 'promoted': Whether the updated model replaced the current one.
+        """
+        name = type(self.model).__name__
+        directory = os.path.join(self.saved_model_path, name)
+        best_path = os.path.join(directory, 'best_fold')
+        data = read_dataset(new_data_path)
+        X_new, y_new = data.drop(Path.target, axis=1), data[Path.target]
+        annotate(**shape_attributes(X_new), model=name)
+        if holdout:
+            X_fit, X_holdout, y_fit, y_holdout = train_test_split(X_new, y_new, test_size=holdout, random_state=33)
+        else:
+            X_fit, y_fit = X_new, y_new
+        current_preprocessor = load_preprocessor(Path.preprocessor_path)
+        preprocessor = copy.deepcopy(current_preprocessor).partial_fit(X_fit)
+        params, init_model = warm_start_source(best_path)
+        model = copy.deepcopy(self.model)
+        model.set_params(**params)
+        model.set_params(n_estimators=rounds)
+        model.fit(preprocessor.transform(X_fit), y_fit, **warm_start_fit_params(model, init_model))
+        current_rmse = updated_rmse = None
+        promoted = True
+        if holdout:
+            current_model = load_model(model_path(best_path))
+            current_rmse = np.sqrt(mean_squared_error(y_holdout, current_model.predict(current_preprocessor.transform(X_holdout))))
+            updated_rmse = np.sqrt(mean_squared_error(y_holdout, model.predict(preprocessor.transform(X_holdout))))
+            promoted = force or updated_rmse <= current_rmse
+        if promoted:
+            self._detach_best_fold(directory)
+            save_model(model, os.path.join(directory, 'incremental'))
+            rename_model(os.path.join(directory, 'incremental'), best_path)
+            if os.path.exists(f'{best_path}.gz'):
+                os.remove(f'{best_path}.gz')
+            preprocessor.save(Path.preprocessor_path)
+            model_cache.invalidate(name)
+            compiled_model_cache.invalidate(name)
+        print(f"Incremental update of {name} with {len(X_fit)} rows : current RMSE {current_rmse}, "
+              f"updated RMSE {updated_rmse}, promoted {promoted}")
+        return {'rows': len(X_fit), 'current_rmse': current_rmse, 'updated_rmse': updated_rmse, 'promoted': promoted}
+
+
+def _train_model(model, data, train_path, saved_model_path, fold_number, hyperparameter_trial, cores):
+    """
+    Tunes and trains one model on the shared prepared data and summarizes its cross-validation scores.
+    It runs in a worker process, so only the summary travels back to the parent process.
+
+    Parameters:
+        model (object): Regression model object.
+        data (tuple): The (X_train, y_train, X_test, y_test) outputs of final_data_build.
+        train_path (str): File path to the training dataset.
+        saved_model_path (str): Directory path where the trained models will be saved.
+        fold_number (int): Number of folds to be used in K-Fold cross-validation.
+        hyperparameter_trial (int): Number of hyperparameter optimization trials using Optuna.
+        cores (int): Number of cores the model may use.
+
+    Returns:
+        row (dict): The leaderboard row of the model (see train_models).
+    """
+    start = time.perf_counter()
+    # The worker already runs in parallel with the other models, so its folds and Optuna trials run one at a time
+    # and each booster uses the cores of the worker.
+    trainer = Trainer(train_path, model, saved_model_path, fold_number, hyperparameter_trial, n_jobs=1, cores=cores,
+                      optuna_n_jobs=1)
+    cv_results, best_fold_no = trainer.train(data)
+    rmse = [i['rmse'] for i in cv_results]
+    return {'model': type(model).__name__,
+            'mean_rmse': float(np.mean(rmse)),
+            'std_rmse': float(np.std(rmse)),
+            'best_fold': best_fold_no,
+            'best_fold_rmse': float(min(rmse)),
+            'mean_mae': float(np.mean([i['mae'] for i in cv_results])),
+            'mean_rmsle': float(np.mean([i['rmsle'] for i in cv_results])),
+            'mean_r2': float(np.mean([i['r2'] for i in cv_results])),
+            'optuna_rmse': float(trainer.best_value),
+            'cores': cores,
+            'seconds': time.perf_counter() - start,
+            'params': json.loads(json.dumps(trainer.best_params, default=repr))}
+
+
+@traced('train_models')
+def train_models(models, train_path=Path.train_path, saved_model_path=Path.models_path, fold_number=Path.fold_number,
+                 hyperparameter_trial=Path.hyperparameter_trial_number, n_jobs=-1, leaderboard_path=Path.leaderboard_path):
+    """
+    Trains several regression models on the same prepared data and writes a combined leaderboard.
+    The data preparation and SHAP selection (final_data_build) run once. The models are then trained in parallel
+    worker processes, which receive the prepared data from the parent process. The cores are split between them:
+    within a worker the folds and the Optuna trials run one at a time, and each booster uses the worker's cores,
+    so the machine is not oversubscribed.
+
+    Parameters:
+        models (list): Regression model objects (e.g., XGBRegressor, LGBMRegressor, CatBoostRegressor).
+        train_path (str): File path to the training dataset.
+        saved_model_path (str): Directory path where the trained models will be saved.
+        fold_number (int): Number of folds to be used in K-Fold cross-validation.
+        hyperparameter_trial (int): Number of hyperparameter optimization trials using Optuna per model.
+        n_jobs (int): Number of models trained at the same time; -1 trains all of them at once if there are enough cores.
+        leaderboard_path (str): File path without extension the leaderboard is written to as .csv and .json;
+                                None writes nothing.
+
+    Returns:
+        leaderboard (DataFrame): One row per model, sorted by mean cross-validation RMSE, with the columns
+                                 'model', 'mean_rmse', 'std_rmse', 'best_fold', 'best_fold_rmse', 'mean_mae',
+                                 'mean_rmsle', 'mean_r2', 'optuna_rmse', 'cores', 'seconds' and 'params'.
+    """
+    data = final_data_build(train_path)
+    workers = n_workers(n_jobs, len(models))
+    cores = threads_per_worker(workers)
+    annotate(**shape_attributes(data[0]), models=len(models), workers=workers, threads=cores)
+    rows = Parallel(n_jobs=workers)(
+        delayed(_train_model)(model, data, train_path, saved_model_path, fold_number, hyperparameter_trial, cores)
+        for model in models)
+    leaderboard = pd.DataFrame(rows).sort_values('mean_rmse').reset_index(drop=True)
+    if leaderboard_path is not None:
+        os.makedirs(os.path.dirname(leaderboard_path) or '.', exist_ok=True)
+        leaderboard.assign(params=leaderboard['params'].map(json.dumps)).to_csv(f'{leaderboard_path}.csv', index=False)
+        with open(f'{leaderboard_path}.json', 'w') as f:
+            json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'), 'train_path': train_path,
+                       'models': leaderboard.to_dict(orient='records')}, f, indent=2)
+    print(leaderboard.drop(columns='params').to_string(index=False))
+    return leaderboard
@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The modules a scoring worker, the service and the app tabs start from.
+ENTRY_MODULES = [
+    'src.models.predict_model',
+    'src.serving.api',
+    'src.models.trainer',
+    'src.data.dataset_source',
+    'src.visualization.visualization',
+]
+
+
+def import_times(module, python=sys.executable):
+    """
+    Import a module in a fresh interpreter with -X importtime and return the time spent in each import.
+
+    Parameters
+    ----------
+    module : str
+        The dotted name of the module, e.g. "src.models.predict_model".
+    python : str, optional
+        The interpreter the module is imported with (default is the current one).
+
+    Returns
+    -------
+    entries : list
+        One dictionary per module imported by the import of the module (interpreter startup imports are left out),
+        in the order the imports finished, with the keys 'name', 'depth' (0 for the module and its parent packages),
+        'self_us' and 'cumulative_us' (the times in microseconds without and with the module's own imports).
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(f'Importing {module} failed: {lines[-1] if lines else result.returncode}')
+    parts = module.split('.')
+    chain = {'.'.join(parts[:i]) for i in range(1, len(parts) + 1)}
+    entries, pending = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue
+        name = name[1:]
+        pending.append({'name': name.strip(), 'depth': (len(name) - len(name.lstrip())) // 2,
+                        'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+        if pending[-1]['depth'] == 0:
+            # Top-level imports outside the module and its parent packages are interpreter startup imports.
+            if pending[-1]['name'] in chain:
+                entries.extend(pending)
+            pending = []
+    return entries
+
+
+def package_times(entries):
+    """
+    Sum the own import time of the modules of each top-level package.
+
+    Parameters
+    ----------
+    entries : list
+        The entries returned by import_times.
+
+    Returns
+    -------
+    packages : list
+        (package, seconds) pairs, slowest first. Own times do not overlap, so the seconds add up to the total.
+    """
+    totals = dict()
+    for entry in entries:
+        package = entry['name'].split('.')[0]
+        totals[package] = totals.get(package, 0) + entry['self_us']
+    return sorted(((package, us / 1e6) for package, us in totals.items()), key=lambda item: -item[1])
+
+
+def import_report(module, top=10, python=sys.executable):
+    """
+    Report the cold import time of a module and the packages it spends it in.
+
+    Parameters
+    ----------
+    module : str
+        The dotted name of the module.
+    top : int, optional
+        The number of slowest packages reported (default is 10).
+    python : str, optional
+        The interpreter the module is imported with (default is the current one).
+
+    Returns
+    -------
+    report : dict
+        The 'module', its total import time in 'seconds', the number of imported 'modules',
+        the 'packages' list of the slowest (package, seconds) pairs and the names of all 'imported_packages'.
+    """
+    entries = import_times(module, python)
+    packages = package_times(entries)
+    return {'module': module,
+            'seconds': sum(entry['self_us'] for entry in entries) / 1e6,
+            'modules': len(entries),
+            'packages': packages[:top],
+            'imported_packages': sorted(package for package, _ in packages)}
@@ -0,0 +1,321 @@
+import collections
+import datetime
+import functools
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from paths import Path
+
+
+def current_rss():
+    """
+    Return the current resident set size of the process.
+
+    Returns
+    -------
+    rss : int or None
+        The RSS in bytes, or None if it cannot be measured on this platform.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def shape_attributes(X):
+    """
+    Return the rows and columns of a dataframe or matrix as span attributes.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame, numpy.ndarray or scipy.sparse matrix
+        The processed data.
+
+    Returns
+    -------
+    attributes : dict
+        The 'rows' and 'columns' of X.
+    """
+    shape = getattr(X, 'shape', (len(X),))
+    return {'rows': int(shape[0]), 'columns': int(shape[1]) if len(shape) > 1 else None}
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _RssSampler:
+    """
+    Samples the RSS of the process from a daemon thread while spans are open and raises their peaks.
+    The thread is started by the first open span and stops once no span is open.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.spans = set()
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.add(span)
+            # A process forked from a sampling process inherits the thread object but not the thread.
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+                self.thread.start()
+
+    def remove(self, span):
+        with self._lock:
+            self.spans.discard(span)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self.spans:
+                    self.thread = None
+                    return
+                spans = list(self.spans)
+            rss = current_rss()
+            for span in spans:
+                if rss is not None and rss > span.peak_rss:
+                    span.peak_rss = rss
+            time.sleep(self.interval)
+
+
+class Span:
+    """
+    A timed pipeline stage. On exit it writes one JSON line with its wall time, CPU time, the RSS of the process
+    at its start and end, the difference between the two, the peak RSS while it was open, and its attributes.
+    The peak is sampled every Tracer.sample_interval seconds, so shorter allocation spikes can be missed.
+
+    Parameters
+    ----------
+    tracer : Tracer
+        The tracer the span is written to.
+    name : str
+        The name of the stage.
+    attributes : dict
+        The attributes of the span, e.g. rows, columns or the booster thread count.
+    """
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = None
+
+    def set(self, **attributes):
+        """
+        Add or update attributes of the span, e.g. the number of rows once it is known.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.parent = self.tracer.current()
+        self.trace_id = self.parent.trace_id if self.parent is not None else uuid.uuid4().hex[:16]
+        self.tracer._push(self)
+        self.start = datetime.datetime.now().isoformat(timespec='milliseconds')
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+        if self.start_rss is not None:
+            self.tracer._sampler.add(self)
+        self.start_cpu = time.process_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        end_rss = current_rss()
+        self.tracer._sampler.remove(self)
+        peak_rss = None if end_rss is None or self.peak_rss is None else max(self.peak_rss, end_rss)
+        self.tracer._pop(self)
+        record = {'trace_id': self.trace_id, 'span_id': self.span_id,
+                  'parent_id': None if self.parent is None else self.parent.span_id,
+                  'name': self.name, 'start': self.start, 'pid': os.getpid(),
+                  'wall_seconds': wall, 'cpu_seconds': cpu,
+                  'rss_start_bytes': self.start_rss, 'rss_end_bytes': end_rss,
+                  'rss_delta_bytes': None if end_rss is None or self.start_rss is None else end_rss - self.start_rss,
+                  'rss_peak_bytes': peak_rss,
+                  'status': 'ok' if exc_type is None else 'error'}
+        if exc_type is not None:
+            record['error'] = repr(exc)
+        record.update(self.attributes)
+        self.tracer._write(record)
+        return False
+
+
+class Tracer:
+    """
+    Writes the spans of the pipeline stages as JSON lines.
+    Every process (e.g. each joblib worker) appends to its own file, so the files are never written or rotated
+    by two processes at once.
+
+    Parameters
+    ----------
+    path : str
+        The JSON-lines file path the files of the processes are named after: spans of process 123 are appended to
+        "<path without extension>.123<extension>".
+    enabled : bool, optional
+        If False, span returns a shared no-op span and traced functions are called directly (default is True).
+    max_bytes : int, optional
+        The size above which the file of a process is rotated to its path + ".1" (default is 50 MiB).
+    sample_interval : float, optional
+        The interval in seconds at which the RSS is sampled for the peaks of the open spans (default is 0.01).
+    """
+    def __init__(self, path, enabled=True, max_bytes=50 * 1024 ** 2, sample_interval=0.01):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.sample_interval = sample_interval
+        self._sampler = _RssSampler(sample_interval)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        """
+        Return a span to be used as a context manager around a stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        **attributes
+            The attributes of the span (e.g. rows, columns, threads).
+
+        Returns
+        -------
+        span : Span
+            The span, or a no-op span if tracing is disabled.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def current(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def _push(self, span):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(span)
+
+    def _pop(self, span):
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def process_path(self, pid=None):
+        """
+        Return the file the spans of a process are appended to (default is the current process).
+        """
+        stem, extension = os.path.splitext(self.path)
+        return f'{stem}.{os.getpid() if pid is None else pid}{extension}'
+
+    def _write(self, record):
+        line = json.dumps(record, default=repr) + '\n'
+        path = self.process_path()
+        with self._lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > self.max_bytes:
+                os.replace(path, f'{path}.1')
+            with open(path, 'a') as f:
+                f.write(line)
+
+
+tracer = Tracer(Path.trace_path, enabled=Path.trace_enabled)
+
+
+def span(name, **attributes):
+    """
+    Return a span of the process-wide tracer (see Tracer.span).
+    """
+    return tracer.span(name, **attributes)
+
+
+def annotate(**attributes):
+    """
+    Add attributes to the innermost open span of the current thread, e.g. the rows of a traced function's input.
+    It does nothing when tracing is disabled or no span is open.
+
+    Parameters
+    ----------
+    **attributes
+        The attributes of the span (e.g. rows, columns, threads).
+    """
+    if tracer.enabled:
+        current = tracer.current()
+        if current is not None:
+            current.set(**attributes)
+
+
+def traced(name):
+    """
+    Decorate a function so that each call is recorded as a span of the process-wide tracer.
+    When tracing is disabled the function is called directly.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+
+    Returns
+    -------
+    decorator : callable
+        The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_spans(limit=200, path=None):
+    """
+    Return the most recent spans of all processes.
+
+    Parameters
+    ----------
+    limit : int, optional
+        The maximum number of spans returned (default is 200).
+    path : str, optional
+        The JSON-lines file path of the tracer (default is the one of the process-wide tracer).
+
+    Returns
+    -------
+    spans : list
+        The span records, oldest first.
+    """
+    stem, extension = os.path.splitext(tracer.path if path is None else path)
+    spans = []
+    for file in glob.glob(f'{glob.escape(stem)}.*{extension}'):
+        with open(file) as f:
+            lines = collections.deque(f, maxlen=limit)
+        spans.extend(json.loads(line) for line in lines if line.strip())
+    return sorted(spans, key=lambda span: span['start'])[-limit:]
@@ -0,0 +1,142 @@
+from typing import Any, Dict, List
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from src.data.preprocess_data import load_preprocessor
+from src.data.schema import AMES_SCHEMA, CATEGORICAL, apply_schema
+from src.models.model_cache import get_model, get_compiled_model
+from src.serving.batcher import MicroBatcher
+from paths import Path
+
+
+class PredictRequest(BaseModel):
+    records: List[Dict[str, Any]]
+
+
+class PredictResponse(BaseModel):
+    model: str
+    predictions: List[float]
+
+
+def validate_records(records, schema=AMES_SCHEMA, max_errors=20):
+    """
+    Check that every record has all the columns of the schema (except Id) with values of the declared kind.
+    Values may be null; numerical columns take numbers and categorical columns take strings or numbers.
+
+    Parameters
+    ----------
+    records : list
+        A list of records (dictionaries of column name to value).
+    schema : dict, optional
+        The declared dtypes by column (default is AMES_SCHEMA).
+    max_errors : int, optional
+        The number of errors after which the check stops (default is 20).
+
+    Returns
+    -------
+    errors : list
+        One message per invalid record field; empty if the records are valid.
+    """
+    errors = []
+    for i, record in enumerate(records):
+        for col, dtype in schema.items():
+            if col == 'Id':
+                continue
+            if col not in record:
+                errors.append(f'Record {i}: missing column {col}.')
+                continue
+            value = record[col]
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if value is None or number or (dtype == CATEGORICAL and isinstance(value, str)):
+                continue
+            kind = 'a string or a number' if dtype == CATEGORICAL else 'a number'
+            errors.append(f'Record {i}: column {col} must be {kind} or null, got {value!r}.')
+        if len(errors) >= max_errors:
+            break
+    return errors[:max_errors]
+
+
+def records_to_frame(records):
+    """
+    Build a dataframe from JSON house records with the dtypes of the declared schema.
+    Columns outside the schema that are null in every record become float NaN columns,
+    so they are filled by the preprocessing steps in the same way as missing values read from a CSV file.
+
+    Parameters
+    ----------
+    records : list
+        A list of records (dictionaries of column name to value).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The records as a dataframe.
+    """
+    df = pd.DataFrame.from_records(records)
+    for col in df.columns[df.isna().all()]:
+        df[col] = np.nan
+    return apply_schema(df)
+
+
+def create_app(model=Path.serving_model, max_batch_size=Path.serving_max_batch_size,
+               max_wait_ms=Path.serving_max_wait_ms, compiled=Path.serving_compiled):
+    """
+    Create the HTTP scoring service.
+
+    Parameters
+    ----------
+    model : str, optional
+        The name of the pre-trained model used for scoring (default is Path.serving_model).
+    max_batch_size : int, optional
+        The maximum number of rows scored in one micro-batch (default is Path.serving_max_batch_size).
+    max_wait_ms : float, optional
+        The maximum time in milliseconds a request waits for a micro-batch to fill (default is Path.serving_max_wait_ms).
+    compiled : bool, optional
+        If True, the model is compiled into NumPy arrays and scored without the library wrapper,
+        which removes most of the per-call overhead of small batches (default is Path.serving_compiled).
+        The service does not start if the compiled predictions differ from the ones of the model.
+
+    Returns
+    -------
+    app : fastapi.FastAPI
+        The application exposing /predict, /metrics and /health.
+    """
+    load_model = get_compiled_model if compiled else get_model
+
+    def predict_records(records):
+        preprocessor = load_preprocessor(Path.preprocessor_path)
+        return load_model(model).predict(preprocessor.transform(records_to_frame(records)))
+
+    batcher = MicroBatcher(predict_records, max_batch_size, max_wait_ms)
+    app = FastAPI(title='House Price Prediction')
+
+    @app.on_event('startup')
+    async def startup():
+        load_preprocessor(Path.preprocessor_path)
+        load_model(model)
+        await batcher.start()
+
+    @app.on_event('shutdown')
+    async def shutdown():
+        await batcher.stop()
+
+    @app.post('/predict', response_model=PredictResponse)
+    async def predict(request: PredictRequest):
+        if not request.records:
+            raise HTTPException(status_code=422, detail='At least one record is required.')
+        errors = validate_records(request.records)
+        if errors:
+            raise HTTPException(status_code=422, detail=errors)
+        predictions = await batcher.submit(request.records)
+        return {'model': model, 'predictions': [float(p) for p in predictions]}
+
+    @app.get('/metrics')
+    async def metrics():
+        return batcher.metrics.snapshot()
+
+    @app.get('/health')
+    async def health():
+        return {'status': 'ok', 'model': model}
+
+    return app
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import deque
+import numpy as np
+
+
+class ServingMetrics:
+    """
+    Throughput and latency counters of the scoring service.
+
+    Parameters
+    ----------
+    window : int, optional
+        The number of most recent request latencies kept for the percentiles (default is 10000).
+    """
+    def __init__(self, window=10000):
+        self.started = time.time()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.errors = 0
+        self.model_seconds = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def record_batch(self, rows, seconds):
+        self.batches += 1
+        self.batch_rows += rows
+        self.model_seconds += seconds
+
+    def record_request(self, rows, seconds, error=False):
+        self.requests += 1
+        self.rows += rows
+        self.errors += int(error)
+        self.latencies.append(seconds)
+
+    def snapshot(self):
+        """
+        Return the current counters.
+
+        Returns
+        -------
+        metrics : dict
+            Request, row and batch counts, the throughput since start-up and the latency percentiles in milliseconds.
+        """
+        uptime = time.time() - self.started
+        latencies = np.array(self.latencies) * 1000
+        percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [None] * 3
+        return {'uptime_seconds': uptime,
+                'requests': self.requests,
+                'rows': self.rows,
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch_rows': self.batch_rows / self.batches if self.batches else None,
+                'requests_per_second': self.requests / uptime if uptime else None,
+                'rows_per_second': self.rows / uptime if uptime else None,
+                'model_seconds': self.model_seconds,
+                'latency_ms': {'p50': percentiles[0], 'p95': percentiles[1], 'p99': percentiles[2],
+                               'max': float(latencies.max()) if len(latencies) else None}}
+
+
+class MicroBatcher:
+    """
+    Merges concurrent scoring requests into micro-batches.
+
+    Requests are queued and a single background task collects them until either max_batch_size rows are waiting
+    or max_wait_ms has passed since the first request of the batch arrived. The batch is then scored with one call
+    of predict_fn in a worker thread, and the predictions are split back to the waiting requests.
+    If scoring the merged batch raises, each of its requests is scored on its own, so that only the requests
+    that fail themselves get the error.
+
+    Parameters
+    ----------
+    predict_fn : callable
+        A function that takes a list of records and returns one prediction per record.
+    max_batch_size : int
+        The maximum number of rows collected before a batch is scored.
+    max_wait_ms : float
+        The maximum time in milliseconds a request waits for other requests to join its batch.
+    metrics : ServingMetrics, optional
+        The counters updated by the batcher (default is a new ServingMetrics).
+    """
+    def __init__(self, predict_fn, max_batch_size, max_wait_ms, metrics=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = ServingMetrics() if metrics is None else metrics
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, records):
+        """
+        Queue records for scoring and wait for their predictions.
+
+        Parameters
+        ----------
+        records : list
+            A list of records (dictionaries of column name to value).
+
+        Returns
+        -------
+        predictions : list
+            One prediction per record, in the order of the records.
+        """
+        if self._queue is None:
+            raise RuntimeError('MicroBatcher must be started before submitting requests.')
+        start = time.perf_counter()
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((records, future))
+        try:
+            predictions = await future
+        except Exception:
+            self.metrics.record_request(len(records), time.perf_counter() - start, error=True)
+            raise
+        self.metrics.record_request(len(records), time.perf_counter() - start)
+        return predictions
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def _score(self, records):
+        start = time.perf_counter()
+        predictions = await asyncio.get_event_loop().run_in_executor(None, self.predict_fn, records)
+        self.metrics.record_batch(len(records), time.perf_counter() - start)
+        return predictions
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            records = [record for request_records, _ in batch for record in request_records]
+            try:
+                predictions = await self._score(records)
+            except Exception as error:
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(error)
+                    continue
+                for request_records, future in batch:
+                    try:
+                        request_predictions = await self._score(request_records)
+                    except Exception as request_error:
+                        if not future.done():
+                            future.set_exception(request_error)
+                        continue
+                    if not future.done():
+                        future.set_result(list(request_predictions))
+                continue
+            offset = 0
+            for request_records, future in batch:
+                if not future.done():
+                    future.set_result(list(predictions[offset:offset + len(request_records)]))
+                offset += len(request_records)
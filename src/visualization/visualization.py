@@ -1,10 +1,109 @@
+import os
+import hashlib
+import marshal
+import numpy as np
 import pandas as pd
 import plotly.express as px
-import streamlit as st
+import plotly.io as pio
 import plotly.graph_objects as go
+from paths import Path
 
+# The version of the summary computed by profile_frame; bump it when the summary changes so cached summaries are rebuilt.
+PROFILE_VERSION = 2
 
-def missing_control_plot(df, streamlit=False):
+
+def profile_frame(df, target=None):
+    """
+    Computes the summary the EDA plots are drawn from, scanning every column once.
+    For each column the null count is taken; value counts are kept for columns with missing values,
+    and numerical columns are correlated with the target using pairwise complete observations.
+
+    Parameters:
+        df (DataFrame): The DataFrame to be profiled.
+        target (str, optional): The target column the numerical columns are correlated with. Default is None.
+
+    Returns:
+        summary (dict): A dictionary with the following keys:
+                        - 'n_rows': Number of rows.
+                        - 'null_counts': Series of null counts by column.
+                        - 'kinds': Series of 'num' or 'cat' by column.
+                        - 'value_counts': Dictionary of value counts, including the count of missing values,
+                                          by column with missing values.
+                        - 'correlation': Series of correlations with the target, sorted in descending order
+                                         (the first numerical column, the Id, and the target are left out).
+    """
+    null_counts, kinds, value_counts, correlation = dict(), dict(), dict(), dict()
+    if target is not None:
+        y = df[target].to_numpy(dtype=np.float64)
+        y_valid = ~np.isnan(y)
+    numeric_columns = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col].dtype)]
+    for col in df.columns:
+        series = df[col]
+        is_null = series.isna().to_numpy()
+        null_counts[col] = int(is_null.sum())
+        kinds[col] = 'num' if col in numeric_columns else 'cat'
+        if null_counts[col] > 0:
+            value_counts[col] = series.value_counts(sort=False, dropna=False)
+        if target is None or col == target or kinds[col] != 'num' or col == numeric_columns[0]:
+            continue
+        valid = ~is_null & y_valid
+        if not valid.any():
+            correlation[col] = np.nan
+            continue
+        x = series.to_numpy(dtype=np.float64)[valid]
+        x_centered = x - x.mean()
+        y_centered = y[valid] - y[valid].mean()
+        denominator = np.sqrt(np.dot(x_centered, x_centered) * np.dot(y_centered, y_centered))
+        correlation[col] = np.dot(x_centered, y_centered) / denominator if denominator > 0 else np.nan
+    return {'n_rows': len(df),
+            'null_counts': pd.Series(null_counts, dtype=np.int64),
+            'kinds': pd.Series(kinds, dtype=object),
+            'value_counts': value_counts,
+            'correlation': pd.Series(correlation, dtype=np.float64).sort_values(ascending=False)}
+
+
+def _code_hash(build):
+    code = build.__code__
+    return hashlib.md5(marshal.dumps((code.co_code, code.co_consts, code.co_names))).hexdigest()[:8]
+
+
+def cached_figure(name, build, cache_key=None):
+    """
+    Returns a Plotly figure from the figure cache, building and storing it if it is not cached.
+    The cache file is keyed on the data, the figure name and a hash of the building code,
+    so a change to a plot function does not serve figures drawn by the old code.
+
+    Parameters:
+        name (str): The name of the figure.
+        build (callable): The function building the figure.
+        cache_key (str, optional): The key of the data the figure is drawn from, e.g. a hash of the data file.
+                                   If None, the figure is built and not cached. Default is None.
+
+    Returns:
+        fig (plotly.graph_objects.Figure): The figure.
+    """
+    if cache_key is None:
+        return build()
+    path = os.path.join(Path.figure_cache_dir, f'{cache_key}_{name}_{_code_hash(build)}.json')
+    if os.path.exists(path):
+        return pio.read_json(path)
+    fig = build()
+    os.makedirs(Path.figure_cache_dir, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    pio.write_json(fig, temp_path)
+    os.replace(temp_path, path)
+    return fig
+
+
+def _show(fig, streamlit):
+    if not streamlit:
+        fig.show()
+    else:
+        import streamlit as st
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def missing_control_plot(df, streamlit=False, summary=None, cache_key=None):
     """
     Generates a bar chart to visualize the number of missing values in each column of the DataFrame.
 
@@ -13,32 +112,32 @@ def missing_control_plot(df, streamlit=False):
         streamlit (bool, optional): If True, the chart will be displayed using Streamlit's st.plotly_chart().
                                     If False, the chart will be displayed using Plotly's fig.show().
                                     Default is False.
+        summary (dict, optional): The summary of df computed by profile_frame. If None, it is computed. Default is None.
+        cache_key (str, optional): The key under which the figure is cached (see cached_figure). Default is None.
 
     Returns:
         missing_df (DataFrame): A DataFrame containing columns with missing values and their corresponding
                                 counts of null values.
     """
-    df_null = df.isna().sum()
-    missing_df = pd.DataFrame(
-        data=[df_null],
-        columns=df.columns,
-        index=["Null Size"]).T.sort_values("Null Size", ascending=False)
+    if summary is None:
+        summary = profile_frame(df)
+    missing_df = summary['null_counts'].to_frame("Null Size").sort_values("Null Size", ascending=False)
     missing_df = missing_df.loc[(missing_df["Null Size"] > 0)]
-    fig = px.bar(missing_df, x=missing_df.index, y="Null Size", hover_name='Null Size',
-                 color='Null Size', labels={
-            "index": "Columns",
-        },
-                 color_discrete_sequence=['#D81F26'], template='plotly_dark',
-                 title="Dataset Null Graph", width=1400, height=700)
-    fig.update_layout(barmode='group')
-    if not streamlit:
-        fig.show()
-    else:
-        st.plotly_chart(fig, use_container_width=True)
+
+    def build():
+        fig = px.bar(missing_df, x=missing_df.index, y="Null Size", hover_name='Null Size',
+                     color='Null Size', labels={
+                "index": "Columns",
+            },
+                     color_discrete_sequence=['#D81F26'], template='plotly_dark',
+                     title="Dataset Null Graph", width=1400, height=700)
+        fig.update_layout(barmode='group')
+        return fig
+    _show(cached_figure('missing_control', build, cache_key), streamlit)
     return missing_df
 
 
-def missing_count_plot(df, missing_df, variable_type, streamlit=False):
+def missing_count_plot(df, missing_df, variable_type, streamlit=False, summary=None, cache_key=None):
     """
     Generates bar charts to visualize the count of missing values in categorical or numerical columns of the DataFrame.
 
@@ -50,31 +149,31 @@ def missing_count_plot(df, missing_df, variable_type, streamlit=False):
         streamlit (bool, optional): If True, the charts will be displayed using Streamlit's st.plotly_chart().
                                     If False, the charts will be displayed using Plotly's bar.show().
                                     Default is False.
+        summary (dict, optional): The summary of df computed by profile_frame. If None, it is computed. Default is None.
+        cache_key (str, optional): The key under which the figures are cached (see cached_figure). Default is None.
     """
-    df_missing = df[missing_df.index]
-    if variable_type == 'num':
-        liste = df_missing.loc[:, df_missing.dtypes != "object"].columns
-        template = 'plotly_dark'
-    if variable_type == 'cat':
-        liste = df_missing.loc[:, df_missing.dtypes == "object"].columns
-        template = 'ggplot2'
+    if summary is None:
+        summary = profile_frame(df[missing_df.index])
+    template = 'plotly_dark' if variable_type == 'num' else 'ggplot2'
+    liste = [col for col in missing_df.index if summary['kinds'][col] == variable_type]
     for i in liste:
-        x = df[i].unique()
-        y = [df[i][df[i] == j].count() for j in x]
-        bar = px.bar(df, x=x, y=y, text=y, labels={
-            "x": i,
-            "y": "count",
-        },
-                     color_discrete_sequence=['#D81F26'], color=y,
-                     template=template, title="Null Variable Count",
-                     width=1000, height=500)
-        if not streamlit:
-            bar.show()
-        else:
-            st.plotly_chart(bar, use_container_width=True)
-
-
-def corr_plot(df, target, streamlit=False):
+        counts = summary['value_counts'][i]
+
+        def build():
+            # The missing values get their own bar, labelled NaN.
+            x = counts.index.to_series().astype(object).where(counts.index.notna(), 'NaN').to_numpy()
+            y = counts.to_numpy()
+            return px.bar(x=x, y=y, text=y, labels={
+                "x": i,
+                "y": "count",
+            },
+                          color_discrete_sequence=['#D81F26'], color=y,
+                          template=template, title="Null Variable Count",
+                          width=1000, height=500)
+        _show(cached_figure(f'missing_count_{variable_type}_{i}', build, cache_key), streamlit)
+
+
+def corr_plot(df, target, streamlit=False, summary=None, cache_key=None):
     """
     This function generates a bar chart to visualize the correlation between a target column and other numerical columns in the DataFrame.
 
@@ -83,25 +182,28 @@ def corr_plot(df, target, streamlit=False):
         target (str): The name of the target column for which the correlation will be measured against other numerical columns.
         streamlit (bool, optional): If True, the bar chart will be displayed using Streamlit's st.plotly_chart().
                                     If False, the bar chart will be displayed using Plotly's fig.show(). Default is False.
+        summary (dict, optional): The summary of df computed by profile_frame with the same target.
+                                  If None, it is computed. Default is None.
+        cache_key (str, optional): The key under which the figure is cached (see cached_figure). Default is None.
     Returns:
         This function does not return any value. It is used to generate and display the bar chart to visualize the correlation.
 
     """
-    corr = df.select_dtypes(exclude=['object']).iloc[:, 1:].corr()
-    corr_list = corr[target].sort_values(axis=0, ascending=False).iloc[1:]
-    corr_df = pd.DataFrame(corr_list)
-    fig = px.bar(corr_df, x=corr_df.index, y=target, hover_name=target,
-                 color=target, labels={
-            "index": "Columns",
-            target: target,
-        },
-                 color_discrete_sequence=['#D81F26'], template='plotly_dark',
-                 title="Dataset Correlation Graph", width=1400, height=700)
-    fig.update_layout(barmode='group')
-    if not streamlit:
-        fig.show()
-    else:
-        st.plotly_chart(fig, use_container_width=True)
+    if summary is None:
+        summary = profile_frame(df, target)
+    corr_df = summary['correlation'].to_frame(target)
+
+    def build():
+        fig = px.bar(corr_df, x=corr_df.index, y=target, hover_name=target,
+                     color=target, labels={
+                "index": "Columns",
+                target: target,
+            },
+                     color_discrete_sequence=['#D81F26'], template='plotly_dark',
+                     title="Dataset Correlation Graph", width=1400, height=700)
+        fig.update_layout(barmode='group')
+        return fig
+    _show(cached_figure(f'corr_{target}', build, cache_key), streamlit)
 
 
 def line_chart(df, streamlit=False):
@@ -120,7 +222,4 @@ def line_chart(df, streamlit=False):
     fig.add_trace(go.Scatter(x=df.index, y=df['real'], mode='lines', name='real', line=dict(color='blue')))
     fig.add_trace(go.Scatter(x=df.index, y=df['pred'], mode='lines', name='pred', line=dict(color='red')))
     fig.update_layout(title='Validation Predict', xaxis_title='Row', yaxis_title='Value')
-    if not streamlit:
-        fig.show()
-    else:
-        st.plotly_chart(fig, use_container_width=True)
+    _show(fig, streamlit)
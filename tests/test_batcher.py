@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from src.serving.batcher import MicroBatcher
+
+
+def _predict(calls):
+    def predict(records):
+        calls.append(len(records))
+        if any(record.get('bad') for record in records):
+            raise ValueError('bad record')
+        return [10 * record['x'] for record in records]
+    return predict
+
+
+def _run(batcher, requests):
+    async def main():
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(records) for records in requests), return_exceptions=True)
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_are_merged_and_get_their_own_rows():
+    calls = []
+    batcher = MicroBatcher(_predict(calls), max_batch_size=100, max_wait_ms=200)
+    requests = [[{'x': 10 * i + j} for j in range(i + 1)] for i in range(5)]
+
+    results = _run(batcher, requests)
+
+    assert results == [[10 * record['x'] for record in records] for records in requests]
+    assert calls == [sum(len(records) for records in requests)]
+    assert batcher.metrics.requests == 5
+    assert batcher.metrics.errors == 0
+
+
+def test_a_failing_batch_scores_each_request_on_its_own():
+    calls = []
+    batcher = MicroBatcher(_predict(calls), max_batch_size=100, max_wait_ms=200)
+    requests = [[{'x': 1}, {'x': 2}], [{'x': 3, 'bad': True}], [{'x': 4}]]
+
+    results = _run(batcher, requests)
+
+    assert results[0] == [10, 20]
+    assert isinstance(results[1], ValueError)
+    assert results[2] == [40]
+    # The merged batch fails first, then each request is scored on its own.
+    assert calls == [4, 2, 1, 1]
+    assert batcher.metrics.errors == 1
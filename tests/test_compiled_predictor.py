@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from src.models.compiled_predictor import check_compiled, compile_model, verify_compiled
+from src.models.serialization import load_model, save_model
+
+# One-hot column names as the preprocessor writes them; LightGBM stores 'MSZoning_C (all)' as 'MSZoning_C_(all)'.
+COLUMNS = ['LotArea', 'OverallQual', 'GrLivArea', 'MSZoning_C (all)', 'MSZoning_RL']
+
+
+def _dataset(n_rows=400, seed=33):
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame({'LotArea': rng.lognormal(9, 0.5, n_rows),
+                      'OverallQual': rng.randint(1, 11, n_rows).astype(np.float64),
+                      'GrLivArea': rng.normal(1500, 400, n_rows),
+                      'MSZoning_C (all)': (rng.rand(n_rows) < 0.1).astype(np.float64)})
+    X['MSZoning_RL'] = 1.0 - X['MSZoning_C (all)']
+    X.loc[rng.rand(n_rows) < 0.1, 'LotArea'] = np.nan
+    y = 20000 * X['OverallQual'] + 50 * X['GrLivArea'] + 0.5 * X['LotArea'].fillna(0) + rng.normal(0, 5000, n_rows)
+    return X[COLUMNS].astype(np.float32), y
+
+
+def _model(name):
+    if name == 'XGBRegressor':
+        return pytest.importorskip('xgboost').XGBRegressor(n_estimators=30, max_depth=4, random_state=33)
+    elif name == 'LGBMRegressor':
+        return pytest.importorskip('lightgbm').LGBMRegressor(n_estimators=30, num_leaves=15, min_child_samples=5,
+                                                             random_state=33, verbose=-1)
+    return pytest.importorskip('catboost').CatBoostRegressor(iterations=30, depth=4, random_seed=33, verbose=0)
+
+
+@pytest.mark.parametrize('name', ['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+def test_compiled_predictions_match_the_fitted_model(name):
+    X, y = _dataset()
+    model = _model(name).fit(X, y)
+    compiled = compile_model(model)
+    check_compiled(model, compiled, X)
+    verify_compiled(model, compiled)
+
+
+@pytest.mark.parametrize('name', ['XGBRegressor', 'LGBMRegressor', 'CatBoostRegressor'])
+def test_compiled_predictions_match_the_saved_model(name, tmp_path):
+    X, y = _dataset()
+    manifest = save_model(_model(name).fit(X, y), str(tmp_path / 'best_fold'))
+    model = load_model(str(tmp_path / 'best_fold.json'))
+    compiled = compile_model(model)
+    # The preprocessor output keeps the original column names, whatever the names stored by the library.
+    check_compiled(model, compiled, X)
+    verify_compiled(model, compiled)
+    assert manifest['n_features'] == len(COLUMNS)
@@ -0,0 +1,42 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from src.data.dataset_source import read_dataset_chunks
+
+
+def _csv(tmp_path, n_rows=5):
+    path = tmp_path / 'houses.csv'
+    pd.DataFrame({'Id': range(1, n_rows + 1),
+                  'MSZoning': ['RL', 'RM', 'RL', 'FV', 'RL'][:n_rows],
+                  'LotFrontage': [65.0, None, 80.0, 70.5, 60.0][:n_rows],
+                  'OverallQual': [7, 6, 7, 8, 5][:n_rows]}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_csv_chunks_apply_the_schema(tmp_path):
+    chunks = list(read_dataset_chunks(_csv(tmp_path), chunksize=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    for chunk in chunks:
+        assert chunk['Id'].dtype == np.int32
+        assert str(chunk['MSZoning'].dtype) == 'category'
+        assert chunk['LotFrontage'].dtype == np.float32
+        assert chunk['OverallQual'].dtype == np.int8
+    assert pd.concat(chunks)['Id'].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_csv_chunks_without_schema_keep_the_inferred_dtypes(tmp_path):
+    chunks = list(read_dataset_chunks(_csv(tmp_path), chunksize=2, schema=None))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    for chunk in chunks:
+        assert chunk['Id'].dtype == np.int64
+        assert chunk['MSZoning'].dtype == object
+        assert chunk['LotFrontage'].dtype == np.float64
+        assert chunk['OverallQual'].dtype == np.int64
+
+
+def test_csv_chunks_read_only_the_requested_columns(tmp_path):
+    chunks = list(read_dataset_chunks(_csv(tmp_path), chunksize=3, columns=['Id', 'LotFrontage']))
+    assert [len(chunk) for chunk in chunks] == [3, 2]
+    assert all(list(chunk.columns) == ['Id', 'LotFrontage'] for chunk in chunks)
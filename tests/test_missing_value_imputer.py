@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from src.data.preprocess_data import MissingValueImputer
+from src.data.schema import apply_schema
+
+
+def _train():
+    # Neighbourhood medians: A 70 and B 100; C has no LotFrontage at all. The overall median is 80.
+    return pd.DataFrame({'Neighborhood': ['A', 'A', 'A', 'B', 'B', 'C'],
+                         'LotFrontage': [60.0, 80.0, np.nan, 100.0, np.nan, np.nan],
+                         'MasVnrArea': [0.0, 0.0, 120.0, np.nan, 0.0, 300.0],
+                         'Electrical': ['SBrkr', 'FuseA', 'SBrkr', None, 'SBrkr', 'FuseF']})
+
+
+def _batch():
+    return pd.DataFrame({'Neighborhood': ['A', 'B', 'Unseen', 'C', 'A'],
+                         'LotFrontage': [np.nan, np.nan, np.nan, np.nan, 55.0],
+                         'MasVnrArea': [np.nan, 10.0, np.nan, 0.0, 0.0],
+                         'Electrical': [None, 'FuseA', 'SBrkr', None, 'SBrkr']})
+
+
+@pytest.mark.parametrize('schema', [False, True])
+def test_imputer_fills_with_the_training_statistics(schema):
+    train, batch = _train(), _batch()
+    if schema:
+        train, batch = apply_schema(train), apply_schema(batch)
+    imputer = MissingValueImputer().fit(train)
+    assert imputer.lot_frontage_medians == {'A': 70.0, 'B': 100.0}
+    assert imputer.lot_frontage_median == 80.0
+
+    filled = imputer.transform(batch.copy())
+
+    # Neighbourhoods without a training median (unseen, or without LotFrontage during fit) get the overall median.
+    np.testing.assert_allclose(filled['LotFrontage'].to_numpy(dtype=np.float64), [70.0, 100.0, 80.0, 80.0, 55.0])
+    np.testing.assert_allclose(filled['MasVnrArea'].to_numpy(dtype=np.float64), [0.0, 10.0, 0.0, 0.0, 0.0])
+    assert filled['Electrical'].astype(object).tolist() == ['SBrkr', 'FuseA', 'SBrkr', 'SBrkr', 'SBrkr']
+    assert filled['LotFrontage'].dtype == batch['LotFrontage'].dtype
+
+
+def test_imputer_fill_does_not_depend_on_the_other_rows_of_the_batch():
+    imputer = MissingValueImputer().fit(_train())
+    batch = _batch()
+    filled = imputer.transform(batch.copy())
+    for i in range(len(batch)):
+        row = imputer.transform(batch.iloc[[i]].copy())
+        assert row['LotFrontage'].iloc[0] == filled['LotFrontage'].iloc[i]
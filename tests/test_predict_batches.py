@@ -0,0 +1,36 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from src.models import predict_model
+from paths import Path
+
+
+class _Preprocessor:
+    def transform(self, X):
+        return X[['LotArea']].astype(np.float32)
+
+
+class _Model:
+    def predict(self, X):
+        return 2 * X['LotArea'].to_numpy()
+
+
+def test_streaming_scores_every_chunk_in_input_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(predict_model, 'get_model', lambda model: _Model())
+    monkeypatch.setattr(predict_model, 'load_preprocessor', lambda path: _Preprocessor())
+    ids = [17, 3, 11, 5, 23, 2, 8]
+    input_path = tmp_path / 'houses.csv'
+    pd.DataFrame({'Id': ids, 'LotArea': [1000.0 * i for i in range(len(ids))]}).to_csv(input_path, index=False)
+    output_path = tmp_path / 'out' / 'predictions.csv'
+
+    n_rows = predict_model.predict_batches('XGBRegressor', str(input_path), str(output_path), chunksize=3)
+
+    assert n_rows == len(ids)
+    with open(output_path) as f:
+        assert f.readline().strip() == f'Id,{Path.target}'
+    predictions = pd.read_csv(output_path)
+    assert len(predictions) == len(ids)
+    assert predictions['Id'].tolist() == ids
+    np.testing.assert_allclose(predictions[Path.target], [2000.0 * i for i in range(len(ids))])
@@ -0,0 +1,61 @@
+from src.data.stage_cache import StageGraph, file_fingerprint
+
+
+def _graph(cache_dir, file, calls, total_version=1):
+    def load():
+        calls.append('raw')
+        with open(file) as f:
+            return [int(value) for value in f.read().split()]
+
+    def total(values):
+        calls.append('total')
+        return sum(values)
+
+    graph = StageGraph(str(cache_dir))
+    graph.add('raw', load, params={'file': file_fingerprint(file, index_path=str(cache_dir / 'fingerprints.json'))})
+    graph.add('total', total, deps=['raw'], version=total_version)
+    return graph
+
+
+def test_stages_are_reused_until_an_input_or_a_version_changes(tmp_path):
+    cache_dir, file = tmp_path / 'cache', str(tmp_path / 'values.txt')
+    with open(file, 'w') as f:
+        f.write('1 2 3')
+    calls = []
+    assert _graph(cache_dir, file, calls).get('total') == 6
+    assert calls == ['raw', 'total']
+
+    # Unchanged inputs: the cached output is loaded and the upstream stage is not even read.
+    calls.clear()
+    assert _graph(cache_dir, file, calls).get('total') == 6
+    assert calls == []
+
+    # A changed upstream file changes its fingerprint and the keys of every downstream stage.
+    with open(file, 'w') as f:
+        f.write('1 2 3 4')
+    calls.clear()
+    assert _graph(cache_dir, file, calls).get('total') == 10
+    assert calls == ['raw', 'total']
+
+    # A new stage version recomputes the stage from the cached upstream output.
+    calls.clear()
+    graph = _graph(cache_dir, file, calls, total_version=2)
+    assert graph.get('total') == 10
+    assert calls == ['total']
+    assert graph.key('raw') == _graph(cache_dir, file, []).key('raw')
+    assert graph.key('total') != _graph(cache_dir, file, []).key('total')
+
+
+def test_disabled_graph_computes_every_stage(tmp_path):
+    file = str(tmp_path / 'values.txt')
+    with open(file, 'w') as f:
+        f.write('4 5')
+    calls = []
+    graph = _graph(tmp_path / 'cache', file, calls)
+    graph.enabled = False
+    assert graph.get('total') == 9
+    calls.clear()
+    graph = _graph(tmp_path / 'cache', file, calls)
+    graph.enabled = False
+    assert graph.get('total') == 9
+    assert calls == ['raw', 'total']
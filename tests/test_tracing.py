@@ -0,0 +1,27 @@
+import json
+import time
+
+import pytest
+
+from src.monitoring.tracing import Tracer, current_rss
+
+
+def test_span_records_the_peak_rss_of_memory_freed_before_exit(tmp_path):
+    if current_rss() is None:
+        pytest.skip('RSS cannot be measured on this platform')
+    tracer = Tracer(str(tmp_path / 'trace.jsonl'), sample_interval=0.005)
+    size = 100 * 2 ** 20
+    with tracer.span('outer'):
+        with tracer.span('allocate'):
+            block = bytearray(size)
+            for i in range(0, size, 4096):
+                block[i] = 1
+            time.sleep(0.1)
+            del block
+    with open(tracer.process_path()) as f:
+        records = {record['name']: record for record in map(json.loads, f)}
+    for name in ('allocate', 'outer'):
+        record = records[name]
+        assert record['rss_peak_bytes'] - record['rss_start_bytes'] > size // 2
+        assert record['rss_peak_bytes'] >= record['rss_end_bytes']
+    assert records['allocate']['parent_id'] == records['outer']['span_id']